@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -51,14 +52,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.db.instrumentation.QueryInstrumentationMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'core.db.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 INTERNAL_IPS = [
@@ -91,18 +96,52 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DB_CONNECTIONS=persistent keeps each thread's connection open for CONN_MAX_AGE seconds and
+# checks it before reuse. DB_CONNECTIONS=pool shares DB_POOL_SIZE connections (one per worker
+# thread) between the threads of each process instead; see core/db/pool.py.
+DB_CONNECTIONS = os.getenv('DB_CONNECTIONS', 'persistent')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'core.db.backends.mysql' if DB_CONNECTIONS == 'pool' else 'django.db.backends.mysql',
         'NAME': os.getenv('NAME'),
         'USER': os.getenv('USER'),
         'PASSWORD': os.getenv('PASSWORD'),
         'HOST': os.getenv('HOST', '127.0.0.1'), 
         'PORT': os.getenv('PORT', '3306'),
+        'CONN_MAX_AGE': 0 if DB_CONNECTIONS == 'pool' else int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', 4)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+            'HEALTH_CHECK_AFTER': int(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30)),
+        },
     }
 }
 
 
+# Read replicas as DB_REPLICAS="host[:port][=weight],...". Safe requests read from one of them,
+# picked by weight, until the client writes; see core/db/replicas.py.
+DATABASE_REPLICAS = {
+    'ALIASES': {},
+    'PIN_SECONDS': int(os.getenv('DB_REPLICA_PIN_SECONDS', 10)),
+    'RETRY_AFTER': int(os.getenv('DB_REPLICA_RETRY_AFTER', 30)),
+}
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(','))):
+    address, _, weight = replica.partition('=')
+    host, _, port = address.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS['ALIASES'][alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,26 +184,149 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JSON is rendered and parsed with orjson, which requirements.txt installs, and with
+# the json module where it is missing; see core/renderers.py.
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
+        'core.authentication.CustomerJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
 }
 
 
-# SIMPLE_JWT = {
-#     'AUTH_HEADER_TYPES': ('JWT', ),
-#     'ACCESS_TOKEN_LIFETIME': timedelta(days=1)
-# }
+# Request, serializer, database and cache metrics, scraped from /metrics/ by staff. Give
+# every worker of a server the same METRICS_DIR to report them all; see core/metrics.py.
+METRICS = {
+    'ENABLED': True,
+    'DIRECTORY': os.getenv('METRICS_DIR') or None,
+    'FLUSH_INTERVAL': 5,
+}
+
+# Queries taking THRESHOLD_MS or more, with their view, the line of store code that ran
+# them and an EXPLAIN of the slowest, are aggregated by fingerprint in a background thread.
+# "manage.py slow_queries" lists the top offenders; see core/db/slow_queries.py.
+SLOW_QUERIES = {
+    'ENABLED': True,
+    'THRESHOLD_MS': float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 100)),
+    'LOCATION_APPS': ['store'],
+    'EXPLAIN': True,
+}
+
+# cProfile runs around the views of requests sent by staff with an X-Profile header
+# ("X-Profile: memory" adds tracemalloc) and of a sampled share of all requests. The
+# newest MAX_PROFILES are kept in DIRECTORY and listed at /profiles/; see core/profiling.py.
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'True') == 'True',
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', 0)),
+    'DIRECTORY': os.getenv('PROFILING_DIR') or os.path.join(BASE_DIR, 'profiles'),
+    'MAX_PROFILES': 200,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.InstrumentedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+            'NAME': 'default',
+        },
+    },
+}
+
+
+# Queries per request, checked against the budget of each view and reported in the
+# Server-Timing header; see core/db/instrumentation.py. ACTION is 'warn' or 'raise';
+# only GET, HEAD and OPTIONS requests raise, as the writes of others are committed.
+QUERY_BUDGETS = {
+    'ENABLED': True,
+    'ACTION': os.getenv('QUERY_BUDGET_ACTION', 'warn'),
+    'MAX_QUERIES': 10,
+    'MAX_REPEATS': 2,
+    # Two queries over what each view needs, for session authentication.
+    'BUDGETS': {
+        'GET product-list': 4,
+        'GET product-detail': 3,
+        'GET category-list': 3,
+        'GET category-detail': 3,
+        'GET category-products-list': 4,
+        'GET product-comments-list': 3,
+        'GET customer-list': 3,
+        'GET customer-me': 4,
+        'GET cart-detail': 5,
+        'GET cart-items-list': 3,
+        # With include_archived, orders and their items are read from both tables.
+        'GET order-list': 7,
+        'GET order-detail': 4,
+        'GET campaign-list': 3,
+        'GET analytics-list': 3,
+        'GET comment-moderation-list': 3,
+        'POST cart-list': 5,
+        'POST cart-items-list': 5,
+        'PATCH cart-items-detail': 4,
+        # Checkout also moves the sales rollups and queues the confirmation email.
+        'POST order-list': 20,
+        'PATCH order-detail': 10,
+    },
+    'SERVER_TIMING': True,
+}
+
+
+# GET requests for the catalog are answered by async views, with responses cached
+# CACHE_TIMEOUT seconds; see store/catalog.py.
+ASYNC_CATALOG = {
+    'CACHE_TIMEOUT': 30,
+}
+
+
+# Token -> user snapshots are kept LOCAL_TTL seconds in each process and SHARED_TTL
+# seconds in the CACHE cache; see core/authentication.py.
+TOKEN_AUTH_CACHE = {
+    'CACHE': 'default',
+    'SHARED_TTL': 300,
+    'LOCAL_TTL': 10,
+    'LOCAL_SIZE': 10000,
+}
+
+
+# JWTs from auth/jwt/create/ carry the user id, staff flag and customer id, so requests
+# sent with them are authenticated without queries. Rotated and logged out tokens are
+# denied through the TOKEN_AUTH_CACHE cache until they expire.
+SIMPLE_JWT = {
+    'AUTH_HEADER_TYPES': ('JWT', ),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'ROTATE_REFRESH_TOKENS': True,
+    'UPDATE_LAST_LOGIN': False,
+    'TOKEN_USER_CLASS': 'core.authentication.CustomerTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.CustomerTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.CustomerTokenRefreshSerializer',
+}
 
 DJOSER = {
     'SERIALIZERS': {
         'user': 'core.serializers.UserSerializer',
         'user_create': 'core.serializers.UserCreateSerializer',
         'current_user': 'core.serializers.UserSerializer'
-    }
+    },
+    'ACTIVATION_URL': 'activate/{uid}/{token}',
+    'PASSWORD_RESET_CONFIRM_URL': 'password/reset/confirm/{uid}/{token}',
+    'EMAIL': {
+        'activation': 'store.emails.ActivationEmail',
+        'confirmation': 'store.emails.ConfirmationEmail',
+        'password_reset': 'store.emails.PasswordResetEmail',
+    },
 }
 
 
@@ -176,3 +338,35 @@ EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
+
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Customer and order mails are queued and sent by `manage.py send_queued_emails` in batches
+# of BATCH_SIZE over one EMAIL_BACKEND connection, at most RATE_LIMIT per second (None for no
+# limit). Failed sends are retried after RETRY_DELAY seconds, doubling up to MAX_ATTEMPTS.
+EMAIL_QUEUE = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 60,
+    'RATE_LIMIT': None,
+    'LEASE': 300,
+}
+
+# Campaigns read their segment PAGE_SIZE customers at a time and send it in batches of
+# BATCH_SIZE from WORKERS threads, each over its own EMAIL_BACKEND connection.
+EMAIL_CAMPAIGNS = {
+    'PAGE_SIZE': 2000,
+    'BATCH_SIZE': 100,
+    'WORKERS': 4,
+}
+
+# Orders older than this are moved to the archive tables by `manage.py archive_orders`.
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 365))
+
+# Waiting comments scored below APPROVE_BELOW are approved and above REJECT_ABOVE rejected
+# by `manage.py score_comments`; see store/spam.py for the scorers.
+COMMENT_SPAM = {
+    'APPROVE_BELOW': 0.2,
+    'REJECT_ABOVE': 0.8,
+    'BATCH_SIZE': 500,
+}
@@ -8,6 +8,8 @@ from drf_yasg import openapi
 
 from debug_toolbar.toolbar import debug_toolbar_urls
 
+from core.views import MetricsView, ProfileDetailView, ProfileListView
+
 
 
 schema_view = get_schema_view(
@@ -29,8 +31,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("__debug__/", include("debug_toolbar.urls")),
     path('store/', include('store.urls')),
-    path('auth/', include('djoser.urls')),
+    # djoser's user endpoints are served by core.views.UserViewSet, see core/urls.py.
     path('auth/', include('djoser.urls.authtoken')), 
+    path('auth/', include('djoser.urls.jwt')),
+    path('auth/', include('core.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile-detail'),
     # Swagger UI (HTML view)
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     # ReDoc (Alternative documentation)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from core.models import CustomUser
+from core.models import CustomUser, SlowQuery
 
 
 @admin.register(CustomUser)
@@ -15,3 +15,14 @@ class CustomUserAdmin(UserAdmin):
             },
         ),
     )
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['fingerprint', 'alias', 'count', 'total_ms', 'max_ms', 'last_seen']
+    ordering = ['-total_ms']
+    search_fields = ['fingerprint']
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
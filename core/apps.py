@@ -5,4 +5,10 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
-from .import signals
+
+    def ready(self) -> None:
+        import core.signals
+        import core.db.slow_queries
+        from core import metrics
+        if metrics.get_config()['ENABLED']:
+            metrics.instrument_serializers()
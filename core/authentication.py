@@ -0,0 +1,203 @@
+"""
+Token and JWT authentication that avoid per-request user lookups.
+
+``TokenAuthentication`` joins ``Token`` and the user on every request.
+``CachedTokenAuthentication`` keeps a snapshot of the user of each token in a
+small in-process LRU and in the shared cache, so most requests authenticate
+without a query. Snapshots hold the user's id, username and flags, under a
+hash of the token key; other user fields are read from the database when a
+view first uses them.
+
+Deleting a token (djoser logout) and saving a user whose password, active or
+staff flags changed drop the snapshot from the shared cache and from the LRU
+of the process that made the change. Other processes may keep using their
+copy for up to ``LOCAL_TTL`` seconds, so keep it short.
+
+``CustomerJWTAuthentication`` trusts the claims of signed access tokens and
+never touches the database. Its ``request.user`` is a ``CustomerTokenUser``
+with only ``id``, ``is_staff`` and ``customer_id``; views that read or save
+the user itself, such as djoser's ``users/`` endpoints, use
+``UserJWTAuthentication`` instead, which loads it. Logged out and rotated
+tokens are kept in a denylist in the shared cache until they expire.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'SHARED_TTL': 300,
+    'LOCAL_TTL': 10,
+    'LOCAL_SIZE': 10000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+class LocalTTLCache:
+    """A thread-safe LRU whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local_cache = None
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        config = get_config()
+        _local_cache = LocalTTLCache(config['LOCAL_SIZE'], config['LOCAL_TTL'])
+    return _local_cache
+
+
+def cache_key(token_key):
+    # Token keys are credentials, so only their hash goes to the shared cache. v2
+    # snapshots hold no password or key; v1 ones are never read and expire.
+    return 'auth:token:v2:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+# Enough for permissions and ownership checks. Other user fields are loaded when
+# first read; neither the password hash nor the token key is ever cached.
+SNAPSHOT_USER_FIELDS = ['id', 'username', 'is_active', 'is_staff', 'is_superuser']
+
+
+def snapshot(token):
+    user = token.user
+    return {
+        'token': {'user_id': token.user_id, 'created': token.created},
+        # In field order, as from_db() expects.
+        'user': {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields if field.attname in SNAPSHOT_USER_FIELDS
+        },
+    }
+
+
+def restore(data, key):
+    """Build fresh ``(user, token)`` instances from a snapshot and the token key of the request."""
+    User = get_user_model()
+    user = User.from_db('default', list(data['user']), list(data['user'].values()))
+    token = Token.from_db('default', ['key', *data['token']], [key, *data['token'].values()])
+    token.user = user
+    return user, token
+
+
+def invalidate_tokens(*token_keys):
+    """Drop the cached snapshots of these tokens."""
+    local_cache = get_local_cache()
+    for token_key in token_keys:
+        local_cache.delete(cache_key(token_key))
+    caches[get_config()['CACHE']].delete_many([cache_key(token_key) for token_key in token_keys])
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        key_hash = cache_key(key)
+        local_cache = get_local_cache()
+        data = local_cache.get(key_hash)
+        if data is None:
+            shared_cache = caches[get_config()['CACHE']]
+            data = shared_cache.get(key_hash)
+            if data is None:
+                user, token = super().authenticate_credentials(key)
+                data = snapshot(token)
+                shared_cache.set(key_hash, data, get_config()['SHARED_TTL'])
+            local_cache.set(key_hash, data)
+
+        user, token = restore(data, key)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, token)
+
+
+def denylist_key(jti):
+    return f'auth:jwt:denied:{jti}'
+
+
+def deny_token(token):
+    """Reject ``token`` from now until it expires."""
+    timeout = token['exp'] - int(time.time())
+    if timeout > 0:
+        caches[get_config()['CACHE']].set(denylist_key(token['jti']), True, timeout)
+
+
+def is_token_denied(token):
+    return caches[get_config()['CACHE']].get(denylist_key(token['jti'])) is not None
+
+
+class CustomerTokenUser(TokenUser):
+
+    @cached_property
+    def customer_id(self):
+        return self.token.get('customer_id')
+
+
+class DeniedTokenMixin:
+    """Rejects tokens that were logged out or rotated."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_token_denied(token):
+            raise InvalidToken(_('Token is no longer valid.'))
+        return token
+
+
+class CustomerJWTAuthentication(DeniedTokenMixin, JWTStatelessUserAuthentication):
+    pass
+
+
+class UserJWTAuthentication(DeniedTokenMixin, JWTAuthentication):
+    """JWT authentication with the user loaded from the database, for views that read or save it."""
@@ -0,0 +1,64 @@
+"""
+A cache backend that counts hits and misses.
+
+``InstrumentedCache`` wraps the backend named in ``OPTIONS['BACKEND']`` and
+records every read in the ``cache_requests_total`` metric, labelled with
+``OPTIONS['NAME']`` (the backend class name by default). Everything else is
+passed through, e.g.::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.InstrumentedCache',
+            'LOCATION': '127.0.0.1:11211',
+            'OPTIONS': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'NAME': 'default'},
+        },
+    }
+"""
+from django.utils.module_loading import import_string
+
+from core import metrics
+
+
+_MISSING = object()
+
+
+class InstrumentedCache:
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get('OPTIONS', {}))
+        backend = import_string(options.pop('BACKEND'))
+        self.name = options.pop('NAME', backend.__name__)
+        params['OPTIONS'] = options
+        self.backend = backend(location, params)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _record(self, hits, misses):
+        if hits:
+            metrics.inc('cache_requests_total', hits, cache=self.name, result='hit')
+        if misses:
+            metrics.inc('cache_requests_total', misses, cache=self.name, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = self.backend.get(key, _MISSING, version=version)
+        self._record(value is not _MISSING, value is _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.backend.get_many(keys, version=version)
+        self._record(len(values), len(keys) - len(values))
+        return values
+
+    async def aget(self, key, default=None, version=None):
+        value = await self.backend.aget(key, _MISSING, version=version)
+        self._record(value is not _MISSING, value is _MISSING)
+        return default if value is _MISSING else value
+
+    async def aget_many(self, keys, version=None):
+        keys = list(keys)
+        values = await self.backend.aget_many(keys, version=version)
+        self._record(len(values), len(keys) - len(values))
+        return values
@@ -0,0 +1,14 @@
+"""MySQL (mysqlclient) with pooled connections."""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, MySQLDatabaseWrapper):
+
+    def is_raw_connection_usable(self, connection):
+        try:
+            connection.ping()
+        except Exception:
+            return False
+        return True
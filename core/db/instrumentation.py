@@ -0,0 +1,238 @@
+"""
+Per-request query accounting and budgets.
+
+``QueryInstrumentationMiddleware`` records how many queries a request ran,
+how long they took and how often each query *fingerprint* (its SQL with
+literals and ``IN`` lists collapsed) was repeated. Every connection gets a
+``QueryRecorder`` when it is opened, which adds its queries to the
+``QueryStats`` of the ``record_queries()`` blocks of the current context.
+The context follows the request into the threads that ``sync_to_async``
+runs the async ORM on, so async views are counted too. A fingerprint that repeats is the signature of an
+N+1: one query per row of a list instead of one for the list.
+
+The totals are sent in a ``Server-Timing`` header and checked against the
+budget of the resolved view, looked up in ``QUERY_BUDGETS['BUDGETS']`` by
+``"<METHOD> <view name>"``, then by view name, and falling back to
+``MAX_QUERIES``. A budget is a number of queries, or a dict that can also
+override ``MAX_REPEATS``. Requests over budget are logged, or with ``ACTION``
+set to ``'raise'`` fail with ``QueryBudgetExceeded``. Only safe methods
+raise: by the time a POST, PUT, PATCH or DELETE is over budget its writes
+are committed, so failing it would only hide a change that was made, and it
+is logged instead.
+
+``QueryBudgetTestMixin`` asserts the same budgets from test cases.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+# The request being answered, for code that records queries outside the middleware.
+current_request = ContextVar('current_request', default=None)
+
+# The QueryStats of the record_queries() blocks the current context is in, innermost last.
+current_stats = ContextVar('current_stats', default=())
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ACTION': 'warn',
+    'MAX_QUERIES': 30,
+    'MAX_REPEATS': 2,
+    'BUDGETS': {},
+    'SERVER_TIMING': True,
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+_whitespace = re.compile(r'\s+')
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_list = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_BUDGETS', {})}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Return ``sql`` with its literals and ``IN`` lists replaced by placeholders."""
+    sql = _whitespace.sub(' ', sql).strip()
+    sql = _string_literal.sub('?', sql)
+    sql = _number_literal.sub('?', sql)
+    return _in_list.sub('IN (...)', sql)
+
+
+class QueryStats:
+    """The queries of one request: how many, how long and how often each fingerprint ran."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(sql, time.perf_counter() - started)
+
+    def add(self, sql, duration):
+        self.duration += duration
+        if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, max_repeats):
+        """Return the fingerprints that ran more than ``max_repeats`` times, with their counts."""
+        return {sql: count for sql, count in self.fingerprints.most_common() if count > max_repeats}
+
+
+class QueryRecorder:
+    """Adds the queries of a connection to the ``QueryStats`` in ``current_stats``."""
+
+    def __call__(self, execute, sql, params, many, context):
+        recording = current_stats.get()
+        if not recording:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            for stats in recording:
+                stats.add(sql, duration)
+
+
+def install(connection):
+    if not any(isinstance(wrapper, QueryRecorder) for wrapper in connection.execute_wrappers):
+        # First, so that an execute_wrapper() block the connection is opened in still pops its own wrapper.
+        connection.execute_wrappers.insert(0, QueryRecorder())
+
+
+@receiver(connection_created)
+def install_recorder(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def record_queries():
+    """Record the queries run on every connection inside the block in a ``QueryStats``."""
+    stats = QueryStats()
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+    token = current_stats.set(current_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else None
+
+
+def get_budget(method, name, config):
+    """Return the query and repeat limits of a view."""
+    budgets = config['BUDGETS']
+    budget = budgets.get(f'{method} {name}', budgets.get(name, config['MAX_QUERIES']))
+    if not isinstance(budget, dict):
+        budget = {'MAX_QUERIES': budget}
+    return {'MAX_QUERIES': config['MAX_QUERIES'], 'MAX_REPEATS': config['MAX_REPEATS'], **budget}
+
+
+def budget_problems(method, name, stats, config=None):
+    """Return a description of each way ``stats`` goes over the view's budget."""
+    budget = get_budget(method, name, config or get_config())
+    problems = []
+    if stats.count > budget['MAX_QUERIES']:
+        problems.append(f'{stats.count} queries, budget is {budget["MAX_QUERIES"]}')
+    for sql, count in stats.repeated(budget['MAX_REPEATS']).items():
+        problems.append(f'ran {count} times: {sql}')
+    return problems
+
+
+def server_timing(stats):
+    return f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        token = current_request.set(request)
+        try:
+            with record_queries() as stats:
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.process(request, response, stats, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        token = current_request.set(request)
+        try:
+            # sync_to_async copies the context, and with it current_stats, into the ORM's threads.
+            with record_queries() as stats:
+                response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.process(request, response, stats, config)
+
+    def process(self, request, response, stats, config):
+        response.query_stats = stats
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(stats)
+
+        name = view_name(request)
+        if name is None:
+            return response
+        problems = budget_problems(request.method, name, stats, config)
+        if problems:
+            message = f'{request.method} {request.path} ({name}) is over its query budget: ' + '; '.join(problems)
+            if config['ACTION'] == 'raise' and request.method in SAFE_METHODS:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class QueryBudgetTestMixin:
+    """Assertions on the ``query_stats`` the middleware attaches to test client responses."""
+
+    def assertWithinQueryBudget(self, response):
+        request = getattr(response, 'wsgi_request', None) or response.asgi_request
+        problems = budget_problems(request.method, view_name(request), response.query_stats)
+        if problems:
+            self.fail(f'{request.method} {request.path} is over its query budget:\n' + '\n'.join(problems))
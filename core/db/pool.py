@@ -0,0 +1,198 @@
+"""
+A per-process pool of raw database connections.
+
+Django opens a connection per thread and, with ``CONN_MAX_AGE = 0``, closes
+it at the end of every request. The pooled backends in ``core.db.backends``
+take their connections from a ``ConnectionPool`` instead and give them back
+on close, so a worker with N threads keeps at most ``SIZE`` connections open
+and requests skip the connect, TLS and auth handshakes.
+
+Idle connections are checked before reuse when they have been idle for
+``HEALTH_CHECK_AFTER`` seconds and replaced after ``MAX_LIFETIME`` seconds.
+A checkout waits up to ``TIMEOUT`` seconds for a connection when all are in
+use. ``pool_stats()`` reports checkouts, waits and wait time per pool.
+"""
+from collections import deque
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+
+DEFAULTS = {
+    'SIZE': 4,
+    'TIMEOUT': 10,
+    'MAX_LIFETIME': 3600,
+    'HEALTH_CHECK_AFTER': 30,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self, size, timeout, max_lifetime, health_check_after):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._idle = deque()
+        self._opened_at = {}
+        self._open = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'failed_health_checks': 0,
+        }
+
+    def _take(self):
+        """Return an idle ``(connection, returned_at)``, or None with a slot reserved for a new one."""
+        with self._condition:
+            waited_since = None
+            while not self._idle and self._open >= self.size:
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._stats['waits'] += 1
+                remaining = self.timeout - (time.monotonic() - waited_since)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    self._stats['wait_seconds'] += time.monotonic() - waited_since
+                    raise PoolTimeout(f'No database connection became free within {self.timeout} seconds.')
+                self._condition.wait(remaining)
+            if waited_since is not None:
+                self._stats['wait_seconds'] += time.monotonic() - waited_since
+            self._stats['checkouts'] += 1
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+            return None
+
+    def checkout(self, connect, is_usable, close):
+        """
+        Return a raw connection, reusing an idle one when it is still usable
+        or opening one with ``connect``.
+        """
+        while True:
+            entry = self._take()
+            if entry is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._forget(None)
+                    raise
+                with self._condition:
+                    self._opened_at[id(connection)] = time.monotonic()
+                    self._stats['created'] += 1
+                return connection
+
+            connection, returned_at = entry
+            now = time.monotonic()
+            if now - self._opened_at.get(id(connection), now) > self.max_lifetime:
+                self.discard(connection, close)
+                continue
+            if now - returned_at > self.health_check_after and not is_usable(connection):
+                with self._condition:
+                    self._stats['failed_health_checks'] += 1
+                self.discard(connection, close)
+                continue
+            return connection
+
+    def checkin(self, connection):
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, connection, close):
+        try:
+            close(connection)
+        except Exception:
+            pass
+        self._forget(connection)
+
+    def _forget(self, connection):
+        with self._condition:
+            if connection is not None:
+                self._opened_at.pop(id(connection), None)
+                self._stats['discarded'] += 1
+            self._open -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                **self._stats,
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    key = (alias, settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'])
+    with _pools_lock:
+        if key not in _pools:
+            options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+            _pools[key] = ConnectionPool(
+                size=options['SIZE'],
+                timeout=options['TIMEOUT'],
+                max_lifetime=options['MAX_LIFETIME'],
+                health_check_after=options['HEALTH_CHECK_AFTER'],
+            )
+        return _pools[key]
+
+
+def pool_stats():
+    """Return the stats of every pool, by database alias."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key[0]: pool.stats() for key, pool in pools}
+
+
+class PooledDatabaseWrapperMixin:
+    """Takes raw connections from the alias's ``ConnectionPool`` and returns them on close."""
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        return self.pool.checkout(
+            connect=lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+            is_usable=self.is_raw_connection_usable,
+            close=lambda connection: connection.close(),
+        )
+
+    def is_raw_connection_usable(self, connection):
+        try:
+            connection.cursor().execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        if self.in_atomic_block:
+            # Closed mid-transaction: the connection's state is unknown.
+            self.pool.discard(connection, lambda connection: connection.close())
+            return
+        try:
+            if not self.autocommit:
+                connection.rollback()
+        except Exception:
+            self.pool.discard(connection, lambda connection: connection.close())
+        else:
+            self.pool.checkin(connection)
@@ -0,0 +1,191 @@
+"""
+Read replicas for safe requests.
+
+``ReplicaMiddleware`` picks one replica alias for each GET, HEAD or OPTIONS
+request, at random by the weights in ``DATABASE_REPLICAS['ALIASES']``, and
+``ReplicaRouter`` sends the request's reads there and its writes to
+``default``. Code running outside a request is routed as without the router.
+The middleware runs natively under ASGI, so async views are not moved to a
+thread by it.
+
+A replica whose connection fails is skipped for ``RETRY_AFTER`` seconds and
+the request falls back to another replica or to ``default``.
+
+Once a request writes, the rest of it reads from ``default``, and so do the
+client's requests for the next ``PIN_SECONDS``, so clients read their own
+writes while the replicas catch up. Clients are recognised by a cookie and
+by their ``Authorization`` header, for API clients that drop cookies.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+import hashlib
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_primary_pin'
+
+DEFAULTS = {
+    'ALIASES': {},
+    'PIN_SECONDS': 10,
+    'RETRY_AFTER': 30,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_REPLICAS', {})}
+
+
+@dataclass
+class RequestState:
+    replica: str = None
+    wrote: bool = False
+
+
+_request_state = ContextVar('replica_request_state', default=None)
+
+_down_until = {}
+_down_lock = threading.Lock()
+
+
+def mark_down(alias, config):
+    with _down_lock:
+        _down_until[alias] = time.monotonic() + config['RETRY_AFTER']
+
+
+def is_down(alias):
+    with _down_lock:
+        return _down_until.get(alias, 0) > time.monotonic()
+
+
+def choose_replica(config=None):
+    """Return a weighted random replica alias that accepts connections, or None."""
+    config = config or get_config()
+    candidates = {alias: weight for alias, weight in config['ALIASES'].items() if weight > 0 and not is_down(alias)}
+    while candidates:
+        alias = random.choices(list(candidates), weights=list(candidates.values()))[0]
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_down(alias, config)
+            del candidates[alias]
+        else:
+            return alias
+    return None
+
+
+def _pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return 'db:pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    key = _pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+async def ais_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    key = _pin_key(request)
+    return key is not None and await cache.aget(key) is not None
+
+
+def _set_pin_cookie(response, config):
+    response.set_cookie(PIN_COOKIE, '1', max_age=config['PIN_SECONDS'], httponly=True, samesite='Lax')
+
+
+def pin(request, response, config):
+    _set_pin_cookie(response, config)
+    key = _pin_key(request)
+    if key is not None:
+        cache.set(key, True, config['PIN_SECONDS'])
+
+
+async def apin(request, response, config):
+    _set_pin_cookie(response, config)
+    key = _pin_key(request)
+    if key is not None:
+        await cache.aset(key, True, config['PIN_SECONDS'])
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = get_config()
+        state = RequestState()
+        if config['ALIASES'] and request.method in SAFE_METHODS and not is_pinned(request):
+            state.replica = choose_replica(config)
+
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state.wrote:
+            pin(request, response, config)
+        return response
+
+    async def __acall__(self, request):
+        config = get_config()
+        state = RequestState()
+        if config['ALIASES'] and request.method in SAFE_METHODS and not await ais_pinned(request):
+            state.replica = await sync_to_async(choose_replica)(config)
+
+        # Queries of the async ORM run in a worker thread with a copy of this context.
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state.wrote:
+            await apin(request, response, config)
+        return response
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.replica is None:
+            return None
+        if state.wrote:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is None:
+            return None
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in get_config()['ALIASES']
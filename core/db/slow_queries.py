@@ -0,0 +1,232 @@
+"""
+A log of slow queries, aggregated by fingerprint.
+
+``SlowQueryRecorder`` is installed as the outermost execute wrapper of every
+database connection and times every query. Queries that take at least
+``THRESHOLD_MS`` are queued with the view of the request that ran them (known
+while ``QueryInstrumentationMiddleware`` is enabled) and the first frame of
+``LOCATION_APPS`` code that led to them, e.g. a line of ``store/views.py``,
+``store/serializers.py`` or ``store/admin.py``. Everything else about a query
+happens off the request: a background thread drains the queue every
+``FLUSH_INTERVAL`` seconds, adds the queries to the ``SlowQuery`` row of
+their fingerprint (see ``core.db.instrumentation.fingerprint``) and stores
+the ``EXPLAIN`` plan of the slowest ``SELECT`` of each fingerprint.
+
+With ``ASYNC`` off no thread is started and the queue is only drained by
+``process_pending()``, as the tests do. ``manage.py slow_queries`` lists the
+top offenders.
+"""
+from collections import Counter
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from core.db.instrumentation import TRANSACTION_STATEMENTS, current_request, fingerprint, view_name
+from core.models import SlowQuery
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'LOCATION_APPS': ['store'],
+    'EXPLAIN': True,
+    'ASYNC': True,
+    'FLUSH_INTERVAL': 5,
+    'QUEUE_SIZE': 10000,
+}
+
+_config = None
+_pending = None
+_local = threading.local()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_config():
+    # Read on every query, so kept until the setting changes.
+    global _config
+    if _config is None:
+        _config = {**DEFAULTS, **getattr(settings, 'SLOW_QUERIES', {})}
+    return _config
+
+
+@receiver(setting_changed)
+def forget_config(setting, **kwargs):
+    global _config
+    if setting == 'SLOW_QUERIES':
+        _config = None
+
+
+@dataclass
+class SlowQuerySample:
+    alias: str
+    sql: str
+    params: object
+    many: bool
+    duration_ms: float
+    view: str
+    location: str
+
+
+def pending():
+    global _pending
+    if _pending is None:
+        _pending = queue.Queue(get_config()['QUEUE_SIZE'])
+    return _pending
+
+
+def _location_paths(config):
+    return tuple(apps.get_app_config(label).path + os.sep for label in config['LOCATION_APPS'])
+
+
+def code_location(paths):
+    """Return where the first frame of the given packages on the stack is, as ``file:line in function``."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(paths) and filename != __file__:
+            relative = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{relative}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+class SlowQueryRecorder:
+    """Queues the queries of a connection that take at least ``THRESHOLD_MS``."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            config = get_config()
+            if duration_ms >= config['THRESHOLD_MS'] and not getattr(_local, 'paused', False):
+                self.record(sql, params, many, duration_ms, config)
+
+    def record(self, sql, params, many, duration_ms, config):
+        if sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            return
+        request = current_request.get()
+        sample = SlowQuerySample(
+            alias=self.alias,
+            sql=sql,
+            params=params,
+            many=many,
+            duration_ms=duration_ms,
+            view=(view_name(request) or '') if request is not None else '',
+            location=code_location(_location_paths(config)),
+        )
+        try:
+            pending().put_nowait(sample)
+        except queue.Full:
+            logger.warning('The slow query queue is full; dropped a query of %.1f ms.', duration_ms)
+            return
+        if config['ASYNC']:
+            start_worker(config)
+
+
+@receiver(connection_created)
+def install_recorder(sender, connection, **kwargs):
+    if not get_config()['ENABLED']:
+        return
+    if not any(isinstance(wrapper, SlowQueryRecorder) for wrapper in connection.execute_wrappers):
+        # First, so that it is outermost and execute_wrapper() blocks still pop their own wrapper.
+        connection.execute_wrappers.insert(0, SlowQueryRecorder(connection.alias))
+
+
+def start_worker(config):
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        # After a fork the worker of the parent process is gone.
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_work, args=(config['FLUSH_INTERVAL'],), name='slow-queries', daemon=True,
+            )
+            _worker.start()
+
+
+def _work(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            process_pending()
+        except Exception:
+            logger.exception('Could not save slow queries.')
+        finally:
+            for connection in connections.all(initialized_only=True):
+                connection.close()
+
+
+def explain(sample):
+    """Return the plan of a sampled query, or ``''`` if it is not a single ``SELECT``."""
+    if sample.many or not sample.sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    connection = connections[sample.alias]
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sample.sql}', sample.params)
+        return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+
+
+def process_pending():
+    """Add the queued slow queries to their fingerprints and return how many there were."""
+    samples = []
+    while True:
+        try:
+            samples.append(pending().get_nowait())
+        except queue.Empty:
+            break
+
+    groups = {}
+    for sample in samples:
+        groups.setdefault((sample.alias, fingerprint(sample.sql)), []).append(sample)
+
+    config = get_config()
+    _local.paused = True
+    try:
+        for (alias, sql_fingerprint), group in groups.items():
+            slowest = max(group, key=lambda sample: sample.duration_ms)
+            fingerprint_hash = hashlib.sha1(f'{alias}\n{sql_fingerprint}'.encode()).hexdigest()
+            with transaction.atomic():
+                row, _ = SlowQuery.objects.select_for_update().get_or_create(
+                    fingerprint_hash=fingerprint_hash,
+                    defaults={'fingerprint': sql_fingerprint, 'alias': alias},
+                )
+                row.count += len(group)
+                row.total_ms += sum(sample.duration_ms for sample in group)
+                row.views = dict(Counter(row.views) + Counter(sample.view or '-' for sample in group))
+                row.locations = dict(Counter(row.locations) + Counter(sample.location or '-' for sample in group))
+                if slowest.duration_ms > row.max_ms:
+                    row.max_ms = slowest.duration_ms
+                    row.slowest_sql = slowest.sql
+                    row.slowest_params = repr(slowest.params)
+                    if config['EXPLAIN']:
+                        try:
+                            # In a savepoint, so a failed EXPLAIN does not abort the transaction.
+                            with transaction.atomic(using=alias):
+                                row.explain = explain(slowest)
+                        except Exception as error:
+                            row.explain = f'EXPLAIN failed: {error}'
+                row.save()
+    finally:
+        _local.paused = False
+    return len(samples)
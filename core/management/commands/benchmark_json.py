@@ -0,0 +1,90 @@
+import io
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer, orjson
+from store.models import Category, Customer, Order, OrderItem, Product
+from store.serializers import OrderForAdminSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSONRenderer and JSONParser with the fast ones on a list of synthetic orders, "
+        'serialized as staff see them. Everything is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--rounds', type=int, default=20, help='Times to render and parse the list.')
+
+    def order_list(self, orders, items_per_order):
+        category = Category.objects.create(name='Benchmark category')
+        products = Product.objects.bulk_create([
+            Product(name=f'Benchmark product {number}', description='', price=f'{number % 90 + 1}.99', category=category)
+            for number in range(100)
+        ])
+        user = get_user_model().objects.create_user(
+            username='benchmark-json', email='benchmark-json@example.com', first_name='Zoë', last_name='Berg',
+        )
+        customer, _ = Customer.objects.get_or_create(user=user)
+        created = Order.objects.bulk_create([
+            Order(customer=customer, status=Order.ORDER_STATUS_PAID) for _ in range(orders)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[(number + item) % len(products)],
+                      quantity=item + 1, price=products[(number + item) % len(products)].price)
+            for number, order in enumerate(created)
+            for item in range(items_per_order)
+        ])
+        queryset = Order.objects \
+            .filter(customer=customer) \
+            .select_related('customer__user') \
+            .prefetch_related('items__product') \
+            .order_by('pk')
+        return OrderForAdminSerializer(queryset, many=True).data
+
+    def measure(self, function, rounds):
+        function()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            result = function()
+        return (time.perf_counter() - started) / rounds * 1000, result
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                data = self.order_list(options['orders'], options['items_per_order'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+        rounds = options['rounds']
+        render_ms, rendered = self.measure(lambda: JSONRenderer().render(data), rounds)
+        fast_render_ms, fast_rendered = self.measure(lambda: FastJSONRenderer().render(data), rounds)
+        parse_ms, parsed = self.measure(lambda: JSONParser().parse(io.BytesIO(rendered)), rounds)
+        fast_parse_ms, fast_parsed = self.measure(lambda: FastJSONParser().parse(io.BytesIO(rendered)), rounds)
+
+        self.stdout.write(json.dumps({
+            'orders': options['orders'],
+            'items_per_order': options['items_per_order'],
+            'orjson': orjson is not None,
+            'bytes': len(rendered),
+            'same_bytes': fast_rendered == rendered,
+            'same_data': json.loads(fast_rendered) == json.loads(rendered) and fast_parsed == parsed,
+            'render_ms': {'json': round(render_ms, 2), 'fast': round(fast_render_ms, 2)},
+            'render_speedup': round(render_ms / fast_render_ms, 1) if fast_render_ms else None,
+            'parse_ms': {'json': round(parse_ms, 2), 'fast': round(fast_parse_ms, 2)},
+            'parse_speedup': round(parse_ms / fast_parse_ms, 1) if fast_parse_ms else None,
+        }, indent=2))
@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.db.slow_queries import process_pending
+from core.models import SlowQuery
+
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'count': '-count',
+    'mean': '-mean_ms',
+}
+
+
+def top_counts(counts, limit=5):
+    return ', '.join(f'{name} ({count})' for name, count in sorted(counts.items(), key=lambda item: -item[1])[:limit])
+
+
+class Command(BaseCommand):
+    help = 'List the slowest query fingerprints with their views, code locations and EXPLAIN plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--order-by', choices=list(ORDERINGS), default='total',
+                            help='Rank by total, slowest, number or mean time of the queries.')
+        parser.add_argument('--json', action='store_true', help='Write the offenders as JSON.')
+        parser.add_argument('--reset', action='store_true', help='Forget every slow query after listing them.')
+
+    def handle(self, *args, **options):
+        # Include what this process has queued but not saved yet.
+        process_pending()
+        offenders = (
+            SlowQuery.objects
+            .annotate(mean_ms=F('total_ms') / F('count'))
+            .order_by(ORDERINGS[options['order_by']])[:options['limit']]
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps([
+                {
+                    'fingerprint': offender.fingerprint,
+                    'alias': offender.alias,
+                    'count': offender.count,
+                    'total_ms': round(offender.total_ms, 1),
+                    'mean_ms': round(offender.mean_ms, 1),
+                    'max_ms': round(offender.max_ms, 1),
+                    'views': offender.views,
+                    'locations': offender.locations,
+                    'slowest_sql': offender.slowest_sql,
+                    'slowest_params': offender.slowest_params,
+                    'explain': offender.explain,
+                    'last_seen': offender.last_seen.isoformat(),
+                }
+                for offender in offenders
+            ], indent=2))
+        else:
+            for rank, offender in enumerate(offenders, start=1):
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'#{rank} total {offender.total_ms:.1f} ms, {offender.count} queries, '
+                    f'mean {offender.mean_ms:.1f} ms, max {offender.max_ms:.1f} ms [{offender.alias}]'
+                ))
+                self.stdout.write(f'  {offender.fingerprint}')
+                self.stdout.write(f'  views: {top_counts(offender.views)}')
+                self.stdout.write(f'  at: {top_counts(offender.locations)}')
+                if offender.explain:
+                    self.stdout.write('  plan:')
+                    for line in offender.explain.splitlines():
+                        self.stdout.write(f'    {line}')
+                self.stdout.write('')
+
+        if options['reset']:
+            SlowQuery.objects.all().delete()
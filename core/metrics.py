@@ -0,0 +1,310 @@
+"""
+Runtime metrics in the Prometheus text format.
+
+Each thread records into its own shard of counters and histograms, so
+recording takes no lock; reading merges the shards. With
+``METRICS['DIRECTORY']`` set, every process also writes its totals to a file
+there at most every ``FLUSH_INTERVAL`` seconds, and the exposition sums the
+files of all processes, e.g. the gunicorn workers sharing the directory.
+Clear the directory when the server starts; files of workers that exited are
+kept so that counters never go down.
+
+``MetricsMiddleware`` records the latency and response size of each request
+by view and action, and the query count and time from
+``core.db.instrumentation``. Serializer time is recorded by serializer class,
+and cache hits and misses by ``core.cache.InstrumentedCache``.
+"""
+from bisect import bisect_left
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 5,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', LATENCY_BUCKETS, 'Time to answer a request, by view and action.'),
+    'http_response_size_bytes': ('histogram', SIZE_BUCKETS, 'Size of response bodies, by view and action.'),
+    'serializer_duration_seconds': ('histogram', LATENCY_BUCKETS, 'Time to serialize data, by serializer.'),
+    'db_queries_total': ('counter', None, 'Database queries, by view and action.'),
+    'db_query_duration_seconds_total': ('counter', None, 'Time spent in database queries, by view and action.'),
+    'cache_requests_total': ('counter', None, 'Cache reads, by cache and whether they hit.'),
+}
+
+PROCESS_ID = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Shard:
+
+    def __init__(self):
+        self.counters = {}
+        # Per histogram: the count of each bucket, then of +Inf, then the sum.
+        self.histograms = {}
+
+    def merge(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in histograms.items():
+            totals = self.histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                totals[index] += value
+
+
+_local = threading.local()
+_shards = []
+_retired = Shard()
+_shards_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_next_flush = 0
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = Shard()
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def inc(name, value=1, **labels):
+    counters = _shard().counters
+    key = (name, tuple(labels.items()))
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][1]
+    histograms = _shard().histograms
+    key = (name, tuple(labels.items()))
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(buckets) + 2)
+    values[bisect_left(buckets, value)] += 1
+    values[-1] += value
+
+
+def snapshot():
+    """Return the counters and histograms of this process, summed over its threads."""
+    total = Shard()
+    with _shards_lock:
+        # Shards of finished threads are folded into one, so thread churn does not pile them up.
+        for thread, shard in [item for item in _shards if not item[0].is_alive()]:
+            _retired.merge(shard.counters, shard.histograms)
+            _shards.remove((thread, shard))
+        shards = [shard for _, shard in _shards] + [_retired]
+        for shard in shards:
+            total.merge(shard.counters.copy(), {key: list(values) for key, values in shard.histograms.copy().items()})
+    return total
+
+
+def reset():
+    """Forget everything recorded in this process."""
+    global _retired
+    with _shards_lock:
+        for _, shard in _shards:
+            shard.counters.clear()
+            shard.histograms.clear()
+        _retired = Shard()
+
+
+def _encode(counters, histograms):
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+    }
+
+
+def _decode(data):
+    return (
+        {(name, tuple(map(tuple, labels))): value for name, labels, value in data['counters']},
+        {(name, tuple(map(tuple, labels))): values for name, labels, values in data['histograms']},
+    )
+
+
+def flush(directory=None):
+    """Write this process's totals to its file in ``directory``."""
+    directory = directory or get_config()['DIRECTORY']
+    if not directory:
+        return
+    total = snapshot()
+    path = os.path.join(directory, f'metrics-{PROCESS_ID}.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(_encode(total.counters, total.histograms), file)
+    os.replace(path + '.tmp', path)
+
+
+def maybe_flush(config):
+    global _next_flush
+    if not config['DIRECTORY'] or time.monotonic() < _next_flush or not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _next_flush = time.monotonic() + config['FLUSH_INTERVAL']
+        flush(config['DIRECTORY'])
+    finally:
+        _flush_lock.release()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def collect(config=None):
+    """Return the totals of every process sharing the metrics directory, or of this one."""
+    config = config or get_config()
+    if not config['DIRECTORY']:
+        return snapshot()
+    flush(config['DIRECTORY'])
+    total = Shard()
+    for name in os.listdir(config['DIRECTORY']):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(config['DIRECTORY'], name)) as file:
+                total.merge(*_decode(json.load(file)))
+        except (OSError, ValueError):
+            # Being replaced by its process, or not written completely.
+            continue
+    return total
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(total=None):
+    """Render ``total`` (by default everything collected) in the Prometheus text format."""
+    total = total or collect()
+    lines = []
+    for name, (kind, buckets, help_text) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(total.counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            continue
+        for (metric, labels), values in sorted(total.histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (math.inf,), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(values[-1]))}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_labels(request):
+    """Return the view and action a request was routed to."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return {'view': '', 'action': ''}
+    func = match.func
+    view = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    actions = getattr(func, 'actions', None) or getattr(view, 'actions', None) or {}
+    return {
+        'view': view.__name__ if view is not None else match.view_name,
+        'action': actions.get(request.method.lower(), request.method.lower()),
+    }
+
+
+class MetricsMiddleware:
+    """Records latency, response size and database use of each request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, config)
+        return response
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, config)
+        return response
+
+    def record(self, request, response, duration, config):
+        labels = view_labels(request)
+        observe(
+            'http_request_duration_seconds', duration,
+            **labels, method=request.method, status=str(response.status_code),
+        )
+        if not response.streaming:
+            observe('http_response_size_bytes', len(response.content), **labels)
+        stats = getattr(response, 'query_stats', None)
+        if stats is not None:
+            inc('db_queries_total', stats.count, **labels)
+            inc('db_query_duration_seconds_total', stats.duration, **labels)
+        maybe_flush(config)
+
+
+def instrument_serializers():
+    """Time the ``data`` of every DRF serializer that computes it."""
+    original = BaseSerializer.data
+    if getattr(original.fget, 'instrumented', False):
+        return
+
+    def data(serializer):
+        if hasattr(serializer, '_data'):
+            return original.fget(serializer)
+        started = time.perf_counter()
+        try:
+            return original.fget(serializer)
+        finally:
+            measured = serializer.child if isinstance(serializer, ListSerializer) else serializer
+            observe('serializer_duration_seconds', time.perf_counter() - started, serializer=type(measured).__name__)
+
+    data.instrumented = True
+    BaseSerializer.data = property(data, doc=original.__doc__)
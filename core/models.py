@@ -3,3 +3,23 @@ from django.db import models
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
+
+
+class SlowQuery(models.Model):
+    """Queries over the slow query threshold, aggregated by fingerprint; see core/db/slow_queries.py."""
+    fingerprint_hash = models.CharField(max_length=40, unique=True)
+    fingerprint = models.TextField()
+    alias = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    slowest_sql = models.TextField()
+    slowest_params = models.TextField(blank=True)
+    views = models.JSONField(default=dict)
+    locations = models.JSONField(default=dict)
+    explain = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.fingerprint[:100]
@@ -0,0 +1,28 @@
+"""
+A JSON parser on orjson, when it is installed; see ``core.renderers``.
+
+``FastJSONParser`` accepts the same bodies as DRF's ``JSONParser`` with
+``STRICT_JSON``: NaN and infinities are refused by orjson too. Bodies in
+another charset than UTF-8, bodies orjson cannot read, so that the error is
+DRF's, and a missing orjson fall back to ``JSONParser``.
+"""
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from core.renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
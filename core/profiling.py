@@ -0,0 +1,281 @@
+"""
+Profiles of requests from real traffic.
+
+``ProfilingMiddleware`` runs the view of a request under cProfile when a
+staff user sends the ``HEADER`` header (``X-Profile``; ``X-Profile: memory``
+also traces allocations with tracemalloc), or for a random ``SAMPLE_RATE``
+share of all requests. Every other request costs one branch, and with
+``ENABLED`` off the middleware is not loaded at all. A process profiles one
+request at a time; requests arriving meanwhile are not profiled.
+
+Each profile is written to ``DIRECTORY`` as ``<id>.prof`` (pstats, for
+``python -m pstats`` or snakeviz) next to ``<id>.json`` describing the
+request, and its id is sent in the ``X-Profile-Id`` response header. Only the
+newest ``MAX_PROFILES`` are kept, so the directory is a ring the workers
+sharing it fill together. ``/profiles/`` lists the slowest recent requests of
+each view.
+
+Under ASGI a profile covers the event loop thread while the view runs: the
+coroutines of other requests may show up in it, and what runs in threads,
+sync views and the queries of async ones, does not. Profile those under WSGI.
+"""
+import cProfile
+import copy
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from core.metrics import view_labels
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'HEADER': 'X-Profile',
+    'SAMPLE_RATE': 0.0,
+    'TRACEMALLOC': False,
+    'DIRECTORY': None,
+    'MAX_PROFILES': 200,
+    'SLOWEST_PER_VIEW': 10,
+}
+
+SORT_KEYS = ['cumulative', 'tottime', 'calls']
+
+_profile_id = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+_profile_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILING', {})}
+
+
+def is_staff(request):
+    """Return whether a request was sent by a staff user, by session or by any API authentication."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    # Token and JWT users are only known to DRF; authenticate a copy so the request is left as it was.
+    authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        return Request(copy.copy(request), authenticators=authenticators).user.is_staff
+    except APIException:
+        return False
+
+
+class RequestProfile:
+    """cProfile, and optionally tracemalloc, around one request."""
+
+    def __init__(self, memory=False):
+        self.profiler = cProfile.Profile()
+        self.memory = memory
+        self.started_tracing = False
+        self.memory_stats = None
+
+    def start(self):
+        if self.memory:
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.before = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot()
+            if self.started_tracing:
+                tracemalloc.stop()
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            differences = after.filter_traces(filters).compare_to(self.before.filter_traces(filters), 'lineno')
+            self.memory_stats = {
+                'peak_kb': round(peak / 1024, 1),
+                'top': [
+                    {
+                        'where': f'{difference.traceback[0].filename}:{difference.traceback[0].lineno}',
+                        'size_kb': round(difference.size_diff / 1024, 1),
+                        'count': difference.count_diff,
+                    }
+                    for difference in differences[:10]
+                ],
+            }
+
+
+def _path(directory, profile_id, extension):
+    return os.path.join(directory, f'{profile_id}.{extension}')
+
+
+def save(profile, description, config):
+    """Write a profile and its description to the ring and return its id."""
+    directory = config['DIRECTORY']
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}'
+    profile.profiler.dump_stats(_path(directory, profile_id, 'prof'))
+    description = {'id': profile_id, **description}
+    with open(_path(directory, profile_id, 'json.tmp'), 'w') as file:
+        json.dump(description, file)
+    os.replace(_path(directory, profile_id, 'json.tmp'), _path(directory, profile_id, 'json'))
+    prune(directory, config['MAX_PROFILES'])
+    return profile_id
+
+
+def prune(directory, max_profiles):
+    """Delete all but the newest ``max_profiles`` profiles."""
+    ids = sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:-max_profiles]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(_path(directory, profile_id, extension))
+            except FileNotFoundError:
+                # Pruned by another worker.
+                pass
+
+
+def recent_profiles(config=None):
+    """Return the slowest recent profiles of each view, the views with the slowest first."""
+    config = config or get_config()
+    directory = config['DIRECTORY']
+    by_view = {}
+    for name in os.listdir(directory) if directory and os.path.isdir(directory) else []:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                description = json.load(file)
+        except (OSError, ValueError):
+            continue
+        by_view.setdefault((description['view'], description['action']), []).append(description)
+    views = [
+        {
+            'view': view,
+            'action': action,
+            'profiles': sorted(profiles, key=lambda profile: -profile['duration_ms'])[:config['SLOWEST_PER_VIEW']],
+        }
+        for (view, action), profiles in by_view.items()
+    ]
+    return sorted(views, key=lambda view: -view['profiles'][0]['duration_ms'])
+
+
+def profile_path(profile_id, config=None):
+    """Return the pstats file of a profile, or ``None`` if there is no such profile."""
+    config = config or get_config()
+    if not config['DIRECTORY'] or not _profile_id.match(profile_id):
+        return None
+    path = _path(config['DIRECTORY'], profile_id, 'prof')
+    return path if os.path.exists(path) else None
+
+
+def report(path, sort='cumulative', limit=60):
+    """Return the pstats report of a profile, its most expensive ``limit`` functions first."""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """Profiles the views of requests marked by staff or sampled. Put it last, right around the view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+        self.sample_rate = config['SAMPLE_RATE']
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self.header not in request.META and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+        profile = self.start(request, self.header in request.META and is_staff(request))
+        if profile is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profile)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if self.header not in request.META and not (self.sample_rate and random.random() < self.sample_rate):
+            return await self.get_response(request)
+        # Users are loaded from the database in a thread; the profiler is started in this one.
+        profile = self.start(request, self.header in request.META and await sync_to_async(is_staff)(request))
+        if profile is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(profile)
+        return self.finish(request, response, profile)
+
+    def start(self, request, by_staff):
+        config = get_config()
+        requested = self.header in request.META
+        if not config['DIRECTORY'] or requested and not by_staff:
+            return None
+        if not _profile_lock.acquire(blocking=False):
+            return None
+        profile = RequestProfile(
+            memory=config['TRACEMALLOC'] or (requested and request.META[self.header].lower() == 'memory'),
+        )
+        profile.reason = 'header' if requested else 'sample'
+        try:
+            profile.start()
+        except ValueError:
+            # Another profiler, e.g. a debugger or coverage, is active.
+            _profile_lock.release()
+            return None
+        return profile
+
+    def stop(self, profile):
+        try:
+            profile.stop()
+        finally:
+            _profile_lock.release()
+
+    def finish(self, request, response, profile):
+        labels = view_labels(request)
+        try:
+            profile_id = save(profile, {
+                'time': timezone.now().isoformat(),
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': labels['view'],
+                'action': labels['action'],
+                'status': response.status_code,
+                'duration_ms': round(profile.duration * 1000, 2),
+                'reason': profile.reason,
+                'memory': profile.memory_stats,
+            }, get_config())
+        except OSError:
+            logger.exception('Could not save the profile of %s %s.', request.method, request.path)
+            return response
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -1,5 +1,15 @@
 from djoser.serializers import UserCreateSerializer as DjoserUserCreateSerializer
 from djoser.serializers import UserSerializer as DjoserUserSerializer
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import deny_token, is_token_denied
+from store.models import Customer
 
 
 class UserCreateSerializer(DjoserUserCreateSerializer):
@@ -10,4 +20,54 @@ class UserCreateSerializer(DjoserUserCreateSerializer):
 class UserSerializer(DjoserUserSerializer):
     class Meta(DjoserUserSerializer.Meta):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']  
-        ref_name = "DjoserUserSerializer"   
+        ref_name = "DjoserUserSerializer"
+
+
+
+class CustomerTokenObtainPairSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token['customer_id'] = Customer.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+        return token
+
+
+
+class CustomerTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Issues tokens with the current claims of the user, and with
+    ``ROTATE_REFRESH_TOKENS`` a new refresh token while the old one goes to
+    the denylist.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_denied(refresh):
+            raise InvalidToken('Token is no longer valid.')
+
+        user = get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        token = CustomerTokenObtainPairSerializer.get_token(user)
+        data = {'access': str(token.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            deny_token(refresh)
+            data['refresh'] = str(token)
+        return data
+
+
+
+class TokenLogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError:
+            raise serializers.ValidationError('Token is invalid or expired.')
@@ -1,7 +1,34 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_tokens, invalidate_user_tokens
 from store.signals import order_created
 
+# Changes to these user fields drop the cached snapshots of the user's tokens.
+AUTH_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+
 @receiver(order_created)
 def after_order_created(sender, **kwargs):
     print(f'New order is created {kwargs["order"].id}')
-    
\ No newline at end of file
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_loaded_auth_fields(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields are not loaded here.
+    instance._loaded_auth_fields = tuple(instance.__dict__.get(field) for field in AUTH_FIELDS)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_tokens_on_auth_change(sender, instance, created, **kwargs):
+    auth_fields = tuple(getattr(instance, field) for field in AUTH_FIELDS)
+    if not created and auth_fields != instance._loaded_auth_fields:
+        invalidate_user_tokens(instance.pk)
+    instance._loaded_auth_fields = auth_fields
@@ -0,0 +1,288 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.authentication import CachedTokenAuthentication, cache_key, get_local_cache
+from store.models import Cart, CartItem, Category, Customer, Order, Product
+
+
+
+User = get_user_model()
+
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        """Create a user with a token and start from empty caches."""
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="buyerpass"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+        get_local_cache().clear()
+        cache.clear()
+        self.addCleanup(get_local_cache().clear)
+        self.addCleanup(cache.clear)
+
+
+    def test_token_is_looked_up_once(self):
+        """Test that only the first authentication with a token queries the database."""
+        with self.assertNumQueries(1):
+            self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, "buyer")
+        self.assertEqual(token.key, self.token.key)
+
+
+    def test_shared_cache_is_used_when_the_local_entry_is_missing(self):
+        """Test that another process can reuse the snapshot from the shared cache."""
+        self.authentication.authenticate_credentials(self.token.key)
+        get_local_cache().clear()
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, user.is_active, token.key), (self.user.pk, True, self.token.key))
+
+
+    def test_cache_holds_no_credentials(self):
+        """Test that neither the password hash nor the token key is cached."""
+        self.authentication.authenticate_credentials(self.token.key)
+
+        cached = repr(cache.get(cache_key(self.token.key))) + repr(get_local_cache().get(cache_key(self.token.key)))
+        self.assertNotIn("password", cached)
+        self.assertNotIn(self.user.password, cached)
+        self.assertNotIn(self.token.key, cached)
+
+
+    def test_uncached_user_fields_are_loaded_on_use(self):
+        """Test that user fields left out of the snapshot are still available."""
+        self.authentication.authenticate_credentials(self.token.key)
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "buyer@example.com")
+
+
+    def test_each_request_gets_its_own_user_instance(self):
+        """Test that cached users are not shared between requests."""
+        first, _ = self.authentication.authenticate_credentials(self.token.key)
+        first.username = "changed"
+        second, _ = self.authentication.authenticate_credentials(self.token.key)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.username, "buyer")
+
+
+    def test_deleted_token_is_rejected(self):
+        """Test that logging out drops the cached token."""
+        self.authentication.authenticate_credentials(self.token.key)
+        Token.objects.filter(user=self.user).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+
+    def test_logout_endpoint_invalidates_token(self):
+        """Test that the token cannot be used after djoser logout."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assertEqual(client.get("/auth/users/me/").status_code, 200)
+
+        client.post("/auth/token/logout/")
+
+        self.assertEqual(client.get("/auth/users/me/").status_code, 401)
+
+
+    def test_deactivated_user_is_rejected(self):
+        """Test that deactivating a user drops the cached token."""
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+
+    def test_password_change_refreshes_snapshot(self):
+        """Test that a password change is seen by the next authentication."""
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.set_password("newpass123")
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertTrue(user.check_password("newpass123"))
+
+
+    def test_unrelated_user_changes_keep_the_cache(self):
+        """Test that saving other user fields does not drop the cached token."""
+        self.authentication.authenticate_credentials(self.token.key)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "John"
+
+        with self.assertNumQueries(1):
+            user.save()
+
+
+
+class JWTAuthenticationTest(TestCase):
+
+    def setUp(self):
+        """Create a customer with an order and a filled cart."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="buyerpass"
+        )
+        self.customer = Customer.objects.get(user=self.user)
+        self.order = Order.objects.create(customer=self.customer)
+
+        category = Category.objects.create(name="Paper")
+        product = Product.objects.create(name="Notebook", description="A5", price=4, category=category)
+        self.cart = Cart.objects.create()
+        CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+    def obtain(self, username="buyer", password="buyerpass"):
+        response = self.client.post("/auth/jwt/create/", {"username": username, "password": password})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+
+    def use(self, tokens):
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {tokens['access']}")
+
+
+    def assertNoUserOrCustomerLookup(self, queries):
+        for query in queries:
+            self.assertNotIn('FROM "core_customuser" WHERE "core_customuser"."id"', query['sql'])
+            self.assertNotIn('WHERE "store_customer"."user_id"', query['sql'])
+
+
+    def test_access_token_claims(self):
+        """Test that access tokens carry the user id, staff flag and customer id."""
+        token = AccessToken(self.obtain()["access"])
+
+        self.assertEqual(token["user_id"], self.user.id)
+        self.assertEqual(token["is_staff"], False)
+        self.assertEqual(token["customer_id"], self.customer.id)
+
+
+    def test_orders_are_listed_without_user_lookups(self):
+        """Test that a JWT request lists the customer's orders without loading the user or customer."""
+        self.use(self.obtain())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("order-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order["id"] for order in response.data], [self.order.id])
+        self.assertNoUserOrCustomerLookup(queries)
+
+
+    def test_checkout_uses_customer_claim(self):
+        """Test that checkout creates the order for the customer in the token."""
+        self.use(self.obtain())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("order-list"), {"cart_id": str(self.cart.id)}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get(pk=response.data["id"]).customer_id, self.customer.id)
+        self.assertNoUserOrCustomerLookup(queries)
+
+
+    def test_me_uses_customer_claim(self):
+        """Test that the customer profile is found from the token."""
+        self.use(self.obtain())
+
+        response = self.client.get(reverse("customer-me"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], self.customer.id)
+
+
+    def test_staff_claim_grants_admin_actions(self):
+        """Test that the staff flag in the token is honoured by admin-only actions."""
+        User.objects.create_superuser(username="admin", email="admin@example.com", password="adminpass")
+        self.use(self.obtain("admin", "adminpass"))
+
+        response = self.client.post(reverse("order-bulk-status"), {"order_ids": [self.order.id], "status": "p"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], [self.order.id])
+
+
+    def test_refresh_rotates_and_denies_old_refresh_token(self):
+        """Test that a refresh token can only be used once."""
+        tokens = self.obtain()
+
+        response = self.client.post("/auth/jwt/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["refresh"], tokens["refresh"])
+        self.assertEqual(AccessToken(response.data["access"])["customer_id"], self.customer.id)
+
+        reused = self.client.post("/auth/jwt/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(reused.status_code, 401)
+
+        rotated = self.client.post("/auth/jwt/refresh/", {"refresh": response.data["refresh"]})
+        self.assertEqual(rotated.status_code, 200)
+
+
+    def test_refresh_rejects_inactive_users(self):
+        """Test that deactivated users cannot refresh their tokens."""
+        tokens = self.obtain()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        response = self.client.post("/auth/jwt/refresh/", {"refresh": tokens["refresh"]})
+
+        self.assertEqual(response.status_code, 401)
+
+
+    def test_logout_denies_access_and_refresh_tokens(self):
+        """Test that logging out rejects both tokens of the session."""
+        tokens = self.obtain()
+        self.use(tokens)
+
+        response = self.client.post(reverse("jwt-logout"), {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get(reverse("order-list")).status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.post("/auth/jwt/refresh/", {"refresh": tokens["refresh"]}).status_code, 401)
+
+
+
+    def test_djoser_user_endpoints_load_the_user(self):
+        """Test that users/me reads and updates the real user when called with a JWT."""
+        tokens = self.obtain()
+        self.use(tokens)
+
+        response = self.client.get("/auth/users/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["username"], "buyer")
+        self.assertEqual(response.data["email"], "buyer@example.com")
+
+        response = self.client.patch("/auth/users/me/", {"first_name": "Zoë"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Zoë")
+
+        self.client.post(reverse("jwt-logout"), {"refresh": tokens["refresh"]})
+        self.assertEqual(self.client.get("/auth/users/me/").status_code, 401)
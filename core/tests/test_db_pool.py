@@ -0,0 +1,132 @@
+from django.db import connections
+from django.test import SimpleTestCase
+
+import os
+import tempfile
+import threading
+import time
+
+from core.db.backends.sqlite3.base import DatabaseWrapper
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def make_pool(self, **options):
+        return ConnectionPool(**{'size': 2, 'timeout': 1, 'max_lifetime': 3600, 'health_check_after': 30, **options})
+
+
+    def checkout(self, pool, usable=True):
+        return pool.checkout(connect=object, is_usable=lambda connection: usable, close=lambda connection: None)
+
+
+    def test_connections_are_reused(self):
+        """Test that a returned connection is handed out again instead of opening a new one."""
+        pool = self.make_pool()
+
+        first = self.checkout(pool)
+        pool.checkin(first)
+        second = self.checkout(pool)
+
+        self.assertIs(first, second)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+
+    def test_checkout_waits_for_a_free_connection(self):
+        """Test that a checkout on a full pool waits until a connection is returned."""
+        pool = self.make_pool(size=1)
+        connection = self.checkout(pool)
+        threading.Timer(0.05, pool.checkin, [connection]).start()
+
+        self.assertIs(self.checkout(pool), connection)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_seconds'], 0)
+
+
+    def test_checkout_times_out(self):
+        """Test that a checkout gives up after the timeout when the pool stays full."""
+        pool = self.make_pool(size=1, timeout=0.05)
+        self.checkout(pool)
+
+        with self.assertRaises(PoolTimeout):
+            self.checkout(pool)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+
+    def test_unusable_idle_connections_are_replaced(self):
+        """Test that idle connections failing the health check are discarded."""
+        pool = self.make_pool(health_check_after=0)
+        first = self.checkout(pool)
+        pool.checkin(first)
+        time.sleep(0.01)
+
+        second = self.checkout(pool, usable=False)
+
+        self.assertIsNot(first, second)
+        stats = pool.stats()
+        self.assertEqual((stats['failed_health_checks'], stats['discarded'], stats['open']), (1, 1, 1))
+
+
+    def test_old_connections_are_recycled(self):
+        """Test that connections older than the maximum lifetime are replaced."""
+        pool = self.make_pool(max_lifetime=0)
+        first = self.checkout(pool)
+        pool.checkin(first)
+        time.sleep(0.01)
+
+        self.assertIsNot(self.checkout(pool), first)
+
+
+
+class PooledBackendTest(SimpleTestCase):
+    databases = []
+
+    def setUp(self):
+        """Set up a pooled SQLite database in a temporary file."""
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.settings_dict = {
+            **connections['default'].settings_dict,
+            'ENGINE': 'core.db.backends.sqlite3',
+            'NAME': self.path,
+            'POOL': {'SIZE': 2, 'TIMEOUT': 1},
+        }
+
+
+    def wrapper(self):
+        return DatabaseWrapper(self.settings_dict, alias='pooled')
+
+
+    def test_closed_connections_go_back_to_the_pool(self):
+        """Test that closing a Django connection keeps the raw connection for the next one."""
+        first = self.wrapper()
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TABLE IF NOT EXISTS item (id INTEGER)')
+        raw = first.connection
+        first.close()
+
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+        self.assertIs(second.connection, raw)
+        second.close()
+
+
+    def test_connections_closed_in_a_transaction_are_discarded(self):
+        """Test that a connection closed inside atomic() is not reused."""
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.in_atomic_block = True
+        wrapper._close()
+        wrapper.in_atomic_block = False
+        wrapper.connection = None
+
+        other = self.wrapper()
+        other.ensure_connection()
+        self.assertIsNot(other.connection, raw)
+        other.close()
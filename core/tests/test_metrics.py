@@ -0,0 +1,162 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+import json
+import os
+import tempfile
+import threading
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from store.models import Category, Product
+
+
+User = get_user_model()
+
+
+
+class MetricsRegistryTest(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+
+    def test_histograms_are_rendered_cumulatively(self):
+        """Test that histogram buckets, sum and count follow the Prometheus text format."""
+        for seconds in (0.001, 0.02, 0.02, 20):
+            metrics.observe('serializer_duration_seconds', seconds, serializer='ProductSerializer')
+
+        text = metrics.exposition(metrics.snapshot())
+
+        self.assertIn('# TYPE serializer_duration_seconds histogram', text)
+        self.assertIn('serializer_duration_seconds_bucket{serializer="ProductSerializer",le="0.005"} 1', text)
+        self.assertIn('serializer_duration_seconds_bucket{serializer="ProductSerializer",le="0.025"} 3', text)
+        self.assertIn('serializer_duration_seconds_bucket{serializer="ProductSerializer",le="10"} 3', text)
+        self.assertIn('serializer_duration_seconds_bucket{serializer="ProductSerializer",le="+Inf"} 4', text)
+        self.assertIn('serializer_duration_seconds_count{serializer="ProductSerializer"} 4', text)
+        self.assertIn('serializer_duration_seconds_sum{serializer="ProductSerializer"} 20.041', text)
+
+
+    def test_threads_record_separately_and_are_summed(self):
+        """Test that counts recorded in other threads, finished or not, are all collected."""
+        def record():
+            for _ in range(1000):
+                metrics.inc('cache_requests_total', cache='default', result='hit')
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record()
+
+        counters = metrics.snapshot().counters
+        self.assertEqual(counters[('cache_requests_total', (('cache', 'default'), ('result', 'hit')))], 5000)
+        # The finished threads were folded into one shard.
+        self.assertEqual(counters, metrics.snapshot().counters)
+
+
+    def test_processes_are_aggregated_through_the_directory(self):
+        """Test that the exposition sums the files every worker writes to the metrics directory."""
+        with tempfile.TemporaryDirectory() as directory:
+            other_worker = metrics.Shard()
+            other_worker.counters[('db_queries_total', (('view', 'OrderViewSet'), ('action', 'list')))] = 5
+            with open(os.path.join(directory, 'metrics-other.json'), 'w') as file:
+                json.dump(metrics._encode(other_worker.counters, other_worker.histograms), file)
+            metrics.inc('db_queries_total', 2, view='OrderViewSet', action='list')
+
+            with override_settings(METRICS={'DIRECTORY': directory}):
+                text = metrics.exposition()
+
+            self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertIn('db_queries_total{view="OrderViewSet",action="list"} 7', text)
+
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes, backslashes and newlines in label values are escaped."""
+        metrics.inc('cache_requests_total', cache='a"b\\c\nd', result='hit')
+
+        self.assertIn(r'cache_requests_total{cache="a\"b\\c\nd",result="hit"} 1', metrics.exposition(metrics.snapshot()))
+
+
+
+class RequestMetricsTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(metrics.reset)
+        cache.clear()
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="pass", is_staff=True, is_superuser=True,
+        )
+        category = Category.objects.create(name="Paper")
+        Product.objects.create(name="Notebook", description="A5", price=2, category=category)
+        metrics.reset()
+
+
+    def scrape(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+
+    def test_requests_are_recorded_by_view_and_action(self):
+        """Test that latency, size, queries and serializer time are recorded for each view and action."""
+        APIClient().get('/store/products/')
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        client.get('/store/campaigns/')
+
+        text = self.scrape()
+
+        self.assertIn(
+            'http_request_duration_seconds_count{view="ProductCatalogView",action="list",method="GET",status="200"} 1',
+            text,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{view="CampaignViewSet",action="list",method="GET",status="200"} 1',
+            text,
+        )
+        self.assertIn('http_response_size_bytes_count{view="CampaignViewSet",action="list"} 1', text)
+        self.assertIn('db_queries_total{view="ProductCatalogView",action="list"} 2', text)
+        self.assertIn('serializer_duration_seconds_count{serializer="ProductValuesSerializer"} 1', text)
+
+
+    async def test_queries_of_async_views_are_recorded_under_asgi(self):
+        """Test that the queries an async catalog view runs in the ORM's threads are recorded."""
+        response = await self.async_client.get('/store/products/')
+        self.assertEqual(response.status_code, 200)
+
+        counters = metrics.snapshot().counters
+
+        labels = (('view', 'ProductCatalogView'), ('action', 'list'))
+        self.assertEqual(counters[('db_queries_total', labels)], 2)
+        self.assertGreater(counters[('db_query_duration_seconds_total', labels)], 0)
+
+
+    def test_cache_hits_and_misses_are_counted(self):
+        """Test that reads of the default cache are counted as hits or misses."""
+        cache.get('metrics:missing')
+        cache.set('metrics:present', 1)
+        cache.get('metrics:present')
+        cache.get_many(['metrics:present', 'metrics:missing'])
+
+        counters = metrics.snapshot().counters
+
+        self.assertEqual(counters[('cache_requests_total', (('cache', 'default'), ('result', 'hit')))], 2)
+        self.assertEqual(counters[('cache_requests_total', (('cache', 'default'), ('result', 'miss')))], 2)
+
+
+    def test_metrics_are_for_staff_only(self):
+        """Test that only staff can read the metrics."""
+        user = User.objects.create_user(username="reader", email="reader@example.com", password="pass")
+        client = APIClient()
+        self.assertEqual(client.get('/metrics/').status_code, 401)
+
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/metrics/').status_code, 403)
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+import io
+from unittest import mock
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from core import parsers
+from core.parsers import FastJSONParser
+
+
+
+class FastJSONParserTest(SimpleTestCase):
+
+    def parse(self, body, **context):
+        return FastJSONParser().parse(io.BytesIO(body), 'application/json', context)
+
+
+    def test_bodies_parse_like_the_json_parser(self):
+        """Test that nested, unicode and numeric bodies give the same data."""
+        body = '{"cart_id": "6f1c", "items": [{"quantity": 2, "price": 12.5}], "name": "Zoë", "ok": true, "none": null}'.encode()
+
+        self.assertEqual(self.parse(body), JSONParser().parse(io.BytesIO(body), 'application/json', {}))
+
+
+    def test_invalid_bodies_raise_the_same_error(self):
+        """Test that broken JSON, NaN and other charsets behave as with the JSON parser."""
+        for body in [b'{"cart_id": ', b'{"value": NaN}']:
+            with self.assertRaisesMessage(ParseError, 'JSON parse error - '):
+                self.parse(body)
+
+        self.assertEqual(self.parse('{"name": "Zoë"}'.encode('latin-1'), encoding='latin-1'), {'name': 'Zoë'})
+
+
+    def test_json_parser_is_used_without_orjson(self):
+        """Test that the parser still works where orjson is not installed."""
+        with mock.patch.object(parsers, 'orjson', None):
+            self.assertEqual(self.parse(b'{"quantity": 2}'), {'quantity': 2})
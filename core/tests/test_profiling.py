@@ -0,0 +1,152 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+import json
+import os
+import shutil
+import tempfile
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+from store.models import Category
+
+
+User = get_user_model()
+
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        """Send profiles to a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.profile_settings()
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="pass", is_staff=True,
+        )
+        self.user = User.objects.create_user(username="reader", email="reader@example.com", password="pass")
+        Category.objects.create(name="Paper")
+
+
+    def profile_settings(self, **config):
+        override = override_settings(PROFILING={'DIRECTORY': self.directory, **config})
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_login(user)
+        return client
+
+
+    def descriptions(self):
+        descriptions = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.directory, name)) as file:
+                    descriptions.append(json.load(file))
+        return descriptions
+
+
+    def test_staff_can_profile_a_request(self):
+        """Test that a request with the header from staff is profiled and described."""
+        response = self.client_for(self.admin).get('/store/cutomers/', HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        [description] = self.descriptions()
+        self.assertEqual(response['X-Profile-Id'], description['id'])
+        self.assertEqual(description['view'], 'CustomerViewSet')
+        self.assertEqual(description['action'], 'list')
+        self.assertEqual(description['reason'], 'header')
+        self.assertIsNone(description['memory'])
+        self.assertTrue(os.path.exists(profiling.profile_path(description['id'])))
+
+
+    def test_staff_authenticated_by_token_can_profile(self):
+        """Test that staff sending an API token, not a session, can profile too."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.admin).key}')
+
+        response = client.get('/store/cutomers/', HTTP_X_PROFILE='1')
+
+        self.assertIn('X-Profile-Id', response)
+
+
+    def test_other_users_cannot_profile(self):
+        """Test that the header is ignored for customers and anonymous users."""
+        for client in [self.client_for(), self.client_for(self.user)]:
+            response = client.get('/store/categories/', HTTP_X_PROFILE='1')
+
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.descriptions(), [])
+
+
+    def test_memory_can_be_traced(self):
+        """Test that "X-Profile: memory" records the peak and the top allocations."""
+        self.client_for(self.admin).get('/store/cutomers/', HTTP_X_PROFILE='memory')
+
+        [description] = self.descriptions()
+        self.assertGreater(description['memory']['peak_kb'], 0)
+        self.assertTrue(description['memory']['top'])
+
+
+    def test_requests_are_sampled(self):
+        """Test that with a sample rate, requests without the header are profiled too."""
+        self.profile_settings(SAMPLE_RATE=1.0)
+
+        response = self.client_for().get('/store/categories/')
+
+        self.assertIn('X-Profile-Id', response)
+        self.assertEqual(self.descriptions()[0]['reason'], 'sample')
+
+
+    def test_only_the_newest_profiles_are_kept(self):
+        """Test that the directory is a ring of MAX_PROFILES profiles."""
+        self.profile_settings(MAX_PROFILES=3)
+        client = self.client_for(self.admin)
+        ids = [client.get('/store/categories/', HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(5)]
+
+        self.assertEqual([description['id'] for description in self.descriptions()], ids[2:])
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+
+
+    def test_nothing_is_profiled_when_disabled(self):
+        """Test that with ENABLED off the header does nothing."""
+        self.profile_settings(ENABLED=False)
+
+        response = self.client_for(self.admin).get('/store/categories/', HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+    def test_index_lists_the_slowest_requests_of_each_view(self):
+        """Test that the index page groups the profiles by view and links their reports."""
+        client = self.client_for(self.admin)
+        profile_id = client.get('/store/cutomers/', HTTP_X_PROFILE='1')['X-Profile-Id']
+        client.get('/store/categories/', HTTP_X_PROFILE='1')
+
+        response = client.get('/profiles/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'CustomerViewSet list')
+        self.assertContains(response, f'/profiles/{profile_id}/')
+
+        report = client.get(f'/profiles/{profile_id}/?sort=tottime')
+        self.assertEqual(report.status_code, 200)
+        self.assertIn(b'function calls', report.content)
+        download = client.get(f'/profiles/{profile_id}/?download=1')
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="{profile_id}.prof"')
+        download.close()
+        self.assertEqual(client.get('/profiles/..%2Fsecret/').status_code, 404)
+
+
+    def test_profiles_are_for_staff_only(self):
+        """Test that customers cannot read the profiles."""
+        self.assertEqual(self.client_for(self.user).get('/profiles/').status_code, 403)
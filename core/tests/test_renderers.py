@@ -0,0 +1,123 @@
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+import datetime
+import io
+import json
+import uuid
+from decimal import Decimal
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core import renderers
+from core.renderers import FastJSONRenderer
+from store.models import Category, Order, Product
+
+
+
+def order_page(count):
+    created = datetime.datetime(2026, 10, 19, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+    return ReturnList([
+        ReturnDict({
+            'id': number,
+            'customer': {'id': number, 'first_name': 'Zoë', 'last_name': 'Smith', 'email': 'zoe@example.com',
+                         'birth_date': datetime.date(1990, 1, 2)},
+            'status': 'p',
+            'datetime_created': created,
+            'total_amount': Decimal('1234.50'),
+            'item_count': 2,
+            'items': [
+                {'id': number * 2, 'product': {'id': 1, 'name': 'Pen', 'price': Decimal('12.00')}, 'quantity': 1,
+                 'price': Decimal('12.00')},
+                {'id': number * 2 + 1, 'product': {'id': 2, 'name': 'Ink', 'price': Decimal('0.99')}, 'quantity': 3,
+                 'price': Decimal('0.99')},
+            ],
+        }, serializer=None)
+        for number in range(count)
+    ], serializer=None)
+
+
+
+class FastJSONRendererTest(SimpleTestCase):
+
+    def test_pages_render_like_the_json_renderer(self):
+        """Test that an order page with decimals, datetimes and unicode renders to the same bytes."""
+        data = order_page(3)
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+    def test_other_types_match_the_json_renderer(self):
+        """Test that UUIDs, times, time zones, lazy strings and line separators mean the same."""
+        data = {
+            'uuid': uuid.uuid4(),
+            'naive': datetime.datetime(2026, 1, 1, 12, 0),
+            'tehran': datetime.datetime(2026, 1, 1, 12, 0, tzinfo=ZoneInfo('Asia/Tehran')),
+            'now': timezone.now(),
+            'time': datetime.time(8, 15, 30, 5),
+            'duration': datetime.timedelta(minutes=90),
+            'lazy': gettext_lazy('Not found.'),
+            'separators': 'a\u2028b\u2029c',
+            'numbers': [0.1, 1.5, -3, Decimal('0.10')],
+            1: 'integer key',
+        }
+
+        rendered = FastJSONRenderer().render(data)
+
+        self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(data)))
+        self.assertIn(b'\\u2028', rendered)
+
+
+    def test_indented_and_unsupported_data_fall_back(self):
+        """Test that indentation and integers orjson cannot write are left to JSONRenderer."""
+        data = order_page(1)
+        indented = FastJSONRenderer().render(data, 'application/json; indent=4')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=4'))
+
+        huge = {'value': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(huge), b'{"value":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+    def test_json_renderer_is_used_without_orjson(self):
+        """Test that the renderer still works where orjson is not installed."""
+        data = order_page(2)
+
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+
+class RenderedResponsesTest(TestCase):
+
+    def test_api_responses_use_the_fast_renderer(self):
+        """Test that viewset and async catalog responses are rendered by the configured renderer."""
+        category = Category.objects.create(name="Paper")
+        Product.objects.create(name="Pen", description="", price="12.50", category=category)
+        client = APIClient()
+
+        with mock.patch.object(FastJSONRenderer, 'render', wraps=FastJSONRenderer().render) as render:
+            products = client.get('/store/products/')
+            categories = client.get('/store/categories/', format='json')
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(products.json()['results'][0]['price'], 12.5)
+        self.assertEqual(categories.json()[0]['name'], "Paper")
+
+
+    def test_benchmark_compares_the_renderers_on_orders(self):
+        """Test that the benchmark command renders an order list both ways and rolls its orders back."""
+        out = io.StringIO()
+
+        call_command('benchmark_json', '--orders', '5', '--rounds', '1', stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['same_data'])
+        self.assertEqual(set(report['render_ms']), {'json', 'fast'})
+        self.assertFalse(Order.objects.exists())
@@ -0,0 +1,135 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+import os
+import tempfile
+from unittest import mock
+
+from core.db.replicas import PIN_COOKIE, ReplicaRouter, choose_replica, is_down
+from store.models import Category, Discount, Product
+
+
+User = get_user_model()
+
+REPLICAS = {'ALIASES': {'replica_a': 1}, 'PIN_SECONDS': 10, 'RETRY_AFTER': 30}
+
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, ASYNC_CATALOG={'CACHE_TIMEOUT': 0})
+class ReplicaRoutingTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The aliases only exist for this test case, so they are added after
+        # the system checks and the test databases are set up.
+        cls.directory = tempfile.TemporaryDirectory()
+        default = connections['default'].settings_dict
+        connections.settings['replica_a'] = {**default, 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        connections.settings['replica_down'] = {**default, 'NAME': os.path.join(cls.directory.name, 'down.sqlite3')}
+        cls.test_databases = cls.databases
+        cls.databases = {*cls.databases, 'replica_a'}
+        with connections['replica_a'].schema_editor() as editor:
+            for model in (Category, Discount, Product):
+                editor.create_model(model)
+
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in ('replica_a', 'replica_down'):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+        cls.databases = cls.test_databases
+        super().tearDownClass()
+
+
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(name="Primary paper")
+        Category.objects.using('replica_a').create(name="Replica paper")
+        self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+
+
+    def category_names(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return sorted(category['name'] for category in data)
+
+
+    def test_safe_requests_read_from_a_replica(self):
+        """Test that a GET request reads from the replica."""
+        response = APIClient().get('/store/categories/')
+
+        self.assertEqual(self.category_names(response), ["Replica paper"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        """Test that a write goes to the primary and the client's next reads do too."""
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.post('/store/categories/', {"name": "New paper"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Category.objects.filter(name="New paper").exists())
+        self.assertFalse(Category.objects.using('replica_a').filter(name="New paper").exists())
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.category_names(client.get('/store/categories/')), ["New paper", "Primary paper"])
+
+
+    def test_clients_are_pinned_by_their_authorization_header(self):
+        """Test that a client without cookies is pinned by its Authorization header."""
+        writer = APIClient()
+        writer.force_authenticate(self.admin)
+        writer.credentials(HTTP_AUTHORIZATION="Token abc")
+        writer.post('/store/categories/', {"name": "New paper"})
+
+        reader = APIClient()
+        reader.force_authenticate(self.admin)
+        reader.credentials(HTTP_AUTHORIZATION="Token abc")
+        self.assertEqual(self.category_names(reader.get('/store/categories/')), ["New paper", "Primary paper"])
+
+        other = APIClient()
+        other.force_authenticate(self.admin)
+        other.credentials(HTTP_AUTHORIZATION="Token xyz")
+        self.assertEqual(self.category_names(other.get('/store/categories/')), ["Replica paper"])
+
+
+    def test_failing_replicas_are_skipped(self):
+        """Test that a replica that cannot be connected to is marked down and another one is used."""
+        config = {**REPLICAS, 'ALIASES': {'replica_down': 1000, 'replica_a': 1}}
+        refuse = mock.patch.object(
+            connections['replica_down'], 'ensure_connection', side_effect=OperationalError("connection refused")
+        )
+
+        with refuse as ensure_connection:
+            self.assertEqual(choose_replica(config), 'replica_a')
+            self.assertTrue(is_down('replica_down'))
+            # A replica that is down is not tried again until RETRY_AFTER has passed.
+            self.assertIsNone(choose_replica({**config, 'ALIASES': {'replica_down': 1}}))
+        self.assertEqual(ensure_connection.call_count, 1)
+
+
+    def test_replicas_with_no_weight_are_not_used(self):
+        """Test that a replica with a weight of 0 is never chosen."""
+        config = {**REPLICAS, 'ALIASES': {'replica_a': 0}}
+
+        self.assertIsNone(choose_replica(config))
+        with override_settings(DATABASE_REPLICAS=config):
+            self.assertEqual(self.category_names(APIClient().get('/store/categories/')), ["Primary paper"])
+
+
+    def test_router_is_inactive_outside_requests(self):
+        """Test that code running outside a request is not routed."""
+        router = ReplicaRouter()
+
+        self.assertIsNone(router.db_for_read(Category))
+        self.assertIsNone(router.db_for_write(Category))
+        self.assertFalse(router.allow_migrate('replica_a', 'store'))
+        self.assertTrue(router.allow_migrate('default', 'store'))
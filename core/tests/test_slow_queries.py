@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+import io
+import json
+
+from rest_framework.test import APIClient
+
+from core.db import slow_queries
+from core.db.instrumentation import record_queries
+from core.models import SlowQuery
+from store.models import Category
+
+
+User = get_user_model()
+
+
+
+@override_settings(SLOW_QUERIES={'THRESHOLD_MS': 0, 'ASYNC': False, 'LOCATION_APPS': ['core']})
+class SlowQueryTest(TestCase):
+
+    def setUp(self):
+        """Start with no slow queries saved or queued."""
+        SlowQuery.objects.all().delete()
+        while not slow_queries.pending().empty():
+            slow_queries.pending().get_nowait()
+
+
+    def test_queries_are_aggregated_by_fingerprint(self):
+        """Test that queries differing only in their values are counted together, with where they ran."""
+        for name in ["Paper", "Pens", "Ink"]:
+            list(Category.objects.filter(name=name))
+        slow_queries.process_pending()
+
+        [row] = SlowQuery.objects.filter(fingerprint__contains='FROM "store_category"')
+        self.assertEqual(row.count, 3)
+        self.assertGreater(row.total_ms, 0)
+        self.assertGreaterEqual(row.total_ms, row.max_ms)
+        self.assertEqual(row.alias, 'default')
+        [location] = row.locations
+        self.assertRegex(location, r'^core/tests/test_slow_queries\.py:\d+ in test_queries_are_aggregated_by_fingerprint$')
+        self.assertEqual(row.views, {'-': 3})
+
+
+    def test_the_slowest_select_is_explained(self):
+        """Test that the plan of a slow SELECT is captured, and writes are not explained."""
+        list(Category.objects.filter(name="Paper"))
+        Category.objects.create(name="Pens")
+        slow_queries.process_pending()
+
+        select = SlowQuery.objects.get(fingerprint__startswith='SELECT')
+        insert = SlowQuery.objects.get(fingerprint__startswith='INSERT')
+        self.assertIn('store_category', select.explain)
+        self.assertIn("'Paper'", select.slowest_params)
+        self.assertEqual(insert.explain, '')
+
+
+    def test_requests_record_their_view(self):
+        """Test that queries run by a request are recorded with its view."""
+        admin = User.objects.create_user(username="admin", email="admin@example.com", password="pass", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        client.get('/store/cutomers/')
+        slow_queries.process_pending()
+
+        self.assertTrue(SlowQuery.objects.filter(views__has_key='customer-list').exists())
+
+
+    def test_fast_queries_are_not_recorded(self):
+        """Test that queries under the threshold are ignored."""
+        with self.settings(SLOW_QUERIES={'THRESHOLD_MS': 10000, 'ASYNC': False}):
+            list(Category.objects.all())
+
+            self.assertEqual(slow_queries.process_pending(), 0)
+
+
+    def test_recorder_is_outermost(self):
+        """Test that the recorder stays in place around blocks that install their own wrappers."""
+        with record_queries() as stats:
+            list(Category.objects.all())
+
+        self.assertEqual(stats.count, 1)
+        self.assertIsInstance(connection.execute_wrappers[0], slow_queries.SlowQueryRecorder)
+
+
+    def test_command_lists_the_top_offenders(self):
+        """Test that the command ranks the fingerprints, as text or JSON, and can reset them."""
+        for name in ["Paper", "Pens"]:
+            list(Category.objects.filter(name=name))
+
+        out = io.StringIO()
+        call_command('slow_queries', '--limit', '50', stdout=out)
+        self.assertIn('#1 total', out.getvalue())
+        self.assertIn('FROM "store_category"', out.getvalue())
+
+        out = io.StringIO()
+        call_command('slow_queries', '--json', '--order-by', 'count', '--reset', stdout=out)
+        offenders = json.loads(out.getvalue())
+        self.assertEqual(offenders[0]['count'], max(offender['count'] for offender in offenders))
+        self.assertEqual(set(offenders[0]), {
+            'fingerprint', 'alias', 'count', 'total_ms', 'mean_ms', 'max_ms', 'views', 'locations',
+            'slowest_sql', 'slowest_params', 'explain', 'last_seen',
+        })
+        self.assertFalse(SlowQuery.objects.exists())
@@ -0,0 +1,12 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+
+from core.views import JWTLogoutView, UserViewSet
+
+
+router = DefaultRouter()
+router.register('users', UserViewSet)
+
+urlpatterns = [
+    path('jwt/logout/', JWTLogoutView.as_view(), name='jwt-logout'),
+] + router.urls
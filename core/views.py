@@ -1,3 +1,69 @@
-from django.shortcuts import render
+from django.http import FileResponse, Http404, HttpResponse
+from django.template.loader import render_to_string
+from djoser.views import UserViewSet as DjoserUserViewSet
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your views here.
+from core import metrics, profiling
+from core.authentication import UserJWTAuthentication, deny_token
+from core.serializers import TokenLogoutSerializer
+
+
+class JWTLogoutView(APIView):
+    """Deny the given refresh token, and the access token the request was sent with."""
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = TokenLogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deny_token(serializer.validated_data['refresh'])
+        if isinstance(request.auth, AccessToken):
+            deny_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UserViewSet(DjoserUserViewSet):
+    """djoser's user endpoints, with a user from the database whatever the credentials."""
+    authentication_classes = [TokenAuthentication, UserJWTAuthentication, SessionAuthentication]
+
+
+class MetricsView(APIView):
+    """Runtime metrics of every worker, for Prometheus to scrape."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListView(APIView):
+    """The slowest recent profiled requests of each view."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        config = profiling.get_config()
+        return HttpResponse(render_to_string('core/profiles.html', {
+            'views': profiling.recent_profiles(config),
+            'max_profiles': config['MAX_PROFILES'],
+            'header': config['HEADER'],
+        }, request))
+
+
+class ProfileDetailView(APIView):
+    """The pstats report of a profile, or with ``?download=1`` the profile itself."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        path = profiling.profile_path(profile_id)
+        if path is None:
+            raise Http404()
+        if request.query_params.get('download'):
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+        sort = request.query_params.get('sort')
+        return HttpResponse(
+            profiling.report(path, sort if sort in profiling.SORT_KEYS else 'cumulative'),
+            content_type='text/plain; charset=utf-8',
+        )
@@ -1,11 +1,72 @@
+from functools import partial
+
+from django import forms
 from django.contrib import admin, messages
-from django.db.models import Count
+from django.db import transaction
+from django.forms import modelformset_factory
 from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.http import urlencode
 
-from . import models
+from . import analytics, models
+from .moderation import moderate_comments
+from .orders import change_orders_status
+from .signals import order_created
+
+
+
+
+class VersionedModelForm(forms.ModelForm):
+    """Rejects edits of rows that were saved by someone else after the form was rendered."""
+
+    class Meta:
+        widgets = {'version': forms.HiddenInput}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # A form error rather than a field one, as the version field is hidden.
+        version = cleaned_data.get('version')
+        if self.instance.pk and version is not None and version != self.instance.version:
+            raise forms.ValidationError('This row was changed by someone else. Reload the page and try again.')
+        return cleaned_data
+
+
+
+class OrderAdminForm(VersionedModelForm):
+    """Only lets the status of an order change along ``Order.ALLOWED_STATUS_TRANSITIONS``."""
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk and not self.instance.can_change_status(status):
+            raise forms.ValidationError(
+                f'An order cannot go from {self.instance.get_status_display()} to {dict(models.Order.ORDER_STATUS)[status]}.'
+            )
+        return status
+
+
 
+class VersionedAdminMixin:
+    """
+    Checks the version in the change form and in every row of the changelist.
+
+    The changelist forms carry ``version`` without a column of their own: it is
+    rendered with the other hidden fields by admin/store/change_list_results.html.
+    """
+    form = VersionedModelForm
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', self.form)
+        return super().get_changelist_form(request, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        return modelformset_factory(
+            self.model,
+            self.get_changelist_form(request),
+            extra=0,
+            fields=[*self.list_editable, 'version'],
+            formfield_callback=partial(self.formfield_for_dbfield, request=request),
+            **kwargs,
+        )
 
 
 
@@ -33,7 +94,7 @@ class StockFilter(admin.SimpleListFilter):
 
 
 @admin.register(models.Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(VersionedAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'description', 'price', 'category', 'stock', 'image', 'created_at']
     list_per_page = 10
     list_editable = ['price']
@@ -43,13 +104,6 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', ]
 
 
-    def get_queryset(self, request):
-        return super().get_queryset(request) \
-                .prefetch_related('comments') \
-                .annotate(
-                    comments_count=Count('comments'),
-                )
-
     def stock_status(self, product):
         if product.stock < 10:
             return 'Low'
@@ -57,7 +111,7 @@ class ProductAdmin(admin.ModelAdmin):
             return 'High'
         return 'Medium'
     
-    @admin.display(description='# comments', ordering='comments_count')
+    @admin.display(description='# comments', ordering='approved_comments_count')
     def num_of_comments(self, product):
         url = (
             reverse('admin:store_comment_changelist') 
@@ -66,7 +120,7 @@ class ProductAdmin(admin.ModelAdmin):
                 'product__id': product.id,
             })
         )
-        return format_html('<a href="{}">{}</a>', url, product.comments_count)
+        return format_html('<a href="{}">{}</a>', url, product.approved_comments_count)
         
     
     @admin.display(ordering='category__name')
@@ -87,10 +141,31 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(models.Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ['id', 'product', 'status', ]
+    list_display = ['id', 'product', 'name', 'body', 'status', 'datetime_created', ]
     list_editable = ['status']
     list_per_page = 10
+    list_filter = ['status']
+    list_select_related = ['product']
+    ordering = ['datetime_created']
     autocomplete_fields = ['product', ]    
+    actions = ['approve', 'reject']
+
+    def moderate(self, request, **decision):
+        result = moderate_comments(**decision)
+        self.message_user(
+            request,
+            f'{len(result["approved"])} comments approved, {len(result["rejected"])} rejected, '
+            f'{len(result["skipped"])} skipped.',
+            messages.SUCCESS if not result['skipped'] else messages.WARNING,
+        )
+
+    @admin.action(description='Approve selected waiting comments')
+    def approve(self, request, queryset):
+        self.moderate(request, approve=queryset.values_list('id', flat=True))
+
+    @admin.action(description='Reject selected waiting comments')
+    def reject(self, request, queryset):
+        self.moderate(request, reject=queryset.values_list('id', flat=True))
     
 
 
@@ -98,6 +173,7 @@ class CommentAdmin(admin.ModelAdmin):
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'email', ]
     list_per_page = 10
+    list_select_related = ['user']
     ordering = ['user__last_name', 'user__first_name', ]
     search_fields = ['user__first_name__istartswith', 'user__last_name__istartswith', ]
 
@@ -126,27 +202,101 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price']
     autocomplete_fields = ['product', ]
 
+    def save_model(self, request, obj, form, change):
+        # An item moved to another order changes both orders.
+        orders = list(models.Order.objects.filter(id__in={obj.order_id, form.initial.get('order')} - {None}))
+        with transaction.atomic(), analytics.recording_item_changes(orders):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic(), analytics.recording_item_changes([obj.order]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        orders = list(models.Order.objects.filter(id__in=queryset.values('order_id')))
+        with transaction.atomic(), analytics.recording_item_changes(orders):
+            super().delete_queryset(request, queryset)
+
 
 
 @admin.register(models.Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'customer', 'status', 'datetime_created', 'num_of_items']
+class OrderAdmin(VersionedAdminMixin, admin.ModelAdmin):
+    form = OrderAdminForm
+    list_display = ['id', 'customer', 'status', 'datetime_created', 'num_of_items', 'total_amount']
     list_editable = ['status']
     list_per_page = 10
+    list_filter = ['status', 'datetime_created']
+    list_select_related = ['customer__user']
     ordering = ['-datetime_created']
+    readonly_fields = ['total_amount', 'item_count']
     inlines = [OrderItemInline]
+    actions = ['mark_paid', 'mark_canceled']
+
+    def save_related(self, request, form, formsets, change):
+        order = form.instance
+        if change:
+            with analytics.recording_item_changes([order]):
+                super().save_related(request, form, formsets, change)
+            order.update_totals()
+            return
+        super().save_related(request, form, formsets, change)
+        order.update_totals()
+        analytics.record_orders_created([order])
+        order_created.send_robust(self.__class__, order=order)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            analytics.record_orders_deleted([obj])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            analytics.record_orders_deleted(list(queryset))
+            super().delete_queryset(request, queryset)
+
+    @admin.display(ordering='item_count', description='# items')
+    def num_of_items(self, order):
+        return order.item_count
 
-    def get_queryset(self, request):
-        return super() \
-                .get_queryset(request) \
-                .prefetch_related('items') \
-                .annotate(
-                    items_count=Count('items')
-                )
+    def change_status(self, request, queryset, new_status):
+        result = change_orders_status(queryset.values_list('id', flat=True), new_status)
+        self.message_user(
+            request,
+            f'{len(result["updated"])} orders updated, {len(result["skipped"])} skipped.',
+            messages.SUCCESS if not result['skipped'] else messages.WARNING,
+        )
 
-    @admin.display(ordering='items_count', description='# items')
-    def num_of_items(self, order):
-        return order.items_count
+    @admin.action(description='Mark selected unpaid orders as paid')
+    def mark_paid(self, request, queryset):
+        self.change_status(request, queryset, models.Order.ORDER_STATUS_PAID)
+
+    @admin.action(description='Cancel selected unpaid orders')
+    def mark_canceled(self, request, queryset):
+        self.change_status(request, queryset, models.Order.ORDER_STATUS_CANCELED)
+
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = models.ArchivedOrderItem
+    fields = ['product', 'quantity', 'price']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+
+@admin.register(models.ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['original_id', 'customer', 'status', 'datetime_created', 'item_count', 'total_amount', 'datetime_archived']
+    list_per_page = 10
+    list_filter = ['status', 'datetime_created']
+    list_select_related = ['customer__user']
+    ordering = ['-datetime_created']
+    readonly_fields = ['original_id', 'customer', 'datetime_created', 'status', 'total_amount', 'item_count', 'datetime_archived']
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
 
 
 
@@ -164,6 +314,28 @@ class CartAdmin(admin.ModelAdmin):
     inlines = [CartItemInline]
 
 
+
+@admin.register(models.Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'segment', 'status', 'recipient_count', 'sent_count', 'failed_count']
+    list_filter = ['status', 'segment']
+    list_select_related = ['category']
+    readonly_fields = [
+        'status', 'recipient_count', 'sent_count', 'failed_count',
+        'datetime_started', 'datetime_finished', 'created_by',
+    ]
+
+
+
+@admin.register(models.QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'attempts', 'next_attempt_at', 'datetime_sent']
+    list_filter = ['status']
+    search_fields = ['subject']
+    ordering = ['-id']
+    readonly_fields = ['attempts', 'last_error', 'datetime_created', 'datetime_sent']
+
+
     
 admin.site.register(models.Category)
 admin.site.register(models.PageContent)
@@ -0,0 +1,88 @@
+"""
+Denormalized per-product comment aggregates.
+
+Only approved comments count. Each one adds 1 to ``approved_comments_count``
+and, when it has a rating, to ``rating_count``, its rating to ``rating_sum``
+and 1 to the ``ratings_<n>`` histogram column. ``rating`` is the average
+derived from the sum and count.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from . import catalog
+from .models import Comment, Product
+
+
+RATINGS = range(1, 6)
+AGGREGATE_FIELDS = ['approved_comments_count', 'rating_sum', 'rating_count'] + [f'ratings_{rating}' for rating in RATINGS]
+
+RATING_AVERAGE = Case(
+    When(
+        rating_count__gt=0,
+        then=ExpressionWrapper(Cast('rating_sum', FloatField()) / F('rating_count'), output_field=FloatField()),
+    ),
+    default=None,
+    output_field=FloatField(),
+)
+
+
+def comment_aggregates(status, rating):
+    """Return what a comment with this status and rating adds to its product."""
+    if status != Comment.COMMENT_STATUS_APPROVED:
+        return Counter()
+    aggregates = Counter(approved_comments_count=1)
+    if rating:
+        aggregates.update({'rating_sum': rating, 'rating_count': 1, f'ratings_{rating}': 1})
+    return aggregates
+
+
+def update_product_aggregates(deltas):
+    """
+    Add ``deltas`` (a dict of product id to a dict of field increments) to
+    the products with one UPDATE, plus one to refresh the average rating
+    when ratings changed.
+    """
+    deltas = {
+        product_id: {field: value for field, value in delta.items() if value}
+        for product_id, delta in deltas.items()
+    }
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    fields = sorted({field for delta in deltas.values() for field in delta})
+    products = Product.objects.filter(pk__in=deltas)
+    products.update(**{
+        field: F(field) + Case(
+            *[When(pk=product_id, then=Value(delta[field])) for product_id, delta in deltas.items() if field in delta],
+            default=Value(0),
+        )
+        for field in fields
+    })
+    if 'rating_count' in fields:
+        products.update(rating=RATING_AVERAGE)
+    catalog.bump_catalog_generation()
+
+
+def recompute_product_aggregates(product_ids):
+    """Recompute the aggregates of the given products from their approved comments."""
+    totals = defaultdict(Counter)
+    rows = Comment.objects.filter(product_id__in=product_ids, status=Comment.COMMENT_STATUS_APPROVED) \
+        .values_list('product_id', 'rating') \
+        .annotate(count=Count('id'))
+    for product_id, rating, count in rows:
+        for field, value in comment_aggregates(Comment.COMMENT_STATUS_APPROVED, rating).items():
+            totals[product_id][field] += value * count
+
+    products = [
+        Product(pk=product_id, **{field: totals[product_id][field] for field in AGGREGATE_FIELDS})
+        for product_id in product_ids
+    ]
+    with transaction.atomic():
+        Product.objects.bulk_update(products, AGGREGATE_FIELDS)
+        Product.objects.filter(pk__in=product_ids).update(rating=RATING_AVERAGE)
+    catalog.bump_catalog_generation()
+    return len(products)
@@ -0,0 +1,267 @@
+"""
+Sales rollups used by the analytics API.
+
+Every order contributes to one row per period (day, week, month) for all
+sales, for its customer and for each category it contains. Canceled orders
+contribute nothing and only paid orders contribute to ``paid_revenue``, so a
+status change is applied as the difference between the old and the new
+contribution of the order.
+
+Increments are applied in the transaction that changes the orders, with one
+``INSERT`` of the missing rows and one ``UPDATE`` of all rows they touch, by
+the code that changes them: checkout, ``change_orders_status``, status
+changes saved on an order, order deletes through the API and the admin, and
+item edits in the admin. Their errors are not caught, so an order change
+that cannot be added to the rollups is rolled back with them. Orders or
+items changed any other way, e.g. with ``QuerySet.update()`` in a shell, are
+only reflected after ``manage.py rebuild_sales_rollups``.
+Every writer locks ``SalesRollupFence`` first, and a rebuild holds that lock
+from before it reads the orders until the new rows are committed: writers
+wait for the rebuild, then add their increments to the rebuilt rows.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, SalesRollup, SalesRollupFence
+
+
+TOTAL_FIELDS = ['order_count', 'quantity', 'revenue', 'paid_revenue']
+
+
+def period_starts(day):
+    return {
+        SalesRollup.PERIOD_DAY: day,
+        SalesRollup.PERIOD_WEEK: day - timedelta(days=day.weekday()),
+        SalesRollup.PERIOD_MONTH: day.replace(day=1),
+    }
+
+
+def _empty_totals():
+    return defaultdict(lambda: [0, 0, Decimal('0'), Decimal('0')])
+
+
+def _add(totals, day, dimension, dimension_id, status, sign, orders, quantity, revenue):
+    if status == Order.ORDER_STATUS_CANCELED:
+        return
+    paid_revenue = revenue if status == Order.ORDER_STATUS_PAID else 0
+    for period, period_start in period_starts(day).items():
+        row = totals[(period, period_start, dimension, dimension_id)]
+        row[0] += sign * orders
+        row[1] += sign * quantity
+        row[2] += sign * revenue
+        row[3] += sign * paid_revenue
+
+
+def _collect_order(totals, order, items, status, sign):
+    day = timezone.localdate(order.datetime_created)
+    by_category = defaultdict(lambda: [0, Decimal('0')])
+    for item in items:
+        by_category[item['product__category_id']][0] += item['quantity']
+        by_category[item['product__category_id']][1] += item['price'] * item['quantity']
+
+    quantity = sum(category_quantity for category_quantity, _ in by_category.values())
+    revenue = sum((category_revenue for _, category_revenue in by_category.values()), Decimal('0'))
+    _add(totals, day, SalesRollup.DIMENSION_ALL, 0, status, sign, 1, quantity, revenue)
+    _add(totals, day, SalesRollup.DIMENSION_CUSTOMER, order.customer_id, status, sign, 1, quantity, revenue)
+    for category_id, (category_quantity, category_revenue) in by_category.items():
+        _add(totals, day, SalesRollup.DIMENSION_CATEGORY, category_id,
+             status, sign, 1, category_quantity, category_revenue)
+
+
+def _items_by_order(order_ids):
+    items = defaultdict(list)
+    rows = OrderItem.objects.filter(order_id__in=order_ids) \
+        .values('order_id', 'product__category_id', 'quantity', 'price')
+    for row in rows:
+        items[row['order_id']].append(row)
+    return items
+
+
+def lock_rollups():
+    """Lock the rollups until the end of the current transaction."""
+    SalesRollupFence.objects.select_for_update().get_or_create(pk=1)
+
+
+def _apply(totals):
+    rows = {key: values for key, values in totals.items() if any(values)}
+    if not rows:
+        return
+    keys = [
+        dict(zip(['period', 'period_start', 'dimension', 'dimension_id'], key))
+        for key in sorted(rows)
+    ]
+    with transaction.atomic():
+        lock_rollups()
+        SalesRollup.objects.bulk_create([SalesRollup(**key) for key in keys], ignore_conflicts=True)
+
+        matches = [Q(**key) for key in keys]
+        increments = {}
+        for index, field in enumerate(TOTAL_FIELDS):
+            output_field = SalesRollup._meta.get_field(field)
+            increments[field] = F(field) + Case(
+                *[
+                    When(match, then=Value(rows[tuple(key.values())][index], output_field=output_field))
+                    for match, key in zip(matches, keys)
+                ],
+                default=Value(0, output_field=output_field),
+                output_field=output_field,
+            )
+        condition = Q()
+        for match in matches:
+            condition |= match
+        SalesRollup.objects.filter(condition).update(**increments)
+
+
+def record_orders_created(orders):
+    """Add newly created orders to the rollups."""
+    items = _items_by_order([order.id for order in orders])
+    totals = _empty_totals()
+    for order in orders:
+        _collect_order(totals, order, items[order.id], order.status, 1)
+    _apply(totals)
+
+
+def record_status_change(orders, old_status, new_status):
+    """Move orders that went from ``old_status`` to ``new_status`` in the rollups."""
+    items = _items_by_order([order.id for order in orders])
+    totals = _empty_totals()
+    for order in orders:
+        _collect_order(totals, order, items[order.id], old_status, -1)
+        _collect_order(totals, order, items[order.id], new_status, 1)
+    _apply(totals)
+
+
+def record_orders_deleted(orders):
+    """Take orders that are about to be deleted out of the rollups."""
+    items = _items_by_order([order.id for order in orders])
+    totals = _empty_totals()
+    for order in orders:
+        _collect_order(totals, order, items[order.id], order.status, -1)
+    _apply(totals)
+
+
+@contextmanager
+def recording_item_changes(orders):
+    """Move ``orders`` in the rollups from the items they have before the block to those they have after it."""
+    order_ids = [order.id for order in orders]
+    items_before = _items_by_order(order_ids)
+    yield
+    items_after = _items_by_order(order_ids)
+    totals = _empty_totals()
+    for order in orders:
+        _collect_order(totals, order, items_before[order.id], order.status, -1)
+        _collect_order(totals, order, items_after[order.id], order.status, 1)
+    _apply(totals)
+
+
+def _collect_chunk(id_range):
+    totals = _empty_totals()
+    _collect_chunk_from(totals, id_range, Order, OrderItem)
+    _collect_chunk_from(totals, id_range, ArchivedOrder, ArchivedOrderItem)
+    return totals
+
+
+def _collect_chunk_from(totals, id_range, order_model, item_model):
+    first_id, last_id = id_range
+    orders = order_model.objects.filter(id__gte=first_id, id__lte=last_id) \
+        .annotate(day=TruncDate('datetime_created')) \
+        .values('day', 'status', 'customer_id') \
+        .annotate(orders=Count('id'))
+    for row in orders:
+        _add(totals, row['day'], SalesRollup.DIMENSION_ALL, 0,
+             row['status'], 1, row['orders'], 0, 0)
+        _add(totals, row['day'], SalesRollup.DIMENSION_CUSTOMER, row['customer_id'],
+             row['status'], 1, row['orders'], 0, 0)
+
+    items = item_model.objects.filter(order_id__gte=first_id, order_id__lte=last_id) \
+        .annotate(day=TruncDate('order__datetime_created')) \
+        .values('day', 'order__status', 'order__customer_id', 'product__category_id') \
+        .annotate(
+            orders=Count('order_id', distinct=True),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('price') * F('quantity')),
+        )
+    for row in items:
+        status = row['order__status']
+        _add(totals, row['day'], SalesRollup.DIMENSION_ALL, 0,
+             status, 1, 0, row['total_quantity'], row['total_revenue'])
+        _add(totals, row['day'], SalesRollup.DIMENSION_CUSTOMER, row['order__customer_id'],
+             status, 1, 0, row['total_quantity'], row['total_revenue'])
+        _add(totals, row['day'], SalesRollup.DIMENSION_CATEGORY, row['product__category_id'],
+             status, 1, row['orders'], row['total_quantity'], row['total_revenue'])
+
+
+def _collect_chunk_in_thread(id_range):
+    try:
+        return _collect_chunk(id_range)
+    finally:
+        connection.close()
+
+
+def rebuild_rollups(chunk_size=10000, workers=1):
+    """
+    Recompute all rollups from the order and archived order tables.
+
+    Orders are split into id ranges of ``chunk_size`` that are aggregated by
+    ``workers`` threads, each on its own database connection. The partial
+    results are merged and the rollup table is replaced in one transaction,
+    which holds ``lock_rollups()`` from before the orders are read, so order
+    changes wait for the rebuild. Returns the number of rollup rows written.
+    """
+    with transaction.atomic():
+        lock_rollups()
+        return _rebuild(chunk_size, workers)
+
+
+def _rebuild(chunk_size, workers):
+    bounds = [
+        model.objects.aggregate(first_id=Min('id'), last_id=Max('id'))
+        for model in (Order, ArchivedOrder)
+    ]
+    first_ids = [bound['first_id'] for bound in bounds if bound['first_id'] is not None]
+    last_ids = [bound['last_id'] for bound in bounds if bound['last_id'] is not None]
+    id_ranges = []
+    if first_ids:
+        id_ranges = [
+            (first_id, first_id + chunk_size - 1)
+            for first_id in range(min(first_ids), max(last_ids) + 1, chunk_size)
+        ]
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(_collect_chunk_in_thread, id_ranges))
+    else:
+        partials = [_collect_chunk(id_range) for id_range in id_ranges]
+
+    totals = _empty_totals()
+    for partial in partials:
+        for key, values in partial.items():
+            row = totals[key]
+            for index, value in enumerate(values):
+                row[index] += value
+
+    rollups = [
+        SalesRollup(
+            period=period,
+            period_start=period_start,
+            dimension=dimension,
+            dimension_id=dimension_id,
+            order_count=orders,
+            quantity=quantity,
+            revenue=revenue,
+            paid_revenue=paid_revenue,
+        )
+        for (period, period_start, dimension, dimension_id), (orders, quantity, revenue, paid_revenue)
+        in totals.items()
+    ]
+    SalesRollup.objects.all().delete()
+    SalesRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
@@ -0,0 +1,82 @@
+"""
+Moves old orders out of the hot order tables.
+
+Old orders are copied to ``ArchivedOrder`` and ``ArchivedOrderItem``, which
+have no database constraints towards the hot tables so they never block
+deletes there. The archive tables have primary keys of their own and keep
+the hot table ids in a unique ``original_id``: auto-increment counters can
+be reset, e.g. on MySQL before 8.0 after a restart, and hand an archived id
+to a new order. Archived orders protect their customers like orders do.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import lock_rollups
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def _archive_batch(older_than, batch_size):
+    with transaction.atomic():
+        # A rollup rebuild reads both tables; keep orders from moving under it.
+        lock_rollups()
+        orders = list(
+            Order.objects.select_for_update()
+                .filter(datetime_created__lt=older_than)
+                .order_by('id')[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order.id for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids)
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                original_id=order.id,
+                customer_id=order.customer_id,
+                datetime_created=order.datetime_created,
+                status=order.status,
+                total_amount=order.total_amount,
+                item_count=order.item_count,
+            ) for order in orders
+        ])
+        # MySQL does not return the ids of bulk inserted rows.
+        archived_ids = dict(
+            ArchivedOrder.objects.filter(original_id__in=order_ids).values_list('original_id', 'id')
+        )
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(
+                original_id=item.id,
+                order_id=archived_ids[item.order_id],
+                product_id=item.product_id,
+                quantity=item.quantity,
+                price=item.price,
+            ) for item in items
+        ])
+
+        items.delete()
+        Order.objects.filter(id__in=order_ids).delete()
+        return len(orders)
+
+
+def archive_orders(older_than=None, batch_size=1000):
+    """
+    Move orders created before ``older_than`` to the archive tables, one
+    transaction per ``batch_size`` orders. Returns the number of orders moved.
+    """
+    if older_than is None:
+        older_than = archive_cutoff()
+    archived = 0
+    while True:
+        moved = _archive_batch(older_than, batch_size)
+        if not moved:
+            return archived
+        archived += moved
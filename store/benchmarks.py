@@ -0,0 +1,421 @@
+"""
+Synthetic data and request scenarios for benchmarking the store.
+
+``generate`` fills the database with categories, products, customers, carts
+and orders through ``bulk_create`` in chunks of ``chunk_size`` rows. Primary
+keys are assigned up front, so no ids have to be read back (MySQL does not
+return them) and millions of rows never have to be held in memory. Every
+value is derived from ``seed``, so two databases generated with the same
+arguments hold the same rows. ``bulk_create`` sends no signals: the sales
+rollups are not updated (run ``rebuild_sales_rollups`` if they matter) and
+the customers are created next to their users, as ``store.provisioning``
+does.
+
+A scenario is a function registered with ``@scenario`` that may send
+unmeasured requests to set up, e.g. fill a cart, and returns the request to
+measure. ``run_scenario`` sends a scenario's requests one after another through a
+``ClientSession`` (the test client, in this process) or a ``ServerSession``
+(a running server) and reports latency percentiles and the queries per
+request read from the ``Server-Timing`` header of
+``core.db.instrumentation``. Scenario parameters are drawn from a generator
+seeded with the scenario name, so two runs send the same requests.
+"""
+from decimal import Decimal
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+import json
+import math
+import random
+import re
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.test import Client
+
+from . import catalog
+from .models import Cart, CartItem, Category, Customer, Order, OrderItem, Product
+from .paginations import DefaultPagination
+
+
+ADMIN_USERNAME = 'benchmark-admin'
+PASSWORD = 'benchmark'
+
+WORDS = [
+    'paper', 'notebook', 'pencil', 'pen', 'marker', 'stapler', 'folder', 'binder', 'envelope', 'eraser',
+    'ruler', 'scissors', 'tape', 'glue', 'clip', 'label', 'ink', 'toner', 'desk', 'lamp',
+]
+ADJECTIVES = ['blue', 'black', 'red', 'recycled', 'premium', 'pocket', 'large', 'small', 'glossy', 'matte']
+FIRST_NAMES = ['Sam', 'Alex', 'Robin', 'Kim', 'Noor', 'Sasha', 'Jordan', 'Ari', 'Mina', 'Reza']
+LAST_NAMES = ['Karimi', 'Smith', 'Garcia', 'Chen', 'Novak', 'Okafor', 'Rossi', 'Tanaka', 'Haddad', 'Berg']
+ORDER_STATUSES = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_UNPAID, Order.ORDER_STATUS_CANCELED]
+ORDER_STATUS_WEIGHTS = [70, 25, 5]
+
+_queries = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def product_price(pk):
+    """Return the price of a generated product, so order items need not look it up."""
+    return Decimal(pk * 7919 % 49950 + 50) / 100
+
+
+def _next_id(model):
+    return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+
+def _insert(model, count, build, chunk_size):
+    """Insert ``count`` rows made by ``build(index, pk)`` and return their primary keys."""
+    first = _next_id(model)
+    for start in range(0, count, chunk_size):
+        with transaction.atomic():
+            model.objects.bulk_create([
+                build(index, first + index) for index in range(start, min(start + chunk_size, count))
+            ])
+    return range(first, first + count)
+
+
+def _insert_with_items(model, item_model, count, build, chunk_size):
+    """
+    Insert ``count`` rows and their items, made by ``build(index, pk, item_pk)``
+    as a row and a list of items. Rows with UUID keys are given ``None`` as
+    ``pk`` and make their own.
+    """
+    first = _next_id(model) if model._meta.pk.get_internal_type() != 'UUIDField' else None
+    item_pk = _next_id(item_model)
+    for start in range(0, count, chunk_size):
+        rows, items = [], []
+        for index in range(start, min(start + chunk_size, count)):
+            row, row_items = build(index, first + index if first is not None else None, item_pk)
+            rows.append(row)
+            items += row_items
+            item_pk += len(row_items)
+        with transaction.atomic():
+            model.objects.bulk_create(rows)
+            item_model.objects.bulk_create(items)
+
+
+def generate(products=100000, customers=50000, carts=10000, orders=200000, items_per_order=3,
+             seed=0, chunk_size=5000, log=None):
+    """
+    Create ``products`` products (in one category per 1000), ``customers``
+    users with their customers, ``carts`` carts and ``orders`` orders of the
+    customers, each with 1 to ``2 * items_per_order - 1`` items, and the
+    staff user the scenarios log in as. Returns the number of rows created
+    of each model.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    User = get_user_model()
+    # Hashing once keeps a million users from taking hours; they share the password anyway.
+    password = make_password(PASSWORD)
+
+    if not User.objects.filter(username=ADMIN_USERNAME).exists():
+        User.objects.create_superuser(ADMIN_USERNAME, f'{ADMIN_USERNAME}@example.com', PASSWORD)
+
+    log(f'Creating {max(1, products // 1000)} categories and {products} products.')
+    category_ids = _insert(Category, max(1, products // 1000), lambda index, pk: Category(
+        id=pk, name=f'Benchmark category {pk}', description=' '.join(rng.choices(WORDS, k=8)),
+    ), chunk_size)
+    product_ids = _insert(Product, products, lambda index, pk: Product(
+        id=pk,
+        name=f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(WORDS)} {pk}',
+        description=' '.join(rng.choices(WORDS + ADJECTIVES, k=20)),
+        price=product_price(pk),
+        stock=rng.randrange(500),
+        category_id=rng.choice(category_ids),
+    ), chunk_size)
+
+    log(f'Creating {customers} customers.')
+    user_ids = _insert(User, customers, lambda index, pk: User(
+        id=pk,
+        username=f'benchmark-{pk}',
+        email=f'benchmark-{pk}@example.com',
+        password=password,
+        first_name=rng.choice(FIRST_NAMES),
+        last_name=rng.choice(LAST_NAMES),
+    ), chunk_size)
+    customer_ids = _insert(Customer, customers, lambda index, pk: Customer(
+        id=pk, user_id=user_ids[index], phone_number=f'0912{rng.randrange(10 ** 7):07d}',
+    ), chunk_size)
+
+    def cart(index, pk, item_pk):
+        cart = Cart(id=uuid.UUID(int=rng.getrandbits(128), version=4))
+        return cart, [
+            CartItem(id=item_pk + number, cart_id=cart.id, product_id=product_id, quantity=rng.randint(1, 5))
+            for number, product_id in enumerate(rng.sample(product_ids, min(len(product_ids), rng.randint(1, 5))))
+        ]
+
+    def order(index, pk, item_pk):
+        count = min(len(product_ids), rng.randint(1, 2 * items_per_order - 1))
+        items = [
+            OrderItem(id=item_pk + number, order_id=pk, product_id=product_id,
+                      quantity=rng.randint(1, 5), price=product_price(product_id))
+            for number, product_id in enumerate(rng.sample(product_ids, count))
+        ]
+        return Order(
+            id=pk,
+            customer_id=rng.choice(customer_ids),
+            status=rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0],
+            total_amount=sum(item.price * item.quantity for item in items),
+            item_count=len(items),
+        ), items
+
+    if product_ids:
+        log(f'Creating {carts} carts.')
+        _insert_with_items(Cart, CartItem, carts, cart, chunk_size)
+        if customer_ids:
+            log(f'Creating {orders} orders.')
+            _insert_with_items(Order, OrderItem, orders, order, chunk_size)
+
+    # Databases with sequences have to be told about the ids assigned here.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [Category, Product, User, Customer, CartItem, Order, OrderItem],
+        ):
+            cursor.execute(sql)
+    catalog.bump_catalog_generation()
+
+    return {
+        'categories': len(category_ids),
+        'products': products,
+        'customers': customers,
+        'carts': carts if product_ids else 0,
+        'orders': orders if product_ids and customer_ids else 0,
+    }
+
+
+class ClientSession:
+    """Sends requests through the test client, within this process."""
+
+    def __init__(self):
+        # An address outside INTERNAL_IPS, so the debug toolbar stays out of the measurements.
+        self.client = Client(HTTP_HOST='localhost', REMOTE_ADDR='192.0.2.1')
+
+    def login(self, username, password):
+        if not self.client.login(username=username, password=password):
+            raise ValueError(f'Could not log in as {username}.')
+
+    def request(self, method, path, data=None):
+        response = self.client.generic(
+            method, path,
+            json.dumps(data) if data is not None else '',
+            content_type='application/json',
+            HTTP_ACCEPT='application/json',
+        )
+        return response.status_code, response.headers, response.content
+
+
+class ServerSession:
+    """Sends requests to a running server over one keep-alive connection."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise ValueError(f'Only http:// URLs can be benchmarked, got {url!r}.')
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connection = None
+        self.cookies = {}
+
+    def login(self, username, password):
+        self.request('GET', '/admin/login/')
+        status, headers, body = self.request('POST', '/admin/login/', form={
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+            'next': '/admin/',
+        })
+        if status != 302:
+            raise ValueError(f'Could not log in as {username}.')
+
+    def request(self, method, path, data=None, form=None):
+        headers = {'Accept': 'application/json'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if method not in ('GET', 'HEAD') and 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if form is not None:
+            body = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = None
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except (ConnectionError, OSError):
+                # The server closed the kept-alive connection; reconnect once.
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.headers.get('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+        return response.status, response.headers, content
+
+
+SCENARIOS = {}
+
+
+def scenario(login=False):
+    """Register a scenario; with ``login`` its session logs in as the benchmark staff user first."""
+    def register(function):
+        function.login = login
+        SCENARIOS[function.__name__] = function
+        return function
+    return register
+
+
+def _random_product(context, rng):
+    return rng.randint(context['first_product'], context['last_product'])
+
+
+@scenario()
+def product_list(session, context, state, rng):
+    return 'GET', f'/store/products/?page={rng.randint(1, min(50, context["product_pages"]))}', None
+
+
+@scenario()
+def product_search(session, context, state, rng):
+    return 'GET', f'/store/products/?search={rng.choice(WORDS)}', None
+
+
+@scenario()
+def product_detail(session, context, state, rng):
+    return 'GET', f'/store/products/{_random_product(context, rng)}/', None
+
+
+@scenario(login=True)
+def cart_add(session, context, state, rng):
+    if 'cart' not in state:
+        state['cart'] = json.loads(session.request('POST', '/store/carts/', {})[2])['id']
+    return 'POST', f'/store/carts/{state["cart"]}/items/', {
+        'product': _random_product(context, rng), 'quantity': rng.randint(1, 3),
+    }
+
+
+@scenario(login=True)
+def checkout(session, context, state, rng):
+    cart = json.loads(session.request('POST', '/store/carts/', {})[2])['id']
+    for product in {_random_product(context, rng) for _ in range(3)}:
+        session.request('POST', f'/store/carts/{cart}/items/', {'product': product, 'quantity': 1})
+    return 'POST', '/store/orders/', {'cart_id': cart}
+
+
+@scenario(login=True)
+def admin_products(session, context, state, rng):
+    return 'GET', f'/admin/store/product/?p={rng.randint(1, min(50, context["product_pages"]))}', None
+
+
+@scenario(login=True)
+def admin_orders(session, context, state, rng):
+    return 'GET', '/admin/store/order/', None
+
+
+@scenario(login=True)
+def admin_customers(session, context, state, rng):
+    return 'GET', '/admin/store/customer/', None
+
+
+def get_context():
+    """Return what the scenarios need to know about the data."""
+    products = Product.objects.aggregate(first=Min('pk'), last=Max('pk'), count=Count('pk'))
+    if not products['count']:
+        raise ValueError('There are no products to benchmark; generate them first.')
+    return {
+        'first_product': products['first'],
+        'last_product': products['last'],
+        # The product list and its admin changelist both show 10 products a page.
+        'product_pages': math.ceil(products['count'] / DefaultPagination.page_size),
+    }
+
+
+def row_counts():
+    return {
+        'products': Product.objects.count(),
+        'customers': Customer.objects.count(),
+        'carts': Cart.objects.count(),
+        'orders': Order.objects.count(),
+    }
+
+
+def summarize(latencies, queries, statuses):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'latency_ms': {
+            name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+            for name, fraction in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]
+        },
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run_scenario(name, session, context, requests=200, warmup=20, seed=0):
+    """Send ``warmup`` and then ``requests`` measured requests of a scenario and summarize the latter."""
+    function = SCENARIOS[name]
+    if isinstance(session, ClientSession):
+        # Start from a cold catalog cache, so a run does not depend on what ran before it.
+        catalog.bump_catalog_generation()
+    if function.login:
+        session.login(ADMIN_USERNAME, PASSWORD)
+    rng = random.Random(f'{seed}:{name}')
+    state = {}
+    latencies, queries, statuses = [], [], {}
+    for number in range(warmup + requests):
+        method, path, data = function(session, context, state, rng)
+        started = time.perf_counter()
+        status, headers, content = session.request(method, path, data)
+        elapsed = time.perf_counter() - started
+        if number < warmup:
+            continue
+        latencies.append(elapsed)
+        statuses[status] = statuses.get(status, 0) + 1
+        match = _queries.search(headers.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+    return summarize(latencies, queries, statuses)
+
+
+def compare(report, baseline):
+    """Return the relative change of each scenario's percentiles and queries against ``baseline``."""
+    changes = {}
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        change = {}
+        for key, value in result['latency_ms'].items():
+            old = before['latency_ms'].get(key)
+            if value is not None and old:
+                change[key] = f'{(value - old) / old:+.1%}'
+        if result['queries_per_request'] is not None and before.get('queries_per_request') is not None:
+            change['queries_per_request'] = round(result['queries_per_request'] - before['queries_per_request'], 2)
+        changes[name] = change
+    return changes
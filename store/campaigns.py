@@ -0,0 +1,244 @@
+"""
+Marketing email campaigns.
+
+A campaign mails every active customer in its segment. Recipients are read
+page by page with one keyset query per page (``customer id > cursor``), so
+memory use does not grow with the segment and an interrupted campaign
+resumes after the last finished page.
+
+The subject and body are Django templates rendered once per campaign with
+the campaign and its category. The result may contain ``$first_name``,
+``$last_name``, ``$username`` and ``$email``, which are filled in for each
+recipient with ``string.Template``. Each page is split into batches that
+worker threads send over connections borrowed from a pool, and the sent and
+failed counters and the cursor are saved after every page.
+
+A worker claims a campaign before sending it and renews its claim with every
+page, so two workers, or two overlapping runs of ``send_campaigns``, never
+send the same campaign. A campaign whose claim has not been renewed for
+``CLAIM_TIMEOUT`` is taken to belong to a worker that died and is resumed by
+the next one. A worker that finds its claim taken over stops sending.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, LifoQueue
+from string import Template as RecipientTemplate
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, F, OuterRef, Q
+from django.template import Context, Template
+from django.utils import timezone
+
+from .models import Campaign, Customer, OrderItem
+
+
+logger = logging.getLogger(__name__)
+
+# Longer than a page of PAGE_SIZE recipients takes to send.
+CLAIM_TIMEOUT = datetime.timedelta(minutes=15)
+
+DEFAULTS = {
+    'PAGE_SIZE': 2000,
+    'BATCH_SIZE': 100,
+    'WORKERS': 4,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_CAMPAIGNS', {})}
+
+
+def segment_queryset(campaign):
+    """Return the customers of the campaign's segment."""
+    customers = Customer.objects.filter(user__is_active=True).exclude(user__email='')
+    if campaign.segment == Campaign.SEGMENT_CATEGORY:
+        items = OrderItem.objects.filter(order__customer=OuterRef('pk'), product__category_id=campaign.category_id)
+        if campaign.ordered_since:
+            items = items.filter(order__datetime_created__gte=campaign.ordered_since)
+        customers = customers.filter(Exists(items))
+    return customers
+
+
+def recipient_pages(campaign, page_size, after=0):
+    """Yield pages of ``(customer id, recipient fields)`` in customer id order."""
+    recipients = segment_queryset(campaign) \
+        .order_by('id') \
+        .values_list('id', 'user__email', 'user__username', 'user__first_name', 'user__last_name')
+    while True:
+        page = list(recipients.filter(id__gt=after)[:page_size])
+        if not page:
+            return
+        yield [
+            (customer_id, {'email': email, 'username': username, 'first_name': first_name, 'last_name': last_name})
+            for customer_id, email, username, first_name, last_name in page
+        ]
+        after = page[-1][0]
+
+
+def render_campaign(campaign):
+    """Render the campaign templates once, leaving the recipient placeholders."""
+    context = Context({'campaign': campaign, 'category': campaign.category}, autoescape=False)
+    return (
+        RecipientTemplate(Template(campaign.subject_template).render(context).strip()),
+        RecipientTemplate(Template(campaign.body_template).render(context)),
+    )
+
+
+class ConnectionPool:
+    """
+    Email backend connections shared by the sending threads. A connection
+    that fails to open gives its slot back; ``acquire`` waits at most
+    ``timeout`` seconds for a free connection.
+    """
+
+    def __init__(self, size, timeout=60):
+        self.size = size
+        self.timeout = timeout
+        self._connections = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        return connection
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return self._connections.get_nowait()
+            except Empty:
+                pass
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                return self._open()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'No email connection was free within {self.timeout} seconds.')
+            # Wake up now and then, in case a slot was given back by a connection that failed to open.
+            try:
+                return self._connections.get(timeout=min(remaining, 1))
+            except Empty:
+                pass
+
+    def release(self, connection):
+        self._connections.put(connection)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+def send_batch(pool, subject, body, from_email, recipients):
+    """Send one batch over a pooled connection. Returns the number sent and failed."""
+    connection = pool.acquire()
+    sent = failed = 0
+    try:
+        for recipient in recipients:
+            message = EmailMessage(
+                subject=subject.safe_substitute(recipient),
+                body=body.safe_substitute(recipient),
+                from_email=from_email,
+                to=[recipient['email']],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception:
+                failed += 1
+                # The connection may be broken; the next send opens a new one if this fails.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                sent += 1
+    finally:
+        pool.release(connection)
+    return sent, failed
+
+
+def claim_campaign(campaign):
+    """
+    Claim ``campaign`` if it is queued, or left sending by a worker whose
+    claim expired, and refresh it. Returns whether it was claimed.
+    """
+    now = timezone.now()
+    started = Campaign.objects.filter(pk=campaign.pk, status=Campaign.STATUS_QUEUED).update(
+        status=Campaign.STATUS_SENDING, datetime_started=now, datetime_claimed=now,
+    )
+    if started:
+        Campaign.objects.filter(pk=campaign.pk).update(recipient_count=segment_queryset(campaign).count())
+    else:
+        resumed = Campaign.objects \
+            .filter(pk=campaign.pk, status=Campaign.STATUS_SENDING) \
+            .filter(Q(datetime_claimed__isnull=True) | Q(datetime_claimed__lt=now - CLAIM_TIMEOUT)) \
+            .update(datetime_claimed=now)
+        if not resumed:
+            return False
+    campaign.refresh_from_db()
+    return True
+
+
+def send_campaign(campaign, config=None):
+    """
+    Send ``campaign`` to the rest of its segment and mark it done. Returns
+    the campaign, or ``None`` if another worker is sending it.
+    """
+    config = config or get_config()
+    if not claim_campaign(campaign):
+        return None
+
+    subject, body = render_campaign(campaign)
+    pool = ConnectionPool(config['WORKERS'])
+    try:
+        with ThreadPoolExecutor(max_workers=config['WORKERS']) as executor:
+            for page in recipient_pages(campaign, config['PAGE_SIZE'], after=campaign.last_customer_id):
+                recipients = [recipient for _, recipient in page]
+                batches = [
+                    recipients[start:start + config['BATCH_SIZE']]
+                    for start in range(0, len(recipients), config['BATCH_SIZE'])
+                ]
+                results = list(executor.map(
+                    lambda batch: send_batch(pool, subject, body, settings.DEFAULT_FROM_EMAIL, batch),
+                    batches,
+                ))
+                claimed = campaign.datetime_claimed
+                campaign.datetime_claimed = timezone.now()
+                held = Campaign.objects.filter(pk=campaign.pk, datetime_claimed=claimed).update(
+                    sent_count=F('sent_count') + sum(sent for sent, _ in results),
+                    failed_count=F('failed_count') + sum(failed for _, failed in results),
+                    last_customer_id=page[-1][0],
+                    datetime_claimed=campaign.datetime_claimed,
+                )
+                if not held:
+                    logger.warning('Stopped sending %s: its claim expired and another worker took it over.', campaign)
+                    return None
+    finally:
+        pool.close()
+
+    Campaign.objects.filter(pk=campaign.pk, datetime_claimed=campaign.datetime_claimed) \
+        .update(status=Campaign.STATUS_DONE, datetime_finished=timezone.now())
+    campaign.refresh_from_db()
+    return campaign
+
+
+def send_queued_campaigns(config=None):
+    """Send every queued campaign, and resume the ones whose worker died. Returns those sent."""
+    campaigns = Campaign.objects.filter(status__in=[Campaign.STATUS_QUEUED, Campaign.STATUS_SENDING]).order_by('id')
+    sent = [send_campaign(campaign, config) for campaign in campaigns]
+    return [campaign for campaign in sent if campaign is not None]
@@ -0,0 +1,218 @@
+"""
+Async reads of the catalog: products, categories, pages and team members.
+
+Under ASGI the sync viewsets run each request in a worker thread, so the
+number of threads bounds the number of requests in flight, however long the
+clients take. The views here answer GET and HEAD for the list and detail
+routes of the catalog natively on the event loop with the async ORM and the
+async cache API, and hand other methods, and requests for the browsable API,
+to the viewsets.
+
+Responses carry the same data and headers as the viewsets'. Successful ones
+are cached for ``CACHE_TIMEOUT`` seconds, if it is not 0, under a generation number that is
+bumped whenever a catalog row is saved or deleted, or the comment
+aggregates of products change. Other changes made with ``update()`` show up
+when the entries expire.
+"""
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+DEFAULTS = {
+    'CACHE_TIMEOUT': 30,
+}
+
+GENERATION_KEY = 'catalog:generation'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ASYNC_CATALOG', {})}
+
+
+async def catalog_generation():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        # Start from the clock so entries cached before an eviction are not reused.
+        await cache.aadd(GENERATION_KEY, time.time_ns(), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def search(queryset, request, search_fields):
+    """Filter like DRF's ``SearchFilter``: every term must match one of the fields."""
+    terms = request.GET.get('search', '').replace('\x00', '').replace(',', ' ').split()
+    for term in terms:
+        condition = Q()
+        for field in search_fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def order(queryset, request, ordering_fields):
+    """Order like DRF's ``OrderingFilter``, ignoring unknown fields."""
+    param = request.GET.get('ordering')
+    if not param:
+        return queryset
+    ordering = [term.strip() for term in param.split(',')]
+    ordering = [term for term in ordering if term.lstrip('-') in ordering_fields]
+    return queryset.order_by(*ordering) if ordering else queryset
+
+
+async def paginate(queryset, request, pagination_class):
+    """
+    Return one page of ``queryset`` and the links of DRF's
+    ``PageNumberPagination``, as a list of objects and a dict with ``count``,
+    ``next`` and ``previous``.
+    """
+    pagination = pagination_class()
+    count = await queryset.acount()
+    num_pages = max(1, math.ceil(count / pagination.page_size))
+    page_number = request.GET.get(pagination.page_query_param) or 1
+    if page_number in pagination.last_page_strings:
+        page_number = num_pages
+    try:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message='That page number is not an integer'))
+    if page_number < 1:
+        raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message='That page number is less than 1'))
+    if page_number > num_pages:
+        raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message='That page contains no results'))
+
+    start = (page_number - 1) * pagination.page_size
+    objects = [obj async for obj in queryset[start:start + pagination.page_size].aiterator()]
+
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if page_number < num_pages:
+        next_url = replace_query_param(url, pagination.page_query_param, page_number + 1)
+    if page_number == 2:
+        previous_url = remove_query_param(url, pagination.page_query_param)
+    elif page_number > 2:
+        previous_url = replace_query_param(url, pagination.page_query_param, page_number - 1)
+    return objects, {'count': count, 'next': next_url, 'previous': previous_url}
+
+
+def json_renderer():
+    """Return the first JSON renderer of ``DEFAULT_RENDERER_CLASSES``, as the viewsets would pick."""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer_class, JSONRenderer):
+            return renderer_class()
+    return JSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(json_renderer().render(data), status=status, content_type='application/json')
+
+
+class CatalogView(View):
+    """
+    Async GET and HEAD for one list or detail route of a catalog viewset.
+    ``viewset``, ``actions``, ``basename`` and ``detail`` give the viewset
+    view that answers everything else, as the router would build it.
+    """
+    viewset = None
+    actions = None
+    basename = None
+    detail = False
+    serializer_class = None
+    values_serializer_class = None
+    search_fields = ()
+    ordering_fields = ()
+    pagination_class = None
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        sync_view = cls.viewset.as_view(cls.actions, basename=cls.basename, detail=cls.detail)
+        # DRF views check CSRF themselves, for the requests that need it.
+        return csrf_exempt(super().as_view(sync_view=sync_to_async(sync_view), **initkwargs))
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_headers(self, obj):
+        return {}
+
+    def is_native(self, request):
+        # DRF renders the browsable API for these; leave them to the viewset.
+        return (
+            request.method in ('GET', 'HEAD')
+            and 'format' not in request.GET
+            and 'text/html' not in request.headers.get('Accept', '')
+        )
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.is_native(request):
+            return await self.get(request, **kwargs)
+        return await self.sync_view(request, *args, **kwargs)
+
+    async def get(self, request, pk=None):
+        timeout = get_config()['CACHE_TIMEOUT']
+        key = f'catalog:{await catalog_generation()}:{request.build_absolute_uri()}'
+        cached = await cache.aget(key) if timeout else None
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content, content_type='application/json')
+        else:
+            try:
+                data, headers = await (self.list(request) if pk is None else self.retrieve(request, pk))
+            except NotFound as error:
+                return json_response({'detail': error.detail}, error.status_code)
+            response = json_response(data)
+            if timeout:
+                await cache.aset(key, (response.content, headers), timeout)
+
+        for name, value in headers.items():
+            response[name] = value
+        response['Allow'] = ', '.join(
+            ('GET', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS') if self.detail else ('GET', 'POST', 'HEAD', 'OPTIONS')
+        )
+        response['Vary'] = 'Accept'
+        return response
+
+    async def list(self, request):
+        queryset = order(search(self.get_queryset(), request, self.search_fields), request, self.ordering_fields)
+        context = {'request': request}
+        if self.values_serializer_class is not None:
+            # Rows, rendered without building instances; see store/fast_serializers.py.
+            queryset = self.values_serializer_class.values(queryset)
+
+            def serialize(objects):
+                return self.values_serializer_class(objects, context=context).data
+        else:
+            def serialize(objects):
+                return self.serializer_class(objects, many=True, context=context).data
+
+        if self.pagination_class is None:
+            return serialize([obj async for obj in queryset.aiterator()]), {}
+        objects, links = await paginate(queryset, request, self.pagination_class)
+        return {**links, 'results': serialize(objects)}, {}
+
+    async def retrieve(self, request, pk):
+        queryset = self.get_queryset()
+        try:
+            obj = await queryset.aget(pk=pk)
+        except (queryset.model.DoesNotExist, ValueError, TypeError):
+            raise NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+        return self.serializer_class(obj, context={'request': request}).data, self.get_headers(obj)
@@ -0,0 +1,59 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+from .models import VersionConflict
+
+
+class StaleVersion(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This object was changed by someone else. Reload it and try again.'
+    default_code = 'stale_version'
+
+
+def version_etag(instance):
+    return f'"{instance.version}"'
+
+
+def parse_if_match(header):
+    """Return the version in an ``If-Match`` header, or None for ``*`` or no header."""
+    if header is None or header.strip() == '*':
+        return None
+    value = header.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise ParseError('If-Match must be the ETag of the object, e.g. "3".')
+
+
+class VersionETagMixin:
+    """
+    Optimistic concurrency for viewsets of ``VersionedModel``s.
+
+    Detail responses carry the object version as their ``ETag``. Updates sent
+    with an ``If-Match`` for another version, or that lose the compare-and-swap
+    against a concurrent save, are answered with 409 Conflict.
+    """
+    etag = None
+
+    def get_object(self):
+        instance = super().get_object()
+        self.etag = version_etag(instance)
+        return instance
+
+    def perform_update(self, serializer):
+        expected_version = parse_if_match(self.request.headers.get('If-Match'))
+        if expected_version is not None and expected_version != serializer.instance.version:
+            raise StaleVersion()
+        try:
+            super().perform_update(serializer)
+        except VersionConflict:
+            raise StaleVersion()
+        self.etag = version_etag(serializer.instance)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and request.method != 'DELETE' and status.is_success(response.status_code):
+            response['ETag'] = self.etag
+        return response
@@ -0,0 +1,220 @@
+"""
+Queued email delivery.
+
+Mails sent from request handlers are stored as ``QueuedEmail`` rows instead
+of going to SMTP inline. ``manage.py send_queued_emails`` claims due messages
+in batches, sends each batch over one connection of ``EMAIL_BACKEND`` at no
+more than ``RATE_LIMIT`` messages per second, and retries failures with an
+exponential backoff until ``MAX_ATTEMPTS`` is reached.
+
+Code that builds ``EmailMessage`` objects queues them by sending them through
+``QueuedEmailBackend``; djoser's mails use it through the classes below.
+"""
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from djoser import email as djoser_email
+
+from .models import QueuedEmail
+
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 60,
+    'RATE_LIMIT': None,
+    'LEASE': 300,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_QUEUE', {})}
+
+
+def queued_email(message):
+    """Return an unsaved ``QueuedEmail`` for an ``EmailMessage``."""
+    html_body = ''
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            html_body = content
+    return QueuedEmail(
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+    )
+
+
+def queue_email(subject, body, to, from_email=None, html_body=''):
+    return QueuedEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """An email backend that stores messages in the queue."""
+
+    def send_messages(self, email_messages):
+        QueuedEmail.objects.bulk_create([queued_email(message) for message in email_messages])
+        return len(email_messages)
+
+
+def email_message(queued):
+    message = EmailMultiAlternatives(
+        subject=queued.subject,
+        body=queued.body,
+        from_email=queued.from_email,
+        to=queued.to,
+        cc=queued.cc,
+        bcc=queued.bcc,
+        reply_to=queued.reply_to,
+    )
+    if queued.html_body:
+        if queued.body:
+            message.attach_alternative(queued.html_body, 'text/html')
+        else:
+            message.body = queued.html_body
+            message.content_subtype = 'html'
+    return message
+
+
+def claim_batch(config):
+    """
+    Lease a batch of due messages to this worker. A worker that dies before
+    recording the results leaves them to be claimed again after ``LEASE``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=QueuedEmail.STATUS_QUEUED, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:config['BATCH_SIZE']]
+        )
+        QueuedEmail.objects.filter(id__in=[queued.id for queued in batch]) \
+            .update(next_attempt_at=now + timedelta(seconds=config['LEASE']))
+    return batch
+
+
+def _record_failure(queued, error, config):
+    queued.attempts += 1
+    queued.last_error = f'{type(error).__name__}: {error}'
+    if queued.attempts >= config['MAX_ATTEMPTS']:
+        queued.status = QueuedEmail.STATUS_FAILED
+    else:
+        queued.next_attempt_at = timezone.now() + timedelta(
+            seconds=config['RETRY_DELAY'] * 2 ** (queued.attempts - 1)
+        )
+
+
+def send_queued_batch(config=None, connection=None):
+    """
+    Send one batch of due messages over a single connection. Returns a dict
+    with the number of messages ``sent``, ``retried`` and ``failed``.
+    """
+    config = config or get_config()
+    batch = claim_batch(config)
+    if not batch:
+        return {}
+
+    connection = connection or get_connection(fail_silently=False)
+    interval = 1 / config['RATE_LIMIT'] if config['RATE_LIMIT'] else 0
+    next_send = time.monotonic()
+    try:
+        connection.open()
+    except Exception as error:
+        for queued in batch:
+            _record_failure(queued, error, config)
+    else:
+        for queued in batch:
+            wait = next_send - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_send = time.monotonic() + interval
+            try:
+                connection.send_messages([email_message(queued)])
+            except Exception as error:
+                _record_failure(queued, error, config)
+                # The connection may be broken; the next send opens a new one if this fails.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                queued.attempts += 1
+                queued.status = QueuedEmail.STATUS_SENT
+                queued.datetime_sent = timezone.now()
+                queued.last_error = ''
+        connection.close()
+
+    QueuedEmail.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'datetime_sent']
+    )
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    for queued in batch:
+        if queued.status == QueuedEmail.STATUS_SENT:
+            result['sent'] += 1
+        elif queued.status == QueuedEmail.STATUS_FAILED:
+            result['failed'] += 1
+        else:
+            result['retried'] += 1
+    return result
+
+
+def send_queued_emails(config=None, connection=None):
+    """Send batches until no due message is left."""
+    config = config or get_config()
+    totals = {'sent': 0, 'retried': 0, 'failed': 0}
+    while True:
+        batch = send_queued_batch(config, connection)
+        if not batch:
+            return totals
+        for key, count in batch.items():
+            totals[key] += count
+
+
+def queue_order_confirmation(order):
+    user = get_user_model().objects.only('username', 'first_name', 'email').get(customer__id=order.customer_id)
+    if not user.email:
+        return None
+    items = order.items.select_related('product').only('order', 'quantity', 'price', 'product__name')
+    context = {'order': order, 'items': items, 'user': user}
+    return queue_email(
+        subject=render_to_string('store/emails/order_confirmation_subject.txt', context).strip(),
+        body=render_to_string('store/emails/order_confirmation.txt', context),
+        to=[user.email],
+    )
+
+
+class QueuedEmailMixin:
+    """Makes a djoser email go to the queue instead of ``EMAIL_BACKEND``."""
+
+    def get_connection(self, fail_silently=False):
+        return QueuedEmailBackend(fail_silently=fail_silently)
+
+
+class ActivationEmail(QueuedEmailMixin, djoser_email.ActivationEmail):
+    pass
+
+
+class ConfirmationEmail(QueuedEmailMixin, djoser_email.ConfirmationEmail):
+    pass
+
+
+class PasswordResetEmail(QueuedEmailMixin, djoser_email.PasswordResetEmail):
+    pass
@@ -0,0 +1,269 @@
+"""
+Read-only serializers for list actions that skip model instances.
+
+A ``ValuesSerializer`` renders the rows of ``queryset.values()`` exactly as
+its ``serializer_class``, a DRF serializer, renders the model instances. The
+fields of ``serializer_class`` are compiled once per class into extractors
+that read a row by lookup, e.g. ``category__name`` for
+``source="category.name"``, and convert the value with the field's own
+``to_representation``. Nested serializers become joins, and nested
+serializers with ``many=True`` one query for the rows of all parents.
+Methods of a ``SerializerMethodField`` are written again on the
+``ValuesSerializer`` with the same name and take the row; the lookups they
+read, besides those of the fields, go in ``extra_values``.
+
+``ValuesListMixin`` serves the list action of a viewset with one::
+
+    rows = ProductValuesSerializer.values(queryset)
+    ProductValuesSerializer(rows, context={'request': request}).data
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .serializers import CartItemSerializer, OrderForAdminSerializer, OrderSerializer, ProductSerializer
+
+
+# Fields whose to_representation returns values of this type unchanged.
+PASSTHROUGH = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+}
+
+
+class Compiled:
+
+    def __init__(self, lookups, extractors, related):
+        self.lookups = lookups
+        self.extractors = extractors
+        # (source, related model, foreign key name, child Compiled) of nested many=True serializers.
+        self.related = related
+
+
+def model_field(model, source_attrs):
+    for attr in source_attrs[:-1]:
+        model = model._meta.get_field(attr).related_model
+    return model._meta.get_field(source_attrs[-1])
+
+
+def plain_extractor(key, field):
+    convert = field.to_representation
+    kind = PASSTHROUGH.get(type(field))
+
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if type(field) is serializers.DecimalField and not coerce_to_string and not field.normalize_output:
+        # The database already returns the model field's places, which quantize() would keep.
+        exponent = -field.decimal_places
+
+        def extract(serializer, row):
+            value = row[key]
+            if value is None or (type(value) is Decimal and value.as_tuple().exponent == exponent):
+                return value
+            return convert(value)
+    elif kind is None:
+        def extract(serializer, row):
+            value = row[key]
+            return None if value is None else convert(value)
+    else:
+        def extract(serializer, row):
+            value = row[key]
+            if value is None or type(value) is kind:
+                return value
+            return convert(value)
+    return extract
+
+
+def file_extractor(key, field, storage):
+    # Like FileField.to_representation, from the file name in the row.
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def extract(serializer, row):
+        name = row[key]
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        request = serializer.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+    return extract
+
+
+def nested_extractor(key, extractors):
+    def extract(serializer, row):
+        if row[key] is None:
+            return None
+        return {name: extractor(serializer, row) for name, extractor in extractors}
+    return extract
+
+
+def many_extractor(source, extractors):
+    def extract(serializer, row):
+        return [
+            {name: extractor(serializer, child) for name, extractor in extractors}
+            for child in row[source]
+        ]
+    return extract
+
+
+def method_extractor(method):
+    def extract(serializer, row):
+        return method(serializer, row)
+    return extract
+
+
+def compile_serializer(serializer, model, values_serializer=None, prefix=''):
+    """
+    Return the lookups and extractors of the readable fields of a DRF
+    serializer instance, for rows of ``model`` with lookups under ``prefix``.
+    Method fields are read from ``values_serializer``, which only the
+    outermost serializer has.
+    """
+    lookups = []
+    extractors = []
+    related = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            method = getattr(values_serializer, field.method_name, None)
+            if method is None:
+                raise ImproperlyConfigured(
+                    f'{type(serializer).__name__}.{name}: define {field.method_name}(self, row) on the values serializer.'
+                )
+            extractors.append((name, method_extractor(method)))
+            continue
+        if field.source == '*':
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: source="*" cannot be read from rows.')
+
+        key = prefix + '__'.join(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            if prefix:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: only outermost fields can have many=True.')
+            relation = model._meta.get_field(field.source)
+            child = compile_serializer(field.child, relation.related_model)
+            related.append((field.source, relation.related_model, relation.field.name, child))
+            extractors.append((name, many_extractor(field.source, child.extractors)))
+        elif isinstance(field, serializers.BaseSerializer):
+            nested_model = model_field(model, field.source_attrs).related_model
+            nested = compile_serializer(field, nested_model, prefix=key + '__')
+            # The foreign key itself tells whether there is a related row.
+            lookups += [key, *nested.lookups]
+            extractors.append((name, nested_extractor(key, nested.extractors)))
+        elif isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField)):
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: only primary keys of relations are supported.')
+            lookups.append(key)
+            extractors.append((name, plain_extractor(key, serializers.IntegerField())))
+        elif isinstance(field, serializers.FileField):
+            lookups.append(key)
+            extractors.append((name, file_extractor(key, field, model_field(model, field.source_attrs).storage)))
+        else:
+            lookups.append(key)
+            extractors.append((name, plain_extractor(key, field)))
+
+    if related:
+        lookups.append('pk')
+    return Compiled(list(dict.fromkeys(lookups)), extractors, related)
+
+
+class ValuesSerializer(serializers.BaseSerializer):
+    """
+    Renders rows of ``values()`` like ``serializer_class`` renders instances.
+    Read-only; pass the rows, a list or a values queryset, as the instance.
+    """
+    serializer_class = None
+    extra_values = ()
+
+    @classmethod
+    def compiled(cls):
+        # Per class, not inherited from the class it extends.
+        if '_compiled' not in cls.__dict__:
+            compiled = compile_serializer(cls.serializer_class(), cls.serializer_class.Meta.model, cls)
+            compiled.lookups = list(dict.fromkeys([*compiled.lookups, *cls.extra_values]))
+            cls._compiled = compiled
+        return cls._compiled
+
+    @classmethod
+    def values(cls, queryset):
+        """Return ``queryset`` as the rows this serializer reads."""
+        return queryset.values(*cls.compiled().lookups)
+
+    def to_representation(self, rows):
+        compiled = self.compiled()
+        rows = list(rows)
+        for source, related_model, foreign_key, child in compiled.related:
+            children = {row['pk']: [] for row in rows}
+            if children:
+                # The query of prefetch_related(), without instances.
+                queryset = related_model._default_manager \
+                    .filter(**{f'{foreign_key}__in': list(children)}) \
+                    .values(foreign_key, *child.lookups) \
+                    .order_by('pk')
+                for child_row in queryset:
+                    children[child_row[foreign_key]].append(child_row)
+            for row in rows:
+                row[source] = children[row['pk']]
+
+        extractors = compiled.extractors
+        return [{name: extractor(self, row) for name, extractor in extractors} for row in rows]
+
+
+
+
+class ValuesListMixin:
+    """
+    Serves the list action of a generic viewset from ``values()`` rows with
+    ``get_values_serializer_class()``, if it returns one.
+    """
+    values_serializer_class = None
+
+    def get_values_serializer_class(self):
+        return self.values_serializer_class
+
+    def list(self, request, *args, **kwargs):
+        values_serializer_class = self.get_values_serializer_class()
+        if values_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = values_serializer_class.values(self.filter_queryset(self.get_queryset()))
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(values_serializer_class(page, context=context).data)
+        return Response(values_serializer_class(rows, context=context).data)
+
+
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+    extra_values = [f'ratings_{rating}' for rating in range(1, 6)]
+
+    def get_rating_histogram(self, row):
+        return {
+            str(rating): row[f'ratings_{rating}']
+            for rating in range(1, 6)
+        }
+
+
+
+class CartItemValuesSerializer(ValuesSerializer):
+    serializer_class = CartItemSerializer
+
+    def get_item_total(self, row):
+        return row['quantity'] * row['product__price']
+
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSerializer
+
+
+
+class OrderForAdminValuesSerializer(ValuesSerializer):
+    serializer_class = OrderForAdminSerializer
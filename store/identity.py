@@ -0,0 +1,113 @@
+"""
+Request-scoped resolution of the current customer and permissions.
+
+The customer id and the permission set of the request user are resolved at
+most once per request and kept on the request. Across requests the customer
+id of each user, and each user's permission set, are kept in the shared
+cache. Permission sets are stored under a generation number that is bumped
+whenever user or group permissions or group memberships change, so every
+cached set is dropped at once.
+"""
+import time
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Customer
+
+
+CUSTOMER_ID_TIMEOUT = 24 * 60 * 60
+PERMISSIONS_TIMEOUT = 60 * 60
+PERMISSIONS_GENERATION_KEY = 'auth:perms:generation'
+
+
+def _http_request(request):
+    # DRF requests wrap the HttpRequest, which outlives them in middleware.
+    return getattr(request, '_request', request)
+
+
+def customer_id_key(user_id):
+    return f'store:customer_id:{user_id}'
+
+
+def get_customer_id(request):
+    """Return the id of the request user's customer."""
+    http_request = _http_request(request)
+    if not hasattr(http_request, '_customer_id'):
+        user = request.user
+        customer_id = getattr(user, 'customer_id', None)
+        if customer_id is None:
+            customer_id = cache.get(customer_id_key(user.id))
+        if customer_id is None:
+            customer_id = Customer.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+            if customer_id is not None:
+                cache.set(customer_id_key(user.id), customer_id, CUSTOMER_ID_TIMEOUT)
+        http_request._customer_id = customer_id
+    return http_request._customer_id
+
+
+def get_customer(request):
+    """Return the request user's ``Customer``, loaded once per request."""
+    http_request = _http_request(request)
+    if not hasattr(http_request, '_customer'):
+        http_request._customer = Customer.objects.get(pk=get_customer_id(request))
+    return http_request._customer
+
+
+def forget_customer_id(user_id):
+    cache.delete(customer_id_key(user_id))
+
+
+def permissions_generation():
+    generation = cache.get(PERMISSIONS_GENERATION_KEY)
+    if generation is None:
+        # Start from the clock so sets cached before an eviction are not reused.
+        cache.add(PERMISSIONS_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(PERMISSIONS_GENERATION_KEY)
+    return generation
+
+
+def bump_permissions_generation():
+    try:
+        cache.incr(PERMISSIONS_GENERATION_KEY)
+    except ValueError:
+        cache.set(PERMISSIONS_GENERATION_KEY, time.time_ns(), None)
+
+
+def load_permissions(user_id):
+    """Return the ``app_label.codename`` of every permission the user has directly or through a group."""
+    permissions = Permission.objects.filter(Q(user=user_id) | Q(group__user=user_id)) \
+        .values_list('content_type__app_label', 'codename') \
+        .order_by() \
+        .distinct()
+    return frozenset(f'{app_label}.{codename}' for app_label, codename in permissions)
+
+
+def permissions_key(user_id):
+    return f'auth:perms:{permissions_generation()}:{user_id}'
+
+
+def forget_permissions(user_id):
+    cache.delete(permissions_key(user_id))
+
+
+def get_permissions(request):
+    """Return the permission set of the request user."""
+    http_request = _http_request(request)
+    if not hasattr(http_request, '_permissions'):
+        key = permissions_key(request.user.id)
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = load_permissions(request.user.id)
+            cache.set(key, permissions, PERMISSIONS_TIMEOUT)
+        http_request._permissions = permissions
+    return http_request._permissions
+
+
+def has_perm(request, perm):
+    """Like ``request.user.has_perm(perm)``, with the permissions resolved through the caches."""
+    user = request.user
+    if not (user and user.is_authenticated and user.is_active):
+        return False
+    return user.is_superuser or perm in get_permissions(request)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store.archive import archive_cutoff, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive orders older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of orders moved per transaction.')
+
+    def handle(self, *args, **options):
+        archived = archive_orders(
+            older_than=archive_cutoff(options['days']),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'{archived} orders archived.'))
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure catalog throughput of running servers under many concurrent keep-alive '
+        'connections, e.g. the same code under WSGI and ASGI: '
+        '"benchmark_catalog wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001" after starting '
+        '"gunicorn config.wsgi -w 4 --threads 8 -b :8000" and '
+        '"uvicorn config.asgi:application --workers 4 --port 8001".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='Servers as NAME=URL or URL, benchmarked one after another.')
+        parser.add_argument('--path', default='/store/products/', help='Path and query string to GET.')
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run each target for.')
+        parser.add_argument('--send-delay', type=float, default=0.0,
+                            help='Seconds a slow client waits between the two halves of each request.')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for a response.')
+
+    async def client(self, host, port, request, options, deadline, results):
+        half = len(request) // 2
+        writer = None
+        try:
+            while time.monotonic() < deadline:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), options['timeout'])
+                started = time.perf_counter()
+                if options['send_delay']:
+                    writer.write(request[:half])
+                    await writer.drain()
+                    await asyncio.sleep(options['send_delay'])
+                    writer.write(request[half:])
+                else:
+                    writer.write(request)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(self.read_response(reader), options['timeout'])
+                results['latencies'].append(time.perf_counter() - started)
+                results['statuses'][status] = results['statuses'].get(status, 0) + 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as error:
+            name = type(error).__name__
+            results['errors'][name] = results['errors'].get(name, 0) + 1
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def read_response(self, reader):
+        """Read one response and return its status and whether the connection stays open."""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.read()
+            return status, False
+        return status, headers.get('connection', '').lower() != 'close'
+
+    async def run_target(self, url, options):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'Only http:// URLs can be benchmarked, got {url!r}.')
+        host, port = parts.hostname, parts.port or 80
+        request = (
+            f'GET {options["path"]} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            'Accept: application/json\r\n'
+            'Connection: keep-alive\r\n\r\n'
+        ).encode()
+
+        results = {'latencies': [], 'statuses': {}, 'errors': {}}
+        started = time.monotonic()
+        deadline = started + options['duration']
+        await asyncio.gather(*[
+            self.client(host, port, request, options, deadline, results)
+            for _ in range(options['connections'])
+        ])
+        elapsed = time.monotonic() - started
+
+        latencies = sorted(results['latencies'])
+        return {
+            'url': url + options['path'],
+            'connections': options['connections'],
+            'seconds': round(elapsed, 3),
+            'requests': len(latencies),
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'latency_ms': {
+                name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+                for name, fraction in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]
+            },
+            'statuses': {str(status): count for status, count in sorted(results['statuses'].items())},
+            'errors': results['errors'],
+        }
+
+    def handle(self, *args, **options):
+        report = {}
+        for target in options['targets']:
+            name, separator, url = target.partition('=')
+            if not separator:
+                name = url = target
+            report[name] = asyncio.run(self.run_target(url.rstrip('/'), options))
+        self.stdout.write(json.dumps(report, indent=2))
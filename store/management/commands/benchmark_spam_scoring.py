@@ -0,0 +1,81 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Category, Comment, Product
+from store.spam import get_config, load_scorers, score_pending_batch
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure spam scoring throughput on synthetic comments. '
+        'Everything is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def synthetic_comments(self, count, products, rng):
+        words = ['great', 'pen', 'paper', 'quality', 'fast', 'delivery', 'blue', 'ink', 'cheap', 'sturdy']
+        spam = ['casino bonus, click here http://spam.example', 'free money www.example.com buy now']
+        for number in range(count):
+            if rng.random() < 0.1:
+                body = rng.choice(spam)
+            else:
+                body = ' '.join(rng.choices(words, k=12)) + f' #{number}'
+            yield Comment(
+                product=rng.choice(products),
+                name=f'reader{rng.randrange(count // 5 or 1)}',
+                body=body,
+                body_hash=Comment.hash_body(body),
+                ip_address=f'10.0.{rng.randrange(256)}.{rng.randrange(256)}',
+            )
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['batch_size']:
+            config['BATCH_SIZE'] = options['batch_size']
+        rng = random.Random(options['seed'])
+
+        try:
+            with transaction.atomic():
+                category = Category.objects.create(name='Benchmark category')
+                products = Product.objects.bulk_create([
+                    Product(name=f'Benchmark product {number}', description='', price=1, category=category)
+                    for number in range(100)
+                ])
+                Comment.objects.bulk_create(
+                    self.synthetic_comments(options['comments'], products, rng),
+                    batch_size=5000,
+                )
+
+                scorers = load_scorers(config)
+                started = time.perf_counter()
+                totals = {'scored': 0, 'approved': 0, 'rejected': 0}
+                while True:
+                    batch = score_pending_batch(scorers, config)
+                    if not batch:
+                        break
+                    for key in totals:
+                        totals[key] += batch[key]
+                elapsed = time.perf_counter() - started
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write(json.dumps({
+            'comments': options['comments'],
+            'batch_size': config['BATCH_SIZE'],
+            'seconds': round(elapsed, 3),
+            'comments_per_second': round(totals['scored'] / elapsed, 1) if elapsed else None,
+            **totals,
+        }, indent=2))
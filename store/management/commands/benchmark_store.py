@@ -0,0 +1,102 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from store.benchmarks import SCENARIOS, ClientSession, ServerSession, compare, get_context, row_counts, run_scenario
+
+
+class Rollback(Exception):
+    pass
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Run request scenarios against the data of "generate_benchmark_data" and report p50/p95/p99 '
+        'latency and queries per request as JSON. Without --server the requests go through the test '
+        'client in this process and everything they write is rolled back. Keep the data, --seed and '
+        '--requests the same to compare commits, e.g. with --output before.json on one commit and '
+        '--compare before.json on the next.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run, all by default: {", ".join(SCENARIOS)}.')
+        parser.add_argument('--server', help='URL of a running server to send the requests to, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests sent first per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='File to write the report to, besides standard output.')
+        parser.add_argument('--compare', help='Report of an earlier run to compare with.')
+
+    def run(self, options):
+        try:
+            context = get_context()
+            results = {}
+            for name in options['scenarios'] or list(SCENARIOS):
+                session = ServerSession(options['server']) if options['server'] else ClientSession()
+                self.stderr.write(f'Running {name}.')
+                results[name] = run_scenario(
+                    name, session, context,
+                    requests=options['requests'], warmup=options['warmup'], seed=options['seed'],
+                )
+            return results
+        except ValueError as error:
+            raise CommandError(error)
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}.')
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING('DEBUG is on, so the numbers include its overhead.'))
+        report = {
+            'environment': {
+                'commit': current_commit(),
+                'target': options['server'] or 'test client',
+                'database': connection.vendor,
+                'debug': bool(settings.DEBUG),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'rows': row_counts(),
+            },
+        }
+
+        if options['server']:
+            report['scenarios'] = self.run(options)
+        else:
+            try:
+                with transaction.atomic():
+                    report['scenarios'] = self.run(options)
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            if baseline.get('environment', {}).get('rows') != report['environment']['rows']:
+                self.stderr.write(self.style.WARNING('The baseline was measured on different data.'))
+            report['changes'] = compare(report, baseline)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
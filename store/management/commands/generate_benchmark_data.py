@@ -0,0 +1,40 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.benchmarks import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic categories, products, customers, carts and orders for '
+        '"benchmark_store". The same arguments on the same database create the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--customers', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=10000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--items-per-order', type=int, default=3, help='Average number of items of an order.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of rows inserted per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = generate(
+            products=options['products'],
+            customers=options['customers'],
+            carts=options['carts'],
+            orders=options['orders'],
+            items_per_order=options['items_per_order'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            log=self.stderr.write,
+        )
+        self.stdout.write(json.dumps({
+            'created': created,
+            'seed': options['seed'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }, indent=2))
@@ -0,0 +1,37 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from store.provisioning import provision_customers
+
+
+class Command(BaseCommand):
+    help = ('Create users and customers from a CSV file with a header row and the columns username, email '
+            'and optionally password, first_name, last_name, phone_number and birth_date (YYYY-MM-DD).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path of the CSV file, or - to read standard input.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of users inserted per transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes hashing passwords (one per CPU by default).')
+
+    def handle(self, *args, **options):
+        if options['csv_file'] == '-':
+            rows = list(csv.DictReader(sys.stdin))
+        else:
+            with open(options['csv_file'], newline='') as csv_file:
+                rows = list(csv.DictReader(csv_file))
+
+        for line, row in enumerate(rows, start=2):
+            if not row.get('username') or not row.get('email'):
+                raise CommandError(f'Line {line}: username and email are required.')
+            row['birth_date'] = parse_date(row['birth_date']) if row.get('birth_date') else None
+
+        result = provision_customers(rows, chunk_size=options['chunk_size'], workers=options['workers'])
+
+        for skipped in result['skipped']:
+            self.stderr.write(f'Skipped {skipped["username"]}: {skipped["reason"]}.')
+        self.stdout.write(self.style.SUCCESS(f'{len(result["created"])} customers created.'))
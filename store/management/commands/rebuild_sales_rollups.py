@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the sales rollups behind /store/analytics/ from all orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of order ids aggregated per chunk.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of chunks aggregated in parallel.')
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(chunk_size=options['chunk_size'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'{written} rollup rows written.'))
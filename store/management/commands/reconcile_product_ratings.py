@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from store.aggregates import recompute_product_aggregates
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute comment counts and ratings of all products from their approved comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of products recomputed per transaction.')
+
+    def handle(self, *args, **options):
+        reconciled = 0
+        last_id = 0
+        while True:
+            product_ids = list(
+                Product.objects.filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not product_ids:
+                break
+            reconciled += recompute_product_aggregates(product_ids)
+            last_id = product_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{reconciled} products reconciled.'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.models import ProvisioningJob
+from store.provisioning import run_queued_provisioning_jobs
+
+
+class Command(BaseCommand):
+    help = 'Create the users and customers of queued provisioning jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of users inserted per transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes hashing passwords of rows queued without a hash (one per CPU by default).')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and look for queued jobs every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            for job in run_queued_provisioning_jobs(options['chunk_size'], options['workers']):
+                if job.status == ProvisioningJob.STATUS_FAILED:
+                    self.stderr.write(f'{job}: failed.')
+                    continue
+                self.stdout.write(f'{job}: {len(job.created)} of {job.row_count} created, {len(job.skipped)} skipped.')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.spam import score_pending_comments
+
+
+class Command(BaseCommand):
+    help = 'Score waiting comments for spam and approve or reject the clear cases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and look for new comments every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = score_pending_comments()
+            self.stdout.write(
+                f'{totals["scored"]} comments scored, '
+                f'{totals["approved"]} approved, {totals["rejected"]} rejected.'
+            )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
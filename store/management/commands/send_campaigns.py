@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.campaigns import send_queued_campaigns
+
+
+class Command(BaseCommand):
+    help = 'Send started marketing campaigns and resume interrupted ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and look for started campaigns every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            for campaign in send_queued_campaigns():
+                self.stdout.write(
+                    f'{campaign}: {campaign.sent_count} of {campaign.recipient_count} sent, '
+                    f'{campaign.failed_count} failed.'
+                )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
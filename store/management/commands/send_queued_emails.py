@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.emails import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails in batches over one connection per batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and look for new emails every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = send_queued_emails()
+            self.stdout.write(
+                f'{totals["sent"]} emails sent, {totals["retried"]} to be retried, {totals["failed"]} failed.'
+            )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
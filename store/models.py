@@ -1,7 +1,52 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils.timezone import now
 
 from uuid import uuid4
+import hashlib
+
+
+
+class VersionConflict(Exception):
+    """Raised when a versioned row was saved by someone else since it was loaded."""
+
+
+
+class VersionedModel(models.Model):
+    """
+    Model saved with a compare-and-swap on ``version``.
+
+    An update only matches the row if it still has the version this instance
+    was loaded with and bumps the version in the same statement.
+
+    Saves limited to ``update_fields`` that do not include ``version`` skip the
+    check and leave the version alone, so bookkeeping such as
+    ``Order.update_totals`` never conflicts with an edit. A partial save that
+    must not overwrite a concurrent edit has to list ``version`` too.
+    """
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Deliberately unchecked, see the class docstring.
+        if update_fields is not None and 'version' not in update_fields:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        expected_version = self.version
+        values = [
+            (field, model, expected_version + 1 if field.attname == 'version' else value)
+            for field, model, value in values
+        ]
+        if super()._do_update(base_qs.filter(version=expected_version), using, pk_val, values, update_fields, forced_update):
+            self.version = expected_version + 1
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(f'{self._meta.object_name} {pk_val} was changed since version {expected_version}.')
+        return False
 
 
 
@@ -20,7 +65,7 @@ class Discount(models.Model):
 
 
 
-class Product(models.Model):
+class Product(VersionedModel):
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -29,6 +74,30 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     discounts = models.ManyToManyField(Discount, blank=True)
+    approved_comments_count = models.PositiveIntegerField(default=0, editable=False)
+    rating = models.FloatField(null=True, blank=True, db_index=True, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    ratings_1 = models.PositiveIntegerField(default=0, editable=False)
+    ratings_2 = models.PositiveIntegerField(default=0, editable=False)
+    ratings_3 = models.PositiveIntegerField(default=0, editable=False)
+    ratings_4 = models.PositiveIntegerField(default=0, editable=False)
+    ratings_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    # Only written by the F() updates in store/aggregates.py.
+    AGGREGATE_FIELDS = ['approved_comments_count', 'rating', 'rating_sum', 'rating_count'] + [
+        f'ratings_{rating}' for rating in range(1, 6)
+    ]
+
+    def save(self, *args, **kwargs):
+        # A full save of a loaded product would write back the aggregates it was loaded with.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name not in self.AGGREGATE_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -53,7 +122,7 @@ class Customer(models.Model):
         ]
 
 
-class Order(models.Model):
+class Order(VersionedModel):
     ORDER_STATUS_PAID = 'p'
     ORDER_STATUS_UNPAID = 'u'
     ORDER_STATUS_CANCELED = 'c'
@@ -62,10 +131,34 @@ class Order(models.Model):
         (ORDER_STATUS_UNPAID,'Unpaid'),
         (ORDER_STATUS_CANCELED,'Canceled'),
     ]
+    ALLOWED_STATUS_TRANSITIONS = {
+        ORDER_STATUS_UNPAID: [ORDER_STATUS_PAID, ORDER_STATUS_CANCELED],
+    }
     
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='orders')
-    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_created = models.DateTimeField(auto_now_add=True, db_index=True)
     status = models.CharField(max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        # post_save moves the order in the sales rollups; keep that in the same transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def can_change_status(self, new_status):
+        """Whether the order may go from its status to ``new_status``; keeping the status always may."""
+        return new_status == self.status or new_status in self.ALLOWED_STATUS_TRANSITIONS.get(self.status, [])
+
+    def update_totals(self):
+        """Recompute the denormalized totals from the order items and save them."""
+        totals = self.items.aggregate(
+            total_amount=models.Sum(models.F('price') * models.F('quantity')),
+            item_count=models.Count('id'),
+        )
+        self.total_amount = totals['total_amount'] or 0
+        self.item_count = totals['item_count']
+        self.save(update_fields=['total_amount', 'item_count'])
 
 
 
@@ -88,6 +181,30 @@ class OrderItem(models.Model):
 
 
 
+class ArchivedOrder(models.Model):
+    # The id the order had in the hot table, which the API keeps showing.
+    original_id = models.BigIntegerField(unique=True)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='archived_orders')
+    datetime_created = models.DateTimeField(db_index=True)
+    status = models.CharField(max_length=1, choices=Order.ORDER_STATUS)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    datetime_archived = models.DateTimeField(auto_now_add=True)
+
+
+
+class ArchivedOrderItem(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.PositiveSmallIntegerField()
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product.name}'
+
+
+
 class Address(models.Model):
     customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True)
     province = models.CharField(max_length=255)
@@ -129,8 +246,27 @@ class Comment(models.Model):
     product = models.ForeignKey(Product,on_delete=models.CASCADE , related_name='comments')
     name = models.CharField(max_length=255)
     body = models.TextField()
+    rating = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(5)])
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=2, choices=COMMENT_STATUS, default=COMMENT_STATUS_WAITING)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    body_hash = models.CharField(max_length=40, db_index=True, editable=False)
+    spam_score = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'status', 'datetime_created']),
+            models.Index(fields=['status', 'datetime_created']),
+        ]
+
+    @staticmethod
+    def hash_body(body):
+        normalized = ' '.join(body.lower().split())
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.body_hash = Comment.hash_body(self.body)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Comment by {self.name} on {self.product.name}"
@@ -152,4 +288,152 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f'{self.quantity} x {self.product.name}'
-        
\ No newline at end of file
+        
+
+
+class SalesRollup(models.Model):
+    PERIOD_DAY = 'd'
+    PERIOD_WEEK = 'w'
+    PERIOD_MONTH = 'm'
+    PERIODS = [
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_WEEK, 'Week'),
+        (PERIOD_MONTH, 'Month'),
+    ]
+
+    DIMENSION_ALL = 'all'
+    DIMENSION_CATEGORY = 'category'
+    DIMENSION_CUSTOMER = 'customer'
+    DIMENSIONS = [
+        (DIMENSION_ALL, 'All sales'),
+        (DIMENSION_CATEGORY, 'Category'),
+        (DIMENSION_CUSTOMER, 'Customer'),
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIODS)
+    period_start = models.DateField()
+    dimension = models.CharField(max_length=8, choices=DIMENSIONS)
+    dimension_id = models.PositiveBigIntegerField(default=0)
+    order_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['period', 'dimension', 'dimension_id', 'period_start']]
+
+    def __str__(self):
+        return f'{self.get_period_display()} {self.period_start} {self.dimension}={self.dimension_id}'
+
+
+
+class SalesRollupFence(models.Model):
+    """
+    A single row locked by every change to the sales rollups and by a whole
+    rebuild of them, so that a rebuild never loses or repeats an increment;
+    see ``store.analytics.lock_rollups``.
+    """
+
+
+
+class QueuedEmail(models.Model):
+    STATUS_QUEUED = 'q'
+    STATUS_SENT = 's'
+    STATUS_FAILED = 'f'
+    STATUSES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.TextField()
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=1, choices=STATUSES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
+
+
+
+class Campaign(models.Model):
+    SEGMENT_ALL = 'all'
+    SEGMENT_CATEGORY = 'category'
+    SEGMENTS = [
+        (SEGMENT_ALL, 'All customers'),
+        (SEGMENT_CATEGORY, 'Customers who ordered in a category'),
+    ]
+
+    STATUS_DRAFT = 'd'
+    STATUS_QUEUED = 'q'
+    STATUS_SENDING = 's'
+    STATUS_DONE = 'x'
+    STATUSES = [
+        (STATUS_DRAFT, 'Draft'),
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    name = models.CharField(max_length=255)
+    subject_template = models.CharField(max_length=255)
+    body_template = models.TextField()
+    segment = models.CharField(max_length=8, choices=SEGMENTS, default=SEGMENT_ALL)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    ordered_since = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=1, choices=STATUSES, default=STATUS_DRAFT)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    recipient_count = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+    last_customer_id = models.PositiveBigIntegerField(default=0, editable=False)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_started = models.DateTimeField(null=True, blank=True, editable=False)
+    datetime_claimed = models.DateTimeField(null=True, blank=True, editable=False)
+    datetime_finished = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return self.name
+
+
+
+class ProvisioningJob(models.Model):
+    STATUS_QUEUED = 'q'
+    STATUS_RUNNING = 'r'
+    STATUS_DONE = 'x'
+    STATUS_FAILED = 'f'
+    STATUSES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # Holds the rows with password hashes, never passwords, until the job has run or failed, then emptied.
+    rows = models.JSONField(default=list, encoder=DjangoJSONEncoder, editable=False)
+    row_count = models.PositiveIntegerField(default=0, editable=False)
+    status = models.CharField(max_length=1, choices=STATUSES, default=STATUS_QUEUED)
+    created = models.JSONField(default=list, editable=False)
+    skipped = models.JSONField(default=list, editable=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_claimed = models.DateTimeField(null=True, blank=True, editable=False)
+    datetime_finished = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f'Provisioning job {self.pk}'
@@ -0,0 +1,71 @@
+"""
+Bulk moderation of waiting comments.
+
+Each decision is applied to all its comments with one ``UPDATE`` guarded by
+the waiting status, and the comment aggregates of the affected products are
+updated in the same transaction.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .aggregates import comment_aggregates, update_product_aggregates
+from .models import Comment
+
+
+SKIPPED_NOT_FOUND = 'not found'
+SKIPPED_ALREADY_MODERATED = 'already moderated'
+
+
+def moderate_comments(approve=(), reject=()):
+    """
+    Approve and reject waiting comments by id.
+
+    Returns a dict with the ``approved`` and ``rejected`` comment ids and the
+    ``skipped`` ones, each with the reason it was skipped.
+    """
+    decisions = {
+        Comment.COMMENT_STATUS_APPROVED: list(dict.fromkeys(approve)),
+        Comment.COMMENT_STATUS_NOT_APPROVED: list(dict.fromkeys(reject)),
+    }
+    requested = decisions[Comment.COMMENT_STATUS_APPROVED] + decisions[Comment.COMMENT_STATUS_NOT_APPROVED]
+
+    with transaction.atomic():
+        comments = Comment.objects.select_for_update() \
+            .filter(id__in=requested) \
+            .order_by('id') \
+            .values_list('id', 'product_id', 'status', 'rating')
+        found = {}
+        waiting = {}
+        for comment_id, product_id, status, rating in comments:
+            found[comment_id] = status
+            if status == Comment.COMMENT_STATUS_WAITING:
+                waiting[comment_id] = (product_id, rating)
+
+        moderated = {}
+        for new_status, comment_ids in decisions.items():
+            moderated[new_status] = [comment_id for comment_id in comment_ids if comment_id in waiting]
+            if moderated[new_status]:
+                Comment.objects.filter(
+                    id__in=moderated[new_status],
+                    status=Comment.COMMENT_STATUS_WAITING,
+                ).update(status=new_status)
+
+        deltas = defaultdict(Counter)
+        for comment_id in moderated[Comment.COMMENT_STATUS_APPROVED]:
+            product_id, rating = waiting[comment_id]
+            deltas[product_id].update(comment_aggregates(Comment.COMMENT_STATUS_APPROVED, rating))
+        update_product_aggregates(deltas)
+
+    skipped = []
+    for comment_id in dict.fromkeys(requested):
+        if comment_id not in found:
+            skipped.append({'id': comment_id, 'reason': SKIPPED_NOT_FOUND})
+        elif comment_id not in waiting:
+            skipped.append({'id': comment_id, 'reason': SKIPPED_ALREADY_MODERATED})
+
+    return {
+        'approved': moderated[Comment.COMMENT_STATUS_APPROVED],
+        'rejected': moderated[Comment.COMMENT_STATUS_NOT_APPROVED],
+        'skipped': skipped,
+    }
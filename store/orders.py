@@ -0,0 +1,77 @@
+"""
+Bulk order status transitions.
+
+Only the transitions in ``Order.ALLOWED_STATUS_TRANSITIONS`` are applied.
+The requested orders are checked with one query and moved with one
+``UPDATE`` per source status, guarded by that status so a concurrent change
+is skipped instead of overwritten.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from . import analytics
+from .models import Order
+from .signals import orders_status_changed
+
+
+SKIPPED_NOT_FOUND = 'not found'
+SKIPPED_INVALID_TRANSITION = 'invalid transition'
+
+
+def change_orders_status(order_ids, new_status):
+    """
+    Move the given orders to ``new_status``.
+
+    Returns a dict with the ``updated`` order ids and the ``skipped`` ones,
+    each with the reason it was skipped. The sales rollups are moved in the
+    same transaction, and ``orders_status_changed`` is sent once per source
+    status with all orders that were moved from it.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    allowed_from = [
+        status for status, targets in Order.ALLOWED_STATUS_TRANSITIONS.items()
+        if new_status in targets
+    ]
+
+    with transaction.atomic():
+        orders = Order.objects.select_for_update() \
+            .filter(id__in=order_ids) \
+            .only('id', 'status', 'customer_id', 'datetime_created') \
+            .order_by('id')
+        orders_by_status = defaultdict(list)
+        found = {}
+        for order in orders:
+            found[order.id] = order
+            if order.status in allowed_from:
+                orders_by_status[order.status].append(order)
+
+        for old_status, status_orders in orders_by_status.items():
+            Order.objects.filter(
+                id__in=[order.id for order in status_orders],
+                status=old_status,
+            ).update(status=new_status, version=F('version') + 1)
+
+        # Still in the transaction, so the sales rollups move with the orders or not at all.
+        updated = set()
+        for old_status, status_orders in orders_by_status.items():
+            analytics.record_status_change(status_orders, old_status, new_status)
+            for order in status_orders:
+                order.status = new_status
+                updated.add(order.id)
+            orders_status_changed.send_robust(
+                Order,
+                orders=status_orders,
+                old_status=old_status,
+                new_status=new_status,
+            )
+
+    skipped = []
+    for order_id in order_ids:
+        if order_id not in found:
+            skipped.append({'id': order_id, 'reason': SKIPPED_NOT_FOUND})
+        elif order_id not in updated:
+            skipped.append({'id': order_id, 'reason': SKIPPED_INVALID_TRANSITION})
+
+    return {'updated': sorted(updated), 'skipped': skipped}
@@ -1,5 +1,97 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class CommentCursorPagination(CursorPagination):
+    page_size = 20
+    ordering = '-datetime_created'
+
+
+class ModerationQueuePagination(CursorPagination):
+    page_size = 100
+    ordering = 'datetime_created'
+
+
+class MergedCursorPagination(BasePagination):
+    """
+    Pages forward through several querysets sorted on the same fields as if
+    they were one, e.g. orders and archived orders.
+
+    Every page reads at most ``page_size + 1`` rows from each queryset, after
+    the sort key of the last row of the previous page, and merges them. The
+    ``tiebreaker``, the primary key by default or an integer annotation of
+    every queryset, breaks ties, so it must be unique across the querysets.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_querysets(self, querysets, request, ordering, tiebreaker='pk'):
+        self.request = request
+        self.tiebreaker = tiebreaker
+        self.ordering = [*ordering, tiebreaker]
+        position = self.decode_cursor(querysets[0].model)
+
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                queryset = queryset.filter(self.after(position))
+            rows.extend(queryset[:self.page_size + 1])
+        for field in reversed(self.ordering):
+            rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def after(self, position):
+        condition = None
+        for field, value in reversed(list(zip(self.ordering, position))):
+            name = field.lstrip('-')
+            beyond = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value})
+            condition = beyond if condition is None else beyond | Q(**{name: value}) & condition
+        return condition
+
+    def decode_cursor(self, model):
+        encoded = self.request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        fields = [
+            model._meta.pk if field == self.tiebreaker else model._meta.get_field(field.lstrip('-'))
+            for field in self.ordering
+        ]
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(encoded)
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [str(attrgetter(field.lstrip('-'))(last)) for field in self.ordering]
+        encoded = urlsafe_b64encode(json.dumps(values).encode()).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -1,9 +1,11 @@
 from rest_framework import permissions
 
+from .identity import has_perm
+
 
 class SendPrivateEmailToCustomerPermission(permissions.BasePermission):
     def has_permission(self, request, view):
-        return bool(request.user and request.user.has_perm('store.send_private_email')) 
+        return has_perm(request, 'store.send_private_email') 
 
 
 
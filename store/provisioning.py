@@ -0,0 +1,225 @@
+"""
+Bulk creation of users and their customers.
+
+Creating users one by one runs the password hasher in series and an INSERT
+for the user plus one for its customer from the ``post_save`` receiver.
+``provision_customers`` hashes all passwords in a process pool first and
+then inserts users and customers with ``bulk_create`` in chunks.
+``bulk_create`` sends no ``post_save``, so the per-row customer receiver
+never runs for these users and nothing has to be disconnected; each chunk
+creates its customers itself in the same transaction as its users.
+
+A user created by someone else between the duplicate check and the INSERT
+of its chunk makes the chunk fall back to one row per savepoint, and the
+conflicting rows are reported as skipped like the other duplicates.
+
+The API does not provision inline: ``queue_provisioning`` hashes the
+passwords, stores the rows with their hashes, never the passwords, as a
+``ProvisioningJob``, and ``manage.py run_provisioning_jobs`` runs queued jobs,
+empties their rows and records their result. A worker claims a job for
+``CLAIM_TIMEOUT``; a job still running after that is taken to belong to a
+worker that died and is claimed again. Users the dead worker had already
+created are then reported as duplicates.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import logging
+import os
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Customer, ProvisioningJob
+
+
+logger = logging.getLogger(__name__)
+
+SKIPPED_DUPLICATE_USERNAME = 'duplicate username'
+SKIPPED_DUPLICATE_EMAIL = 'duplicate email'
+
+USER_FIELDS = ['username', 'email', 'first_name', 'last_name']
+CUSTOMER_FIELDS = ['phone_number', 'birth_date']
+
+CLAIM_TIMEOUT = datetime.timedelta(hours=1)
+
+
+def _setup_worker(settings_module):
+    # Workers started with "spawn" do not inherit the configured settings.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Hash ``passwords`` with the default hasher, in ``workers`` processes
+    (one per CPU by default). ``None`` passwords become unusable passwords.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_setup_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),),
+    ) as executor:
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def hash_rows(rows, workers=None):
+    """Return copies of ``rows`` with their ``password`` replaced by a ``password_hash``."""
+    rows = [dict(row) for row in rows]
+    password_hashes = hash_passwords([row.pop('password', None) or None for row in rows], workers)
+    for row, password_hash in zip(rows, password_hashes):
+        row['password_hash'] = password_hash
+    return rows
+
+
+def _skip_duplicates(rows):
+    User = get_user_model()
+    usernames = {row['username'] for row in rows}
+    emails = {row['email'] for row in rows}
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+
+    accepted = []
+    skipped = []
+    for row in rows:
+        if row['username'] in taken_usernames:
+            skipped.append({'username': row['username'], 'reason': SKIPPED_DUPLICATE_USERNAME})
+        elif row['email'] in taken_emails:
+            skipped.append({'username': row['username'], 'reason': SKIPPED_DUPLICATE_EMAIL})
+        else:
+            taken_usernames.add(row['username'])
+            taken_emails.add(row['email'])
+            accepted.append(row)
+    return accepted, skipped
+
+
+def _insert(rows, password_hashes):
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(password=password_hash, **{field: row.get(field, '') for field in USER_FIELDS})
+        for row, password_hash in zip(rows, password_hashes)
+    ])
+    # MySQL does not return the ids of bulk inserted rows.
+    user_ids = dict(
+        User.objects.filter(username__in=[row['username'] for row in rows]).values_list('username', 'id')
+    )
+    Customer.objects.bulk_create([
+        Customer(
+            user_id=user_ids[row['username']],
+            phone_number=row.get('phone_number') or '',
+            birth_date=row.get('birth_date'),
+        )
+        for row in rows
+    ])
+
+
+def _create_chunk(rows, password_hashes):
+    """Insert the rows of a chunk; returns the ``created`` usernames and the ``skipped`` rows."""
+    try:
+        with transaction.atomic():
+            _insert(rows, password_hashes)
+        return [row['username'] for row in rows], []
+    except IntegrityError:
+        pass
+
+    User = get_user_model()
+    created = []
+    skipped = []
+    for row, password_hash in zip(rows, password_hashes):
+        try:
+            with transaction.atomic():
+                _insert([row], [password_hash])
+        except IntegrityError:
+            taken = User.objects.filter(username=row['username']).exists()
+            skipped.append({
+                'username': row['username'],
+                'reason': SKIPPED_DUPLICATE_USERNAME if taken else SKIPPED_DUPLICATE_EMAIL,
+            })
+        else:
+            created.append(row['username'])
+    return created, skipped
+
+
+def provision_customers(rows, chunk_size=1000, workers=None):
+    """
+    Create a user and a customer for each row, a dict with ``username``,
+    ``email`` and optionally ``password``, ``first_name``, ``last_name``,
+    ``phone_number`` and ``birth_date``. Rows from ``hash_rows`` carry a
+    ``password_hash`` instead of a ``password``.
+
+    Rows whose username or email is taken, or repeats an earlier row, are
+    skipped. Returns a dict with the ``created`` usernames and the
+    ``skipped`` ones, each with the reason it was skipped.
+    """
+    rows, skipped = _skip_duplicates(list(rows))
+    unhashed = [row for row in rows if 'password_hash' not in row]
+    new_hashes = iter(hash_passwords([row.get('password') or None for row in unhashed], workers))
+    password_hashes = [row['password_hash'] if 'password_hash' in row else next(new_hashes) for row in rows]
+
+    created = []
+    for start in range(0, len(rows), chunk_size):
+        chunk_created, chunk_skipped = _create_chunk(
+            rows[start:start + chunk_size], password_hashes[start:start + chunk_size],
+        )
+        created += chunk_created
+        skipped += chunk_skipped
+
+    return {
+        'created': created,
+        'skipped': skipped,
+    }
+
+
+def queue_provisioning(rows, created_by=None, workers=None):
+    """Queue a job for ``rows``, whose passwords are hashed first so that the job does not hold them."""
+    rows = hash_rows(rows, workers)
+    return ProvisioningJob.objects.create(rows=rows, row_count=len(rows), created_by=created_by)
+
+
+def _finish(job, status, **fields):
+    job.rows = []
+    job.status = status
+    job.datetime_finished = timezone.now()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=['rows', 'status', 'datetime_finished', *fields])
+    return job
+
+
+def run_provisioning_job(job, chunk_size=1000, workers=None):
+    """Provision the rows of a claimed ``job``, then record its result and drop its rows."""
+    try:
+        result = provision_customers(job.rows, chunk_size, workers)
+    except Exception:
+        logger.exception('Provisioning job %s failed.', job.pk)
+        return _finish(job, ProvisioningJob.STATUS_FAILED)
+    return _finish(job, ProvisioningJob.STATUS_DONE, created=result['created'], skipped=result['skipped'])
+
+
+def claimable_jobs(now=None):
+    """Queued jobs and running jobs whose claim has expired."""
+    expired = (now or timezone.now()) - CLAIM_TIMEOUT
+    return ProvisioningJob.objects.filter(
+        Q(status=ProvisioningJob.STATUS_QUEUED)
+        | Q(status=ProvisioningJob.STATUS_RUNNING, datetime_claimed__lt=expired)
+    )
+
+
+def run_queued_provisioning_jobs(chunk_size=1000, workers=None):
+    """Run every queued job no other worker has claimed, and jobs whose worker died. Returns them."""
+    jobs = []
+    for job_id in claimable_jobs().order_by('id').values_list('id', flat=True):
+        now = timezone.now()
+        claimed = claimable_jobs(now).filter(pk=job_id) \
+            .update(status=ProvisioningJob.STATUS_RUNNING, datetime_claimed=now)
+        if claimed:
+            jobs.append(run_provisioning_job(ProvisioningJob.objects.get(pk=job_id), chunk_size, workers))
+    return jobs
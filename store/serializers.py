@@ -2,6 +2,9 @@ from rest_framework import serializers
 
 from django.utils.text import slugify
 from django.db import transaction
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.template import Template, TemplateSyntaxError
 
 from .models import *
 
@@ -9,12 +12,17 @@ from .models import *
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    num_of_products = serializers.IntegerField(source='products.count', read_only=True)
+    num_of_products = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
         fields = ["id", "name", "description", "num_of_products"]
 
+    def get_num_of_products(self, category):
+        # Annotated by the category querysets; only a category created in this request is counted here.
+        count = getattr(category, 'num_of_products', None)
+        return category.products.count() if count is None else count
+
     def validate(self, data):
         if len(data['name']) < 3:
             raise serializers.ValidationError('Category title should be at least 3.')
@@ -25,12 +33,22 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source="category.name", read_only=True)
+    num_of_comments = serializers.IntegerField(source="approved_comments_count", read_only=True)
+    rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ["id", "name", "description", "price",
                   "category", "category_name", "stock",
-                  "image", "created_at"]
+                  "image", "created_at", "num_of_comments",
+                  "rating", "rating_histogram"]
+
+    def get_rating_histogram(self, product):
+        return {
+            str(rating): getattr(product, f'ratings_{rating}')
+            for rating in range(1, 6)
+        }
 
     def validate_price(self, value):
         if value < 0:
@@ -74,15 +92,49 @@ class CommentSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'body',
+            'rating',
         ]
         
     def create(self, validated_data):
         product_id = self.context['product_pk']    
-        return Comment.objects.create(product_id=product_id, **validated_data)
+        return Comment.objects.create(
+            product_id=product_id,
+            ip_address=self.context.get('ip_address'),
+            **validated_data
+        )
         
 
 
 
+class ModerationCommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = [
+            'id',
+            'product',
+            'name',
+            'body',
+            'rating',
+            'datetime_created',
+        ]
+        read_only_fields = fields
+
+
+
+class CommentDecisionSerializer(serializers.Serializer):
+    approve = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=5000)
+    reject = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=5000)
+
+    def validate(self, data):
+        if not data['approve'] and not data['reject']:
+            raise serializers.ValidationError('Send at least one comment id to approve or reject.')
+        if set(data['approve']) & set(data['reject']):
+            raise serializers.ValidationError('A comment cannot be approved and rejected at the same time.')
+        return data
+
+
+
+
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
@@ -192,8 +244,11 @@ class OrderSerializer(serializers.ModelSerializer):
             'id',
             'status',
             'datetime_created',
+            'total_amount',
+            'item_count',
             'items'
             ]        
+        read_only_fields = ['total_amount', 'item_count']
 
 
 
@@ -208,8 +263,37 @@ class OrderForAdminSerializer(serializers.ModelSerializer):
             'customer',
             'status',
             'datetime_created',
+            'total_amount',
+            'item_count',
             'items'
             ]        
+        read_only_fields = ['total_amount', 'item_count']
+
+
+
+class ArchivedOrderItemSerializer(OrderItemSerializer):
+    id = serializers.IntegerField(source='original_id', read_only=True)
+
+    class Meta(OrderItemSerializer.Meta):
+        model = ArchivedOrderItem
+
+
+
+class ArchivedOrderSerializer(OrderSerializer):
+    id = serializers.IntegerField(source='original_id', read_only=True)
+    items = ArchivedOrderItemSerializer(many=True)
+
+    class Meta(OrderSerializer.Meta):
+        model = ArchivedOrder
+
+
+
+class ArchivedOrderForAdminSerializer(OrderForAdminSerializer):
+    id = serializers.IntegerField(source='original_id', read_only=True)
+    items = ArchivedOrderItemSerializer(many=True)
+
+    class Meta(OrderForAdminSerializer.Meta):
+        model = ArchivedOrder
 
 
 
@@ -228,27 +312,32 @@ class OrderCreateSerializer(serializers.Serializer):
     def save(self, **kwargs):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
-            customer = Customer.objects.get(user_id=user_id)
-
-            order = Order()
-            order.customer = customer
-            order.save()
+            customer_id = self.context.get('customer_id')
+            if customer_id is None:
+                customer_id = Customer.objects.get(user_id=self.context['user_id']).id
 
             cart_items = CartItem.objects.select_related('product').filter(cart_id=cart_id)
 
             order_items = [
                 OrderItem(
-                    order=order,
                     product=cart_item.product,
                     price=cart_item.product.price,
                     quantity=cart_item.quantity,
                 ) for cart_item in cart_items
             ]
 
+            order = Order()
+            order.customer_id = customer_id
+            order.total_amount = sum(item.price * item.quantity for item in order_items)
+            order.item_count = len(order_items)
+            order.save()
+
+            for order_item in order_items:
+                order_item.order = order
+
             OrderItem.objects.bulk_create(order_items)
 
-            Cart.objects.get(id=cart_id).delete()
+            Cart.objects.filter(id=cart_id).delete()
 
             return order
 
@@ -258,3 +347,114 @@ class OrderUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
+
+    def validate_status(self, status):
+        if self.instance is not None and not self.instance.can_change_status(status):
+            raise serializers.ValidationError(
+                f'An order cannot go from {self.instance.get_status_display()} to {dict(Order.ORDER_STATUS)[status]}.'
+            )
+        return status
+
+
+
+class OrderBulkStatusSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=[
+        (Order.ORDER_STATUS_PAID, 'Paid'),
+        (Order.ORDER_STATUS_CANCELED, 'Canceled'),
+    ])
+
+
+
+class PrivateEmailSerializer(serializers.Serializer):
+    subject = serializers.CharField(max_length=255)
+    body = serializers.CharField()
+
+
+
+class CustomerProvisionRowSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField()
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    phone_number = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    birth_date = serializers.DateField(required=False, allow_null=True)
+
+    def validate_password(self, password):
+        if password:
+            try:
+                validate_password(password)
+            except DjangoValidationError as error:
+                raise serializers.ValidationError(list(error.messages))
+        return password
+
+
+
+class CustomerProvisionSerializer(serializers.Serializer):
+    customers = CustomerProvisionRowSerializer(many=True, allow_empty=False, max_length=10000)
+
+
+
+class ProvisioningJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProvisioningJob
+        fields = ['id', 'status', 'row_count', 'created', 'skipped', 'datetime_created', 'datetime_finished']
+
+
+
+class CampaignSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Campaign
+        fields = [
+            'id',
+            'name',
+            'subject_template',
+            'body_template',
+            'segment',
+            'category',
+            'ordered_since',
+            'status',
+            'recipient_count',
+            'sent_count',
+            'failed_count',
+            'datetime_created',
+            'datetime_started',
+            'datetime_finished',
+            ]
+        read_only_fields = ['status']
+
+    def validate(self, data):
+        segment = data.get('segment', getattr(self.instance, 'segment', Campaign.SEGMENT_ALL))
+        category = data.get('category', getattr(self.instance, 'category', None))
+        if segment == Campaign.SEGMENT_CATEGORY and category is None:
+            raise serializers.ValidationError({'category': 'The category segment needs a category.'})
+        for field in ['subject_template', 'body_template']:
+            if field in data:
+                try:
+                    Template(data[field])
+                except TemplateSyntaxError as error:
+                    raise serializers.ValidationError({field: str(error)})
+        return data
+
+    def update(self, instance, validated_data):
+        if instance.status != Campaign.STATUS_DRAFT:
+            raise serializers.ValidationError('Only draft campaigns can be changed.')
+        return super().update(instance, validated_data)
+
+
+
+class SalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SalesRollup
+        fields = [
+            'period',
+            'period_start',
+            'dimension',
+            'dimension_id',
+            'order_count',
+            'quantity',
+            'revenue',
+            'paid_revenue',
+            ]
+        read_only_fields = fields
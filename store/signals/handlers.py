@@ -1,8 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
 
-from store.models import Customer
+from collections import Counter, defaultdict
+
+from store import aggregates, analytics, catalog, emails, identity
+from store.models import Category, Comment, Customer, Order, PageContent, Product, TeamMember
+from store.signals import order_created
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_profile_for_newly_created_user(sender,
@@ -11,4 +17,97 @@ def create_customer_profile_for_newly_created_user(sender,
                                                    **kwargs):
     if created:
         Customer.objects.create(user=instance)
-        
\ No newline at end of file
+
+
+@receiver(order_created)
+def queue_order_confirmation_email(sender, order, **kwargs):
+    emails.queue_order_confirmation(order)
+
+
+@receiver(post_init, sender=Order)
+def remember_loaded_order_status(sender, instance, **kwargs):
+    # Read from __dict__ so deferred status fields are not loaded here.
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Order)
+def move_order_in_sales_rollups_on_status_change(sender,
+                                                 instance,
+                                                 created,
+                                                 **kwargs):
+    loaded_status = instance._loaded_status
+    if not created and loaded_status is not None and loaded_status != instance.status:
+        analytics.record_status_change([instance], loaded_status, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_init, sender=Comment)
+def remember_loaded_comment(sender, instance, **kwargs):
+    instance._loaded_aggregates = (
+        instance.__dict__.get('product_id'),
+        instance.__dict__.get('status'),
+        instance.__dict__.get('rating'),
+    )
+
+
+@receiver(post_save, sender=Comment)
+def update_product_aggregates_on_comment_save(sender,
+                                              instance,
+                                              created,
+                                              **kwargs):
+    deltas = defaultdict(Counter)
+    if not created:
+        product_id, status, rating = instance._loaded_aggregates
+        deltas[product_id].subtract(aggregates.comment_aggregates(status, rating))
+    deltas[instance.product_id].update(aggregates.comment_aggregates(instance.status, instance.rating))
+    aggregates.update_product_aggregates(deltas)
+    instance._loaded_aggregates = (instance.product_id, instance.status, instance.rating)
+
+
+@receiver(post_delete, sender=Comment)
+def update_product_aggregates_on_comment_delete(sender, instance, **kwargs):
+    product_id, status, rating = instance._loaded_aggregates
+    deltas = Counter()
+    deltas.subtract(aggregates.comment_aggregates(status, rating))
+    aggregates.update_product_aggregates({product_id: deltas})
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def forget_cached_customer_id(sender, instance, **kwargs):
+    # A customer never moves to another user, so only creation and deletion matter.
+    if kwargs.get('created', True):
+        identity.forget_customer_id(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_cached_permissions_of_new_user(sender, instance, created, **kwargs):
+    # Drops anything cached for a reused user id.
+    if created:
+        identity.forget_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def drop_cached_permissions_on_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        identity.bump_permissions_generation()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def drop_cached_permissions_on_delete(sender, **kwargs):
+    identity.bump_permissions_generation()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=PageContent)
+@receiver(post_delete, sender=PageContent)
+@receiver(post_save, sender=TeamMember)
+@receiver(post_delete, sender=TeamMember)
+def drop_cached_catalog_responses(sender, **kwargs):
+    catalog.bump_catalog_generation()
@@ -0,0 +1,207 @@
+"""
+Batched spam scoring of waiting comments.
+
+New comments are stored as waiting with no ``spam_score``, which makes the
+comment POST a single INSERT. ``score_pending_comments`` later takes them in
+batches, runs every scorer in ``COMMENT_SPAM['SCORERS']`` over the whole
+batch, keeps the highest score of each comment and approves or rejects the
+comments whose score is clearly on one side of the thresholds. The rest stay
+in the moderation queue.
+
+A scorer is a class built with the keyword arguments given in the settings
+and called with a list of comments; it returns one score between 0 and 1 per
+comment and should not run more than a few queries per batch.
+"""
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import timedelta
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils.module_loading import import_string
+
+from .models import Comment
+from .moderation import moderate_comments
+
+
+DEFAULTS = {
+    'SCORERS': [
+        ('store.spam.TokenBlacklistScorer', {}),
+        ('store.spam.DuplicateBodyScorer', {}),
+        ('store.spam.LinkCountScorer', {}),
+        ('store.spam.RateScorer', {}),
+    ],
+    'APPROVE_BELOW': 0.2,
+    'REJECT_ABOVE': 0.8,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'COMMENT_SPAM', {})}
+
+
+class TokenBlacklistScorer:
+    DEFAULT_TOKENS = ['casino', 'viagra', 'crypto', 'loan', 'free money', 'click here', 'buy now']
+
+    def __init__(self, tokens=None, hits_for_spam=2):
+        self.tokens = [token.lower() for token in (tokens or self.DEFAULT_TOKENS)]
+        self.hits_for_spam = hits_for_spam
+
+    def __call__(self, comments):
+        scores = []
+        for comment in comments:
+            text = f'{comment.name} {comment.body}'.lower()
+            hits = sum(text.count(token) for token in self.tokens)
+            scores.append(min(1.0, hits / self.hits_for_spam))
+        return scores
+
+
+class DuplicateBodyScorer:
+    """
+    Flags bodies that were posted before, in an earlier batch or earlier in
+    this one. A repeat on the same product scores 1.0. A body first posted on
+    another product scores ``other_product_score``, under ``REJECT_ABOVE`` by
+    default, so that common short comments such as "Great product" go to the
+    moderation queue instead of being rejected. The oldest comment with a
+    body is not flagged, and neither are comments saved before bodies were
+    hashed, which have an empty hash.
+    """
+
+    def __init__(self, other_product_score=0.5):
+        self.other_product_score = other_product_score
+
+    def __call__(self, comments):
+        hashes = {comment.body_hash for comment in comments if comment.body_hash}
+        with_hashes = Comment.objects.filter(body_hash__in=hashes)
+        first_ids = dict(with_hashes.values_list('body_hash').annotate(first_id=Min('id')))
+        first_ids_by_product = {
+            (product_id, body_hash): first_id
+            for product_id, body_hash, first_id in with_hashes
+                .filter(product_id__in={comment.product_id for comment in comments})
+                .values_list('product_id', 'body_hash')
+                .annotate(first_id=Min('id'))
+        }
+        scores = []
+        for comment in comments:
+            if not comment.body_hash:
+                scores.append(0.0)
+            elif first_ids_by_product.get((comment.product_id, comment.body_hash), comment.id) != comment.id:
+                scores.append(1.0)
+            elif first_ids.get(comment.body_hash, comment.id) != comment.id:
+                scores.append(self.other_product_score)
+            else:
+                scores.append(0.0)
+        return scores
+
+
+class LinkCountScorer:
+    LINK_PATTERN = re.compile(r'https?://|www\.', re.IGNORECASE)
+
+    def __init__(self, max_links=3):
+        self.max_links = max_links
+
+    def __call__(self, comments):
+        return [
+            min(1.0, len(self.LINK_PATTERN.findall(comment.body)) / self.max_links)
+            for comment in comments
+        ]
+
+
+class RateScorer:
+    """
+    Flags IP addresses and names that posted more than ``limit`` comments
+    within ``window`` up to each comment, the comment included.
+    """
+
+    def __init__(self, limit=5, window=timedelta(minutes=10)):
+        self.limit = limit
+        self.window = window
+
+    def _times(self, field, values, since, until):
+        times = defaultdict(list)
+        rows = Comment.objects \
+            .filter(**{f'{field}__in': values}, datetime_created__range=(since, until)) \
+            .order_by('datetime_created') \
+            .values_list(field, 'datetime_created')
+        for value, created in rows:
+            times[value].append(created)
+        return times
+
+    def _posted(self, times, created):
+        return bisect_right(times, created) - bisect_left(times, created - self.window)
+
+    def __call__(self, comments):
+        since = min(comment.datetime_created for comment in comments) - self.window
+        until = max(comment.datetime_created for comment in comments)
+        ip_times = self._times('ip_address', {comment.ip_address for comment in comments if comment.ip_address}, since, until)
+        name_times = self._times('name', {comment.name for comment in comments}, since, until)
+        scores = []
+        for comment in comments:
+            posted = max(
+                self._posted(ip_times[comment.ip_address], comment.datetime_created) if comment.ip_address else 0,
+                self._posted(name_times[comment.name], comment.datetime_created),
+            )
+            scores.append(min(1.0, max(0, posted - self.limit) / self.limit))
+        return scores
+
+
+def load_scorers(config=None):
+    config = config or get_config()
+    return [import_string(path)(**kwargs) for path, kwargs in config['SCORERS']]
+
+
+def score_comments(comments, scorers):
+    """Return the highest score any scorer gives to each comment."""
+    scores = [0.0] * len(comments)
+    for scorer in scorers:
+        for index, score in enumerate(scorer(comments)):
+            scores[index] = max(scores[index], score)
+    return scores
+
+
+def score_pending_batch(scorers=None, config=None):
+    """
+    Score one batch of unscored waiting comments. Returns a ``Counter`` of
+    the comments that were ``scored``, ``approved`` and ``rejected``.
+    """
+    config = config or get_config()
+    scorers = scorers if scorers is not None else load_scorers(config)
+
+    with transaction.atomic():
+        comments = list(
+            Comment.objects.select_for_update(skip_locked=True)
+                .filter(status=Comment.COMMENT_STATUS_WAITING, spam_score__isnull=True)
+                .order_by('id')[:config['BATCH_SIZE']]
+        )
+        if not comments:
+            return Counter()
+
+        for comment, score in zip(comments, score_comments(comments, scorers)):
+            comment.spam_score = score
+        Comment.objects.bulk_update(comments, ['spam_score'])
+
+        result = moderate_comments(
+            approve=[comment.id for comment in comments if comment.spam_score < config['APPROVE_BELOW']],
+            reject=[comment.id for comment in comments if comment.spam_score > config['REJECT_ABOVE']],
+        )
+
+    return Counter(
+        scored=len(comments),
+        approved=len(result['approved']),
+        rejected=len(result['rejected']),
+    )
+
+
+def score_pending_comments(config=None):
+    """Score batches until no unscored waiting comment is left."""
+    config = config or get_config()
+    scorers = load_scorers(config)
+    totals = Counter()
+    while True:
+        batch = score_pending_batch(scorers, config)
+        if not batch:
+            return totals
+        totals += batch
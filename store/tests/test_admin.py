@@ -0,0 +1,57 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from store.models import *
+
+from decimal import Decimal
+
+
+
+
+User = get_user_model()
+
+
+
+class VersionedChangelistTest(TestCase):
+
+    def setUp(self):
+        """Log a superuser in and create a product to edit from the changelist."""
+        self.admin = User.objects.create_superuser(username="admin", email="admin@example.com", password="adminpass")
+        self.client.force_login(self.admin)
+        category = Category.objects.create(name="Paper")
+        self.product = Product.objects.create(name="Notebook", description="A5", price=Decimal("4.00"), category=category)
+        self.url = reverse("admin:store_product_changelist")
+
+
+    def post_price(self, price, version):
+        return self.client.post(self.url, {
+            "form-TOTAL_FORMS": "1",
+            "form-INITIAL_FORMS": "1",
+            "form-0-id": str(self.product.pk),
+            "form-0-price": price,
+            "form-0-version": str(version),
+            "_save": "Save",
+        })
+
+
+    def test_version_is_hidden_without_a_column(self):
+        """Test that the changelist sends each row's version back without showing a Version column."""
+        response = self.client.get(self.url)
+
+        self.assertContains(response, '<input type="hidden" name="form-0-version" value="1"', html=False)
+        self.assertNotContains(response, "column-version")
+
+
+    def test_stale_row_is_rejected(self):
+        """Test that a row saved since the changelist was rendered is not overwritten."""
+        response = self.post_price("5.00", version=1)
+        self.assertEqual(response.status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.version), (Decimal("5.00"), 2))
+
+        response = self.post_price("6.00", version=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "changed by someone else")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal("5.00"))
@@ -0,0 +1,104 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.urls import reverse
+
+from io import StringIO
+
+from rest_framework.test import APIClient
+
+from store.models import *
+from store.moderation import moderate_comments
+
+
+
+
+class ProductRatingAggregatesTest(TestCase):
+
+    def setUp(self):
+        """Create two products to rate."""
+        category = Category.objects.create(name="Paper")
+        self.notebook = Product.objects.create(name="Notebook", description="A5", price=4, category=category)
+        self.folder = Product.objects.create(name="Folder", description="Blue", price=2, category=category)
+
+
+    def rate(self, product, rating, status=Comment.COMMENT_STATUS_WAITING):
+        return Comment.objects.create(product=product, name="reader", body="Rated", rating=rating, status=status)
+
+
+    def assertRating(self, product, rating, count, histogram):
+        product.refresh_from_db()
+        self.assertEqual(product.rating, rating)
+        self.assertEqual(product.rating_count, count)
+        self.assertEqual([getattr(product, f'ratings_{stars}') for stars in range(1, 6)], histogram)
+
+
+    def test_only_approved_ratings_count(self):
+        """Test that waiting comments do not change the rating until approved."""
+        comment = self.rate(self.notebook, 4)
+        self.assertRating(self.notebook, None, 0, [0, 0, 0, 0, 0])
+
+        comment.status = Comment.COMMENT_STATUS_APPROVED
+        comment.save()
+        self.assertRating(self.notebook, 4.0, 1, [0, 0, 0, 1, 0])
+
+
+    def test_bulk_approval_updates_ratings(self):
+        """Test that moderation adds the ratings of approved comments."""
+        comments = [self.rate(self.notebook, 5), self.rate(self.notebook, 2), self.rate(self.folder, 3)]
+        moderate_comments(approve=[comment.id for comment in comments])
+
+        self.assertRating(self.notebook, 3.5, 2, [0, 1, 0, 0, 1])
+        self.assertRating(self.folder, 3.0, 1, [0, 0, 1, 0, 0])
+
+
+    def test_rejecting_and_deleting_remove_ratings(self):
+        """Test that rejected and deleted comments leave the aggregates."""
+        first = self.rate(self.notebook, 5, Comment.COMMENT_STATUS_APPROVED)
+        second = self.rate(self.notebook, 1, Comment.COMMENT_STATUS_APPROVED)
+        self.assertRating(self.notebook, 3.0, 2, [1, 0, 0, 0, 1])
+
+        first.status = Comment.COMMENT_STATUS_NOT_APPROVED
+        first.save()
+        self.assertRating(self.notebook, 1.0, 1, [1, 0, 0, 0, 0])
+
+        second.delete()
+        self.assertRating(self.notebook, None, 0, [0, 0, 0, 0, 0])
+
+
+    def test_saving_a_loaded_product_keeps_newer_aggregates(self):
+        """Test that a full save of a product loaded before a rating was approved does not undo it."""
+        product = Product.objects.get(pk=self.notebook.pk)
+        self.rate(self.notebook, 4, Comment.COMMENT_STATUS_APPROVED)
+
+        product.price = 5
+        product.save()
+
+        self.assertRating(self.notebook, 4.0, 1, [0, 0, 0, 1, 0])
+        self.assertEqual(self.notebook.approved_comments_count, 1)
+        self.assertEqual((self.notebook.price, self.notebook.version), (5, 2))
+
+
+    def test_reconcile_command(self):
+        """Test that the reconciliation command recomputes drifted aggregates."""
+        self.rate(self.notebook, 4, Comment.COMMENT_STATUS_APPROVED)
+        self.rate(self.notebook, 2, Comment.COMMENT_STATUS_APPROVED)
+        Product.objects.update(rating=None, rating_sum=0, rating_count=0, ratings_4=7, approved_comments_count=9)
+
+        out = StringIO()
+        call_command('reconcile_product_ratings', '--chunk-size', '1', stdout=out)
+
+        self.assertIn('2 products reconciled', out.getvalue())
+        self.assertRating(self.notebook, 3.0, 2, [0, 1, 0, 1, 0])
+        self.assertEqual(self.notebook.approved_comments_count, 2)
+        self.assertRating(self.folder, None, 0, [0, 0, 0, 0, 0])
+
+
+    def test_products_can_be_ordered_by_rating(self):
+        """Test that the product list can be sorted by average rating."""
+        self.rate(self.notebook, 2, Comment.COMMENT_STATUS_APPROVED)
+        self.rate(self.folder, 5, Comment.COMMENT_STATUS_APPROVED)
+
+        response = APIClient().get(reverse('product-list'), {'ordering': '-rating'})
+
+        self.assertEqual([product['name'] for product in response.json()['results']], ["Folder", "Notebook"])
+        self.assertEqual(response.json()['results'][0]['rating_histogram']['5'], 1)
@@ -0,0 +1,226 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from store.analytics import period_starts, rebuild_rollups, record_orders_created
+from store.models import *
+
+
+
+
+User = get_user_model()
+
+
+
+class SalesRollupTest(APITestCase):
+
+    def setUp(self):
+        """Place an order for two products in two categories through the API."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass"
+        )
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="buyerpass"
+        )
+        self.customer = Customer.objects.get(user=self.user)
+
+        self.paper = Category.objects.create(name="Paper")
+        self.pens = Category.objects.create(name="Pens")
+        self.notebook = Product.objects.create(name="Notebook", description="A5", price=Decimal("4.00"), category=self.paper)
+        self.pen = Product.objects.create(name="Pen", description="Blue", price=Decimal("1.50"), category=self.pens)
+
+        self.client.force_authenticate(user=self.user)
+        self.order = self.place_order([(self.notebook, 2), (self.pen, 4)])  # 8.00 + 6.00
+        self.today = timezone.localdate()
+
+
+    def place_order(self, items):
+        cart = Cart.objects.create()
+        for product, quantity in items:
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        response = self.client.post(reverse("order-list"), {"cart_id": str(cart.id)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Order.objects.get(pk=response.data["id"])
+
+
+    def rollup(self, dimension=SalesRollup.DIMENSION_ALL, dimension_id=0, period=SalesRollup.PERIOD_DAY):
+        return SalesRollup.objects.get(
+            period=period,
+            period_start=period_starts(self.today)[period],
+            dimension=dimension,
+            dimension_id=dimension_id,
+        )
+
+
+    def test_order_creation_updates_rollups(self):
+        """Test that a new order is added to every period and dimension."""
+        for period, _ in SalesRollup.PERIODS:
+            rollup = self.rollup(period=period)
+            self.assertEqual(rollup.order_count, 1)
+            self.assertEqual(rollup.quantity, 6)
+            self.assertEqual(rollup.revenue, Decimal("14.00"))
+            self.assertEqual(rollup.paid_revenue, Decimal("0.00"))
+
+        self.assertEqual(self.rollup(SalesRollup.DIMENSION_CUSTOMER, self.customer.id).revenue, Decimal("14.00"))
+        self.assertEqual(self.rollup(SalesRollup.DIMENSION_CATEGORY, self.paper.id).revenue, Decimal("8.00"))
+        self.assertEqual(self.rollup(SalesRollup.DIMENSION_CATEGORY, self.pens.id).quantity, 4)
+
+
+    def test_status_changes_update_rollups(self):
+        """Test that paying adds paid revenue and canceling removes the order."""
+        self.order.status = Order.ORDER_STATUS_PAID
+        self.order.save()
+        self.assertEqual(self.rollup().paid_revenue, Decimal("14.00"))
+
+        self.order.status = Order.ORDER_STATUS_CANCELED
+        self.order.save()
+        rollup = self.rollup()
+        self.assertEqual(rollup.order_count, 0)
+        self.assertEqual(rollup.revenue, Decimal("0.00"))
+        self.assertEqual(rollup.paid_revenue, Decimal("0.00"))
+
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test that rebuilding in chunks produces the incrementally maintained rows."""
+        second = self.place_order([(self.pen, 2)])
+        second.status = Order.ORDER_STATUS_PAID
+        second.save()
+        incremental = sorted(
+            SalesRollup.objects.exclude(order_count=0).values_list(
+                'period', 'period_start', 'dimension', 'dimension_id',
+                'order_count', 'quantity', 'revenue', 'paid_revenue',
+            )
+        )
+
+        rebuild_rollups(chunk_size=1)
+        rebuilt = sorted(
+            SalesRollup.objects.values_list(
+                'period', 'period_start', 'dimension', 'dimension_id',
+                'order_count', 'quantity', 'revenue', 'paid_revenue',
+            )
+        )
+        self.assertEqual(rebuilt, incremental)
+
+
+    def test_orders_are_added_in_a_fixed_number_of_queries(self):
+        """Test that an order adds to all its rows with one INSERT and one UPDATE, whatever their number."""
+        order = self.place_order([(self.notebook, 1), (self.pen, 1)])
+        SalesRollup.objects.filter(dimension=SalesRollup.DIMENSION_CATEGORY).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            record_orders_created([order])
+
+        # The items, the fence, the missing rows and the increments.
+        statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 4)
+
+        self.assertEqual(self.rollup().order_count, 3)
+        self.assertEqual(self.rollup(SalesRollup.DIMENSION_CATEGORY, self.paper.id).quantity, 1)
+
+
+    def test_failed_rollup_update_rolls_back_the_order(self):
+        """Test that an order whose rollup increments fail is not created, instead of drifting from the rollups."""
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=1)
+
+        with mock.patch('store.analytics._apply', side_effect=DatabaseError("deadlock")), \
+                self.assertRaises(DatabaseError):
+            self.client.post(reverse("order-list"), {"cart_id": str(cart.id)})
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.rollup().order_count, 1)
+
+
+    def test_admin_item_edits_and_deletes_update_rollups(self):
+        """Test that items edited inline or deleted in the admin, and deleted orders, are moved in the rollups."""
+        admin_client = Client()
+        admin_client.force_login(self.admin_user)
+        pen_item = self.order.items.get(product=self.pen)
+        notebook_item = self.order.items.get(product=self.notebook)
+
+        response = admin_client.post(reverse("admin:store_order_change", args=[self.order.pk]), {
+            "customer": str(self.customer.pk),
+            "status": Order.ORDER_STATUS_UNPAID,
+            "version": str(self.order.version),
+            "items-TOTAL_FORMS": "2",
+            "items-INITIAL_FORMS": "2",
+            "items-MIN_NUM_FORMS": "1",
+            "items-MAX_NUM_FORMS": "1000",
+            "items-0-id": str(pen_item.pk),
+            "items-0-order": str(self.order.pk),
+            "items-0-product": str(self.pen.pk),
+            "items-0-quantity": "1",
+            "items-1-id": str(notebook_item.pk),
+            "items-1-order": str(self.order.pk),
+            "items-1-product": str(self.notebook.pk),
+            "items-1-quantity": "2",
+            "_save": "Save",
+        })
+        self.assertEqual(response.status_code, 302)
+        rollup = self.rollup()
+        self.assertEqual((rollup.order_count, rollup.quantity, rollup.revenue), (1, 3, Decimal("9.50")))
+        self.assertEqual(self.rollup(SalesRollup.DIMENSION_CATEGORY, self.pens.id).quantity, 1)
+
+        response = admin_client.post(reverse("admin:store_orderitem_changelist"), {
+            "action": "delete_selected",
+            "_selected_action": [str(pen_item.pk), str(notebook_item.pk)],
+            "post": "yes",
+        })
+        self.assertEqual(response.status_code, 302)
+        rollup = self.rollup()
+        self.assertEqual((rollup.order_count, rollup.quantity, rollup.revenue), (1, 0, Decimal("0.00")))
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.delete(reverse("order-detail", args=[self.order.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.rollup().order_count, 0)
+
+
+    def test_rebuild_locks_the_rollups_before_reading_orders(self):
+        """Test that a rebuild takes the fence that order changes wait for, before anything else."""
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_rollups()
+
+        statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertIn('store_salesrollupfence', statements[0])
+
+
+    def test_rebuild_command(self):
+        """Test that the management command rebuilds the rollups."""
+        SalesRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', '--workers', '1', stdout=out)
+
+        self.assertIn('rollup rows written', out.getvalue())
+        self.assertEqual(self.rollup(period=SalesRollup.PERIOD_MONTH).revenue, Decimal("14.00"))
+
+
+    def test_analytics_endpoint(self):
+        """Test that staff can read rollups per period and dimension."""
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("analytics-list"), {"period": "w", "dimension": "category"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(
+            {row["dimension_id"]: row["revenue"] for row in response.data["results"]},
+            {self.paper.id: Decimal("8.00"), self.pens.id: Decimal("6.00")},
+        )
+
+
+    def test_analytics_endpoint_is_staff_only(self):
+        """Test that regular users cannot read sales analytics."""
+        response = self.client.get(reverse("analytics-list"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,193 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import ProtectedError
+from django.utils import timezone
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from store.analytics import rebuild_rollups
+from store.archive import archive_orders
+from store.models import *
+
+
+
+
+User = get_user_model()
+
+
+
+class OrderArchiveTest(APITestCase):
+
+    def setUp(self):
+        """Create one old and one recent order for the same customer."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass"
+        )
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="buyerpass"
+        )
+        self.customer = Customer.objects.get(user=self.user)
+        category = Category.objects.create(name="Paper")
+        self.product = Product.objects.create(name="Notebook", description="A5", price=Decimal("4.00"), category=category)
+
+        self.old_order = Order.objects.create(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        self.old_item = OrderItem.objects.create(order=self.old_order, product=self.product, quantity=3)
+        self.old_order.update_totals()
+        Order.objects.filter(pk=self.old_order.pk).update(datetime_created=timezone.now() - timedelta(days=400))
+
+        self.recent_order = Order.objects.create(customer=self.customer)
+        OrderItem.objects.create(order=self.recent_order, product=self.product, quantity=1)
+        self.recent_order.update_totals()
+
+        self.order_list_url = reverse("order-list")
+
+
+    def test_archive_moves_old_orders(self):
+        """Test that only orders older than the cutoff leave the hot tables."""
+        archived = archive_orders(timezone.now() - timedelta(days=365), batch_size=1)
+
+        self.assertEqual(archived, 1)
+        self.assertFalse(Order.objects.filter(pk=self.old_order.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=self.recent_order.pk).exists())
+
+        archived_order = ArchivedOrder.objects.get(original_id=self.old_order.pk)
+        self.assertEqual(archived_order.status, Order.ORDER_STATUS_PAID)
+        self.assertEqual(archived_order.total_amount, Decimal("12.00"))
+        self.assertEqual(archived_order.items.get().quantity, 3)
+        self.assertEqual(archived_order.items.get().original_id, self.old_item.pk)
+
+
+    def test_archive_command_uses_days_option(self):
+        """Test that the management command archives orders older than --days."""
+        out = StringIO()
+        call_command('archive_orders', '--days', '500', stdout=out)
+        self.assertIn('0 orders archived', out.getvalue())
+
+        call_command('archive_orders', '--days', '365', stdout=out)
+        self.assertIn('1 orders archived', out.getvalue())
+
+
+    def test_list_hides_archived_orders_by_default(self):
+        """Test that archived orders are only listed with include_archived."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.order_list_url)
+        self.assertEqual([order["id"] for order in response.data], [self.recent_order.id])
+
+        response = self.client.get(self.order_list_url, {"include_archived": "true", "ordering": "datetime_created"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([order["id"] for order in results], [self.old_order.id, self.recent_order.id])
+        self.assertEqual(results[0]["items"][0]["product"]["name"], "Notebook")
+
+
+    def test_list_with_archived_orders_is_paginated(self):
+        """Test that pages of orders and archived orders follow each other without gaps or repeats."""
+        for _ in range(12):
+            order = Order.objects.create(customer=self.customer)
+            OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        Order.objects.filter(customer=self.customer).exclude(pk=self.recent_order.pk) \
+            .update(datetime_created=timezone.now() - timedelta(days=400))
+        archive_orders(timezone.now() - timedelta(days=365), batch_size=5)
+        self.assertEqual(ArchivedOrder.objects.count(), 13)
+        self.client.force_authenticate(user=self.user)
+
+        ids = []
+        url = self.order_list_url + "?include_archived=true&ordering=-datetime_created"
+        # The customer, then the orders and their items from each table.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 10)
+            ids += [order["id"] for order in response.data["results"]]
+            url = response.data["next"]
+
+        expected = [self.recent_order.id] + list(
+            ArchivedOrder.objects.order_by("-datetime_created", "original_id").values_list("original_id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+
+    def test_list_with_archived_orders_rejects_other_ordering(self):
+        """Test that only fields both tables can be merged on are accepted, and broken cursors are refused."""
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.order_list_url, {"include_archived": "true", "ordering": "status"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ordering", response.data)
+
+        response = self.client.get(self.order_list_url, {"include_archived": "true", "cursor": "bm9wZQ=="})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_retrieve_archived_order(self):
+        """Test that an archived order can be retrieved with include_archived."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse("order-detail", kwargs={"pk": self.old_order.pk})
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(url, {"include_archived": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["customer"]["id"], self.customer.id)
+        self.assertEqual(response.data["total_amount"], Decimal("12.00"))
+
+
+    def test_reused_order_ids_do_not_collide_with_the_archive(self):
+        """Test that a new order given the id of an archived one, as after an auto-increment reset, is listed next to it."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        reused = Order.objects.create(id=self.old_order.pk, customer=self.customer)
+        OrderItem.objects.create(order=reused, product=self.product, quantity=2)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.order_list_url, {"include_archived": "true", "ordering": "datetime_created"})
+
+        results = response.data["results"]
+        self.assertEqual([order["id"] for order in results], [self.old_order.pk, self.recent_order.pk, reused.pk])
+        self.assertEqual([results[0]["items"][0]["quantity"], results[2]["items"][0]["quantity"]], [3, 2])
+
+
+    def test_archived_orders_protect_their_customer(self):
+        """Test that a customer with archived orders cannot be deleted, which would leave them pointing nowhere."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        self.recent_order.items.all().delete()
+        self.recent_order.delete()
+
+        with self.assertRaises(ProtectedError):
+            self.customer.delete()
+        self.assertTrue(ArchivedOrder.objects.filter(customer=self.customer).exists())
+
+
+    def test_archived_orders_are_private(self):
+        """Test that customers cannot read archived orders of other customers."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        other_user = User.objects.create_user(
+            username="other", email="other@example.com", password="otherpass"
+        )
+        self.client.force_authenticate(user=other_user)
+
+        response = self.client.get(self.order_list_url, {"include_archived": "true"})
+        self.assertEqual(response.data["results"], [])
+
+
+    def test_rollup_rebuild_includes_archived_orders(self):
+        """Test that rebuilding the sales rollups still counts archived orders."""
+        archive_orders(timezone.now() - timedelta(days=365))
+        rebuild_rollups()
+
+        paid = SalesRollup.objects.filter(
+            period=SalesRollup.PERIOD_DAY,
+            dimension=SalesRollup.DIMENSION_ALL,
+        ).order_by('period_start').values_list('paid_revenue', flat=True)
+        self.assertEqual(list(paid), [Decimal("12.00"), Decimal("0.00")])
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F, Sum
+from django.test import TestCase
+
+import io
+import json
+import os
+import tempfile
+
+from store import benchmarks
+from store.models import *
+
+
+
+
+class BenchmarkDataTest(TestCase):
+
+    def test_generated_data_is_consistent(self):
+        """Test that every model gets its rows and orders carry the totals of their items."""
+        created = benchmarks.generate(products=50, customers=10, carts=5, orders=20, chunk_size=7)
+
+        self.assertEqual(created, {'categories': 1, 'products': 50, 'customers': 10, 'carts': 5, 'orders': 20})
+        self.assertEqual(Product.objects.count(), 50)
+        # The benchmark staff user is a customer as well.
+        self.assertEqual(Customer.objects.count(), 11)
+        self.assertEqual(Cart.objects.count(), 5)
+        self.assertTrue(CartItem.objects.exists())
+        for order in Order.objects.annotate(items_total=Sum(F('items__price') * F('items__quantity'))):
+            self.assertEqual(order.total_amount, order.items_total)
+            self.assertEqual(order.item_count, order.items.count())
+
+
+    def generated_rows(self, seed):
+        with transaction.atomic():
+            benchmarks.generate(products=20, customers=5, carts=2, orders=5, seed=seed)
+            rows = [
+                list(Product.objects.order_by('pk').values_list('pk', 'name', 'price', 'stock', 'category_id')),
+                list(Order.objects.order_by('pk').values_list('pk', 'customer_id', 'status', 'total_amount')),
+                list(CartItem.objects.order_by('pk').values_list('product_id', 'quantity')),
+            ]
+            transaction.set_rollback(True)
+        return rows
+
+
+    def test_generated_data_depends_only_on_the_seed(self):
+        """Test that generating with the same seed on the same database creates the same rows."""
+        self.assertEqual(self.generated_rows(seed=3), self.generated_rows(seed=3))
+        self.assertNotEqual(self.generated_rows(seed=3), self.generated_rows(seed=4))
+
+
+
+class BenchmarkCommandTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        benchmarks.generate(products=30, customers=5, carts=2, orders=10)
+
+
+    def test_scenarios_report_percentiles_and_queries(self):
+        """Test that every scenario succeeds and reports latency percentiles and queries per request."""
+        out = io.StringIO()
+        call_command('benchmark_store', '--requests', '3', '--warmup', '1', stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(list(report['scenarios']), list(benchmarks.SCENARIOS))
+        self.assertEqual(report['environment']['rows']['products'], 30)
+        for name, result in report['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(set(result['latency_ms']), {'p50', 'p95', 'p99'})
+                self.assertTrue(all(status.startswith('2') for status in result['statuses']), result['statuses'])
+                self.assertIsNotNone(result['queries_per_request'])
+
+
+    def test_writes_are_rolled_back(self):
+        """Test that carts and orders created by the scenarios do not stay behind."""
+        orders, carts = Order.objects.count(), Cart.objects.count()
+
+        call_command('benchmark_store', 'cart_add', 'checkout', '--requests', '2', '--warmup', '0',
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual((Order.objects.count(), Cart.objects.count()), (orders, carts))
+
+
+    def test_reports_compare_with_a_baseline(self):
+        """Test that a run compared with an earlier report shows the change of each percentile."""
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'before.json')
+            call_command('benchmark_store', 'product_detail', '--requests', '3', '--output', baseline,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+            out = io.StringIO()
+            call_command('benchmark_store', 'product_detail', '--requests', '3', '--compare', baseline,
+                         stdout=out, stderr=io.StringIO())
+
+        changes = json.loads(out.getvalue())['changes']['product_detail']
+        self.assertEqual(set(changes), {'p50', 'p95', 'p99', 'queries_per_request'})
+        self.assertEqual(changes['queries_per_request'], 0)
@@ -0,0 +1,261 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from io import StringIO
+from unittest import mock
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from store import campaigns
+from store.models import *
+
+
+
+
+User = get_user_model()
+
+
+
+class CountingBackend(LocmemEmailBackend):
+    """Counts the connections opened by the campaign pool."""
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+
+
+class FailingBackend(LocmemEmailBackend):
+    """Fails to open its first connection, like an SMTP server that is briefly down."""
+    failures = 1
+
+    def open(self):
+        if FailingBackend.failures:
+            FailingBackend.failures -= 1
+            raise ConnectionRefusedError("SMTP server is down")
+        return True
+
+
+
+class CampaignTest(TestCase):
+
+    def setUp(self):
+        """Create customers, one of them a buyer of paper products."""
+        self.paper = Category.objects.create(name="Paper")
+        self.pens = Category.objects.create(name="Pens")
+        notebook = Product.objects.create(name="Notebook", description="A5", price=4, category=self.paper)
+        pen = Product.objects.create(name="Pen", description="Blue", price=1, category=self.pens)
+
+        self.customers = []
+        for number in range(7):
+            user = User.objects.create_user(
+                username=f"customer{number}", email=f"customer{number}@example.com",
+                password="pass", first_name=f"Name{number}",
+            )
+            self.customers.append(Customer.objects.get(user=user))
+        User.objects.create_user(username="inactive", email="inactive@example.com", password="pass", is_active=False)
+
+        for customer, product in [(self.customers[1], notebook), (self.customers[4], notebook), (self.customers[5], pen)]:
+            order = Order.objects.create(customer=customer)
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+        self.config = {'PAGE_SIZE': 3, 'BATCH_SIZE': 2, 'WORKERS': 2}
+
+
+    def campaign(self, **kwargs):
+        defaults = {
+            'name': "Spring",
+            'subject_template': "{{ campaign.name }} sale for $first_name",
+            'body_template': "Hi $first_name,{% if category %} new {{ category.name }} is in!{% endif %}",
+            'status': Campaign.STATUS_QUEUED,
+        }
+        return Campaign.objects.create(**{**defaults, **kwargs})
+
+
+    def test_campaign_reaches_every_active_customer(self):
+        """Test that a campaign to all customers sends one personalised mail per active customer."""
+        campaign = campaigns.send_campaign(self.campaign(), self.config)
+
+        self.assertEqual(campaign.status, Campaign.STATUS_DONE)
+        self.assertEqual((campaign.recipient_count, campaign.sent_count, campaign.failed_count), (7, 7, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted(
+            f"customer{number}@example.com" for number in range(7)
+        ))
+        message = next(message for message in mail.outbox if message.to == ["customer3@example.com"])
+        self.assertEqual(message.subject, "Spring sale for Name3")
+        self.assertEqual(message.body, "Hi Name3,")
+
+
+    def test_category_segment(self):
+        """Test that the category segment only mails customers who ordered in the category."""
+        campaign = campaigns.send_campaign(
+            self.campaign(segment=Campaign.SEGMENT_CATEGORY, category=self.paper), self.config
+        )
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            "customer1@example.com", "customer4@example.com",
+        ])
+        self.assertEqual(mail.outbox[0].body.split(",", 1)[1], " new Paper is in!")
+        self.assertEqual(campaign.last_customer_id, self.customers[4].id)
+
+
+    def test_recipients_are_read_in_keyset_pages(self):
+        """Test that the segment is read one bounded page per query."""
+        campaign = self.campaign()
+
+        with CaptureQueriesContext(connection) as queries:
+            pages = list(campaigns.recipient_pages(campaign, page_size=3))
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(len(queries), 4)
+        self.assertTrue(all('LIMIT 3' in query['sql'] for query in queries))
+
+
+    def test_interrupted_campaign_resumes_after_cursor(self):
+        """Test that a campaign left sending continues after the last finished page."""
+        campaign = self.campaign(
+            status=Campaign.STATUS_SENDING, recipient_count=7, sent_count=3,
+            last_customer_id=self.customers[2].id,
+        )
+
+        campaign = campaigns.send_campaign(campaign, self.config)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(campaign.sent_count, 7)
+
+
+    def test_campaign_claimed_by_another_worker_is_not_sent(self):
+        """Test that a campaign another worker is sending is skipped until that worker's claim expires."""
+        campaign = self.campaign(status=Campaign.STATUS_SENDING, recipient_count=7, datetime_claimed=timezone.now())
+
+        self.assertIsNone(campaigns.send_campaign(campaign, self.config))
+        self.assertEqual(campaigns.send_queued_campaigns(self.config), [])
+        self.assertEqual(len(mail.outbox), 0)
+
+        Campaign.objects.filter(pk=campaign.pk).update(datetime_claimed=timezone.now() - campaigns.CLAIM_TIMEOUT * 2)
+        [campaign] = campaigns.send_queued_campaigns(self.config)
+
+        self.assertEqual(campaign.status, Campaign.STATUS_DONE)
+        self.assertEqual(len(mail.outbox), 7)
+
+
+    def test_worker_that_lost_its_claim_stops_sending(self):
+        """Test that a worker whose claim was taken over stops after the page it was sending."""
+        campaign = self.campaign()
+        pages = campaigns.recipient_pages
+
+        def taken_over(*args, **kwargs):
+            for page in pages(*args, **kwargs):
+                Campaign.objects.filter(pk=campaign.pk).update(datetime_claimed=timezone.now())
+                yield page
+
+        with mock.patch.object(campaigns, 'recipient_pages', taken_over), \
+                self.assertLogs('store.campaigns', 'WARNING'):
+            self.assertIsNone(campaigns.send_campaign(campaign, self.config))
+
+        self.assertEqual(len(mail.outbox), 3)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent_count), (Campaign.STATUS_SENDING, 0))
+
+
+    @override_settings(EMAIL_BACKEND='store.tests.test_campaigns.CountingBackend')
+    def test_connections_are_pooled(self):
+        """Test that batches reuse the pooled connections instead of opening one each."""
+        CountingBackend.opened = 0
+
+        campaigns.send_campaign(self.campaign(), self.config)
+
+        self.assertLessEqual(CountingBackend.opened, self.config['WORKERS'])
+
+
+    @override_settings(EMAIL_BACKEND='store.tests.test_campaigns.FailingBackend')
+    def test_connection_that_fails_to_open_frees_its_slot(self):
+        """Test that a failed open is raised and the next acquire opens a new connection instead of blocking."""
+        FailingBackend.failures = 1
+        pool = campaigns.ConnectionPool(1, timeout=1)
+
+        with self.assertRaises(ConnectionRefusedError):
+            pool.acquire()
+        connection = pool.acquire()
+
+        self.assertIsInstance(connection, FailingBackend)
+        pool.timeout = 0.1
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+
+
+    def test_command_sends_queued_campaigns(self):
+        """Test that send_campaigns sends started campaigns and skips drafts."""
+        self.campaign(name="Queued")
+        self.campaign(name="Draft", status=Campaign.STATUS_DRAFT)
+
+        out = StringIO()
+        call_command('send_campaigns', stdout=out)
+
+        self.assertIn("Queued: 7 of 7 sent, 0 failed.", out.getvalue())
+        self.assertEqual(Campaign.objects.get(name="Draft").status, Campaign.STATUS_DRAFT)
+
+
+
+class CampaignViewSetTest(TestCase):
+
+    def setUp(self):
+        """Create a marketer with the private email permission and a regular user."""
+        self.client = APIClient()
+        self.marketer = User.objects.create_user(username="marketer", email="marketer@example.com", password="pass")
+        self.marketer.user_permissions.add(Permission.objects.get(codename="send_private_email"))
+        self.regular = User.objects.create_user(username="regular", email="regular@example.com", password="pass")
+        self.category = Category.objects.create(name="Paper")
+
+
+    def test_marketer_creates_and_starts_campaign(self):
+        """Test that a campaign is created as a draft and queued when started."""
+        self.client.force_authenticate(user=self.marketer)
+        payload = {
+            "name": "Paper week",
+            "subject_template": "Paper week",
+            "body_template": "Hi $first_name",
+            "segment": "category",
+            "category": self.category.id,
+        }
+
+        response = self.client.post(reverse("campaign-list"), payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["status"], Campaign.STATUS_DRAFT)
+
+        start_url = reverse("campaign-start", args=[response.data["id"]])
+        self.assertEqual(self.client.post(start_url).status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Campaign.objects.get().status, Campaign.STATUS_QUEUED)
+        self.assertEqual(self.client.post(start_url).status_code, status.HTTP_409_CONFLICT)
+
+
+    def test_category_segment_needs_category(self):
+        """Test that a category campaign without a category is rejected."""
+        self.client.force_authenticate(user=self.marketer)
+        payload = {"name": "Oops", "subject_template": "Hi", "body_template": "Hi", "segment": "category"}
+
+        response = self.client.post(reverse("campaign-list"), payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("category", response.data)
+
+
+    def test_campaigns_need_private_email_permission(self):
+        """Test that users without the send_private_email permission cannot manage campaigns."""
+        self.client.force_authenticate(user=self.regular)
+
+        response = self.client.get(reverse("campaign-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,170 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
+
+import io
+import json
+
+from asgiref.sync import iscoroutinefunction
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.db.replicas import ReplicaMiddleware
+from store.models import *
+from store.views import CategoryViewSet, PageContentViewSet, ProductViewSet, TeamMemberViewSet
+
+
+
+
+class AsyncCatalogTest(TestCase):
+
+    def setUp(self):
+        """Create a small catalog and empty the response cache."""
+        self.factory = APIRequestFactory()
+        self.paper = Category.objects.create(name="Paper", description="Sheets and pads")
+        self.pens = Category.objects.create(name="Pens")
+        for number in range(12):
+            Product.objects.create(
+                name=f"Notebook {number}" if number % 2 else f"Pencil {number}",
+                description="A5",
+                price=f"{number + 1}.50",
+                stock=number,
+                category=self.paper if number % 3 else self.pens,
+            )
+        PageContent.objects.create(page_name="about", content="Who we are")
+        TeamMember.objects.create(name="Sam", role="Buyer", bio="Buys paper")
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+    def sync_content(self, viewset, action, url, **kwargs):
+        """Render what the viewset itself answers for ``url``."""
+        actions = {'get': action}
+        response = viewset.as_view(actions, detail=action == 'retrieve')(self.factory.get(url), **kwargs)
+        return response.render().content
+
+
+    def test_product_pages_match_the_viewset(self):
+        """Test that searched, ordered and paginated product lists are the viewset's, byte for byte."""
+        url = reverse('product-list')
+        for query in ['', '?page=2', '?page=last', '?search=note', '?search=pencil,6', '?ordering=-price,name',
+                      '?ordering=unknown', '?ordering=stock&page=2']:
+            response = APIClient().get(url + query)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.sync_content(ProductViewSet, 'list', url + query), query)
+
+
+    def test_details_match_the_viewset(self):
+        """Test that detail responses are the viewset's, with the product version as ETag."""
+        product = Product.objects.first()
+        for basename, viewset, obj in [
+            ('product', ProductViewSet, product),
+            ('category', CategoryViewSet, self.paper),
+            ('pagecontent', PageContentViewSet, PageContent.objects.get()),
+            ('teammember', TeamMemberViewSet, TeamMember.objects.get()),
+        ]:
+            url = reverse(f'{basename}-detail', kwargs={'pk': obj.pk})
+            response = APIClient().get(url)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.sync_content(viewset, 'retrieve', url, pk=obj.pk), basename)
+        self.assertEqual(APIClient().get(reverse('product-detail', kwargs={'pk': product.pk}))['ETag'], f'"{product.version}"')
+
+
+    def test_unpaginated_lists_match_the_viewset(self):
+        """Test that the category, page and team lists are the viewsets'."""
+        for basename, viewset in [
+            ('category', CategoryViewSet),
+            ('pagecontent', PageContentViewSet),
+            ('teammember', TeamMemberViewSet),
+        ]:
+            url = reverse(f'{basename}-list')
+            self.assertEqual(APIClient().get(url).content, self.sync_content(viewset, 'list', url), basename)
+
+
+    def test_missing_objects_and_pages_are_not_found(self):
+        """Test that unknown ids and page numbers are answered with 404 like the viewsets do."""
+        missing = APIClient().get(reverse('product-detail', kwargs={'pk': 999}))
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.json(), {'detail': "No Product matches the given query."})
+
+        self.assertEqual(APIClient().get(reverse('category-detail', kwargs={'pk': 'abc'})).status_code, 404)
+        self.assertEqual(APIClient().get(reverse('product-list'), {'page': 5}).json(), {'detail': "Invalid page."})
+        self.assertEqual(APIClient().get(reverse('product-list'), {'page': 0}).status_code, 404)
+
+
+    def test_responses_are_cached_until_the_catalog_changes(self):
+        """Test that a repeated GET runs no query and that a saved product drops the cached responses."""
+        url = reverse('category-list')
+        APIClient().get(url)
+
+        with self.assertNumQueries(0):
+            cached = APIClient().get(url)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached['Allow'], 'GET, POST, HEAD, OPTIONS')
+
+        Product.objects.create(name="Eraser", description="White", price="0.50", category=self.pens)
+        counts = {category['name']: category['num_of_products'] for category in APIClient().get(url).json()}
+        self.assertEqual(counts, {"Paper": 8, "Pens": 5})
+
+
+    @override_settings(ASYNC_CATALOG={'CACHE_TIMEOUT': 0})
+    def test_cache_can_be_turned_off(self):
+        """Test that a CACHE_TIMEOUT of 0 queries the database on every request."""
+        url = reverse('teammember-list')
+        APIClient().get(url)
+
+        with self.assertNumQueries(1):
+            APIClient().get(url)
+
+
+    def test_other_requests_go_to_the_viewsets(self):
+        """Test that writes and the browsable API are still answered by the viewsets."""
+        html = APIClient().get(reverse('category-list'), HTTP_ACCEPT='text/html')
+        self.assertEqual(html.status_code, 200)
+        self.assertIn('text/html', html['Content-Type'])
+
+        created = APIClient().post(reverse('pagecontent-list'), {"page_name": "terms", "content": "Be nice"})
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(len(APIClient().get(reverse('pagecontent-list')).json()), 2)
+
+        self.assertEqual(APIClient().post(reverse('category-list'), {"name": "Ink"}).status_code, 401)
+
+
+    async def test_catalog_is_served_under_asgi(self):
+        """Test that the views answer through the ASGI handler with async middleware."""
+        response = await self.async_client.get(reverse('product-list'), {'search': 'pencil'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 6)
+
+
+    def test_replica_middleware_runs_natively_under_asgi(self):
+        """Test that the replica middleware does not put async views in a thread."""
+        async def get_response(request):
+            return None
+
+        self.assertTrue(iscoroutinefunction(ReplicaMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(ReplicaMiddleware(lambda request: None)))
+
+
+
+class CatalogBenchmarkTest(LiveServerTestCase):
+
+    def test_benchmark_reports_throughput_and_latency(self):
+        """Test that the benchmark command loads a running server and reports percentiles."""
+        Category.objects.create(name="Paper")
+        out = io.StringIO()
+
+        call_command(
+            'benchmark_catalog', f'live={self.live_server_url}', '--path', '/store/categories/',
+            '--connections', '5', '--duration', '0.5', stdout=out,
+        )
+
+        report = json.loads(out.getvalue())['live']
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(report['statuses'], {'200': report['requests']})
+        self.assertEqual(report['errors'], {})
+        self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['p99'])
@@ -0,0 +1,211 @@
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+import socketserver
+import threading
+
+from rest_framework.test import APIClient
+
+from store.emails import ActivationEmail, queue_email, queue_order_confirmation, send_queued_batch, send_queued_emails
+from store.models import *
+from store.signals import order_created
+
+
+
+
+User = get_user_model()
+
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server that records connections and delivered messages."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            command = self.rfile.readline().decode().strip()
+            verb = command.split(' ')[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while (line := self.rfile.readline().decode()) != '.\r\n':
+                    lines.append(line)
+                self.server.messages.append(''.join(lines))
+                self.reply('250 queued')
+            elif verb == 'QUIT' or not command:
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+
+class FailingBackend(LocmemEmailBackend):
+    """Refuses every message addressed to bounce@example.com."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bounce@example.com' in message.to:
+                raise SMTPRecipientsRefused({'bounce@example.com': (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+
+class EmailQueueTest(TestCase):
+
+    def setUp(self):
+        """Create a customer to email."""
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="buyerpass")
+        self.customer = Customer.objects.get(user=self.user)
+
+
+    def test_queued_mail_is_sent_by_the_worker(self):
+        """Test that queued mails are not sent until the worker runs."""
+        queue_email("Hello", "Welcome", ["buyer@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
+
+        result = send_queued_emails()
+
+        self.assertEqual(result, {'sent': 1, 'retried': 0, 'failed': 0})
+        self.assertEqual(mail.outbox[0].subject, "Hello")
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        self.assertEqual(QueuedEmail.objects.get().status, QueuedEmail.STATUS_SENT)
+
+
+    def test_batch_uses_one_smtp_connection(self):
+        """Test that a batch is delivered over a single SMTP connection."""
+        server = SMTPStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        for number in range(5):
+            queue_email(f"Message {number}", "Body", [f"customer{number}@example.com"])
+
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1],
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            result = send_queued_batch()
+
+        self.assertEqual(result['sent'], 5)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.messages), 5)
+
+
+    def test_failures_are_retried_with_backoff(self):
+        """Test that a failed send is retried later and given up after MAX_ATTEMPTS."""
+        queued = queue_email("Hello", "Body", ["bounce@example.com"])
+        queue_email("Hello", "Body", ["buyer@example.com"])
+        config = {'BATCH_SIZE': 10, 'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 60, 'RATE_LIMIT': None, 'LEASE': 300}
+        connection = FailingBackend()
+
+        self.assertEqual(send_queued_emails(config, connection), {'sent': 1, 'retried': 1, 'failed': 0})
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedEmail.STATUS_QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", queued.last_error)
+        self.assertGreater(queued.next_attempt_at, now() + timedelta(seconds=50))
+
+        QueuedEmail.objects.filter(pk=queued.pk).update(next_attempt_at=now())
+        self.assertEqual(send_queued_emails(config, connection), {'sent': 0, 'retried': 0, 'failed': 1})
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedEmail.STATUS_FAILED)
+
+
+    def test_rate_limit_spaces_sends(self):
+        """Test that RATE_LIMIT caps the number of messages sent per second."""
+        for _ in range(3):
+            queue_email("Hello", "Body", ["buyer@example.com"])
+        config = {'BATCH_SIZE': 10, 'MAX_ATTEMPTS': 5, 'RETRY_DELAY': 60, 'RATE_LIMIT': 20, 'LEASE': 300}
+
+        started = now()
+        send_queued_batch(config, get_connection())
+
+        self.assertGreaterEqual(now() - started, timedelta(seconds=0.1))
+        self.assertEqual(len(mail.outbox), 3)
+
+
+    def test_claimed_messages_are_leased(self):
+        """Test that a message claimed by a worker is not picked up by another one."""
+        queued = queue_email("Hello", "Body", ["buyer@example.com"])
+        QueuedEmail.objects.filter(pk=queued.pk).update(next_attempt_at=now() + timedelta(minutes=5))
+
+        self.assertEqual(send_queued_batch(), {})
+
+
+    def test_order_confirmation_is_queued(self):
+        """Test that creating an order queues a confirmation to the customer."""
+        order = Order.objects.create(customer=self.customer)
+
+        order_created.send(sender=None, order=order)
+
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.to, ["buyer@example.com"])
+        self.assertIn(f"#{order.id}", queued.subject)
+
+
+    def test_order_confirmation_reads_items_in_one_query(self):
+        """Test that the confirmation lists every item without a query per product."""
+        category = Category.objects.create(name="Paper")
+        order = Order.objects.create(customer=self.customer)
+        for number in range(4):
+            product = Product.objects.create(name=f"Notebook {number}", description="A5", price=2, category=category)
+            OrderItem.objects.create(order=order, product=product, quantity=number + 1, price=2)
+
+        # The user, the items with their products and the INSERT.
+        with self.assertNumQueries(3):
+            queue_order_confirmation(order)
+
+        body = QueuedEmail.objects.get().body
+        self.assertIn("4 x Notebook 3 - 2.00", body)
+
+
+    def test_djoser_activation_email_is_queued(self):
+        """Test that djoser activation mails go through the queue."""
+        ActivationEmail(context={"user": self.user}).send(["buyer@example.com"])
+
+        self.assertEqual(len(mail.outbox), 0)
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.to, ["buyer@example.com"])
+        self.assertIn("activate", queued.body.lower())
+
+
+    def test_private_email_action_queues_mail(self):
+        """Test that send_private_email queues a mail to the customer."""
+        admin = User.objects.create_superuser(username="admin", email="admin@example.com", password="adminpass")
+        client = APIClient()
+        client.force_authenticate(user=admin)
+
+        response = client.post(
+            reverse("customer-send-private-email", args=[self.customer.pk]),
+            {"subject": "About your order", "body": "It is on its way."},
+        )
+
+        self.assertEqual(response.status_code, 202)
+        queued = QueuedEmail.objects.get(pk=response.data["queued_email_id"])
+        self.assertEqual(queued.to, ["buyer@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
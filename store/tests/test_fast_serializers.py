@@ -0,0 +1,139 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from store.fast_serializers import *
+from store.models import *
+from store.serializers import *
+
+
+User = get_user_model()
+
+
+
+class ValuesSerializerTest(TestCase):
+
+    def setUp(self):
+        """Create products, a cart and orders covering empty, null and nested values."""
+        self.request = RequestFactory().get('/store/products/')
+        self.category = Category.objects.create(name="Paper")
+        self.product = Product.objects.create(
+            name="Notebook", description="Lined", price="4.50", category=self.category, stock=7,
+        )
+        self.rated = Product.objects.create(
+            name="Pen", description="", price=12, category=self.category,
+            image='products/pen.jpg', rating=4.5, ratings_4=1, ratings_5=1, approved_comments_count=2,
+        )
+
+        self.cart = Cart.objects.create()
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.rated, quantity=1)
+
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass", first_name="Ada", last_name="Byron",
+        )
+        self.admin = User.objects.create_user(username="admin", email="admin@example.com", password="pass", is_staff=True)
+        self.customer, _ = Customer.objects.get_or_create(user=self.user, defaults={'phone_number': '555'})
+        self.order = Order.objects.create(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.rated, quantity=1)
+        self.order.update_totals()
+        self.empty_order = Order.objects.create(customer=self.customer)
+
+
+    def assertRendersLike(self, values_serializer_class, queryset, context=None):
+        """Assert that the rows of queryset render to the same JSON as its instances."""
+        context = context or {}
+        expected = JSONRenderer().render(values_serializer_class.serializer_class(queryset, many=True, context=context).data)
+        rows = values_serializer_class.values(queryset)
+        actual = JSONRenderer().render(values_serializer_class(rows, context=context).data)
+        self.assertEqual(actual, expected)
+
+
+    def test_products_render_like_the_product_serializer(self):
+        """Test that products, with and without image and rating, match ProductSerializer."""
+        queryset = Product.objects.select_related('category').order_by('pk')
+
+        self.assertRendersLike(ProductValuesSerializer, queryset, {'request': self.request})
+        self.assertRendersLike(ProductValuesSerializer, queryset)
+
+
+    def test_cart_items_render_like_the_cart_item_serializer(self):
+        """Test that cart items, with their nested product and total, match CartItemSerializer."""
+        self.assertRendersLike(CartItemValuesSerializer, CartItem.objects.filter(cart=self.cart).order_by('pk'))
+
+
+    def test_orders_render_like_the_order_serializers(self):
+        """Test that orders, with their items and customer, match the order serializers."""
+        queryset = Order.objects.order_by('pk')
+
+        self.assertRendersLike(OrderValuesSerializer, queryset)
+        self.assertRendersLike(OrderForAdminValuesSerializer, queryset)
+
+
+    def test_order_items_are_read_in_one_query(self):
+        """Test that the items of all orders are read together, without instances."""
+        rows = list(OrderValuesSerializer.values(Order.objects.order_by('pk')))
+
+        with self.assertNumQueries(1):
+            data = OrderValuesSerializer(rows).data
+
+        self.assertEqual([len(order['items']) for order in data], [2, 0])
+        self.assertEqual(OrderValuesSerializer([]).data, [])
+
+
+    def test_list_endpoints_match_the_serializers(self):
+        """Test that the list responses of products, cart items and orders did not change."""
+        client = APIClient()
+        products = client.get('/store/products/', {'ordering': 'name'})
+        expected = ProductSerializer(
+            Product.objects.select_related('category').order_by('name'), many=True,
+            context={'request': products.wsgi_request},
+        ).data
+        self.assertEqual(products.json()['results'], json_of(expected))
+
+        client.force_authenticate(self.user)
+        cart_items = client.get(f'/store/carts/{self.cart.pk}/items/')
+        expected = CartItemSerializer(CartItem.objects.filter(cart=self.cart), many=True).data
+        self.assertEqual(sorted(cart_items.json(), key=lambda item: item['id']), json_of(expected))
+
+        orders = client.get('/store/orders/', {'ordering': 'datetime_created'})
+        self.assertEqual(orders.json(), json_of(OrderSerializer(Order.objects.order_by('datetime_created'), many=True).data))
+
+        client.force_authenticate(self.admin)
+        orders = client.get('/store/orders/', {'ordering': 'datetime_created'})
+        expected = OrderForAdminSerializer(Order.objects.order_by('datetime_created'), many=True).data
+        self.assertEqual(orders.json(), json_of(expected))
+
+
+    def test_unsupported_fields_are_rejected(self):
+        """Test that fields that cannot be read from rows fail when the serializer is first used."""
+        class CategoryValuesSerializer(ValuesSerializer):
+            serializer_class = CategorySerializer
+
+        class WholeProductSerializer(serializers.ModelSerializer):
+            product = serializers.StringRelatedField()
+
+            class Meta:
+                model = CartItem
+                fields = ['id', 'product']
+
+        class WholeProductValuesSerializer(ValuesSerializer):
+            serializer_class = WholeProductSerializer
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'define get_num_of_products(self, row)'):
+            CategoryValuesSerializer.values(Category.objects.all())
+        with self.assertRaisesMessage(ImproperlyConfigured, 'only primary keys of relations'):
+            WholeProductValuesSerializer.values(CartItem.objects.all())
+
+
+
+def json_of(data):
+    return json.loads(JSONRenderer().render(data))
@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient, APIRequestFactory
+
+from store.identity import get_customer, get_customer_id, get_permissions, has_perm
+from store.models import *
+
+
+
+
+User = get_user_model()
+
+
+
+class IdentityResolutionTest(TestCase):
+
+    def setUp(self):
+        """Create a user, a group with the private email permission and empty caches."""
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username="staffer", email="staffer@example.com", password="pass")
+        self.customer = Customer.objects.get(user=self.user)
+        self.permission = Permission.objects.get(codename="send_private_email")
+        self.group = Group.objects.create(name="Support")
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+    def make_request(self):
+        request = self.factory.get('/fake-url/')
+        request.user = User.objects.get(pk=self.user.pk)
+        return request
+
+
+    def test_customer_is_resolved_once_per_request(self):
+        """Test that the customer is loaded only once however often it is asked for."""
+        request = self.make_request()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(get_customer_id(request), self.customer.id)
+            self.assertEqual(get_customer(request), self.customer)
+            self.assertIs(get_customer(request), get_customer(request))
+
+
+    def test_customer_id_is_cached_across_requests(self):
+        """Test that later requests find the customer id without a query."""
+        get_customer_id(self.make_request())
+
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_customer_id(request), self.customer.id)
+
+
+    def test_permissions_are_cached_across_requests(self):
+        """Test that the permission set is loaded once and reused by later requests."""
+        self.user.user_permissions.add(self.permission)
+
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(has_perm(request, "store.send_private_email"))
+
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            self.assertTrue(has_perm(request, "store.send_private_email"))
+            self.assertIn("store.send_private_email", get_permissions(request))
+
+
+    def test_user_permission_changes_invalidate_cache(self):
+        """Test that removing a user permission is seen by the next request."""
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(has_perm(self.make_request(), "store.send_private_email"))
+
+        self.user.user_permissions.remove(self.permission)
+
+        self.assertFalse(has_perm(self.make_request(), "store.send_private_email"))
+
+
+    def test_group_changes_invalidate_cache(self):
+        """Test that group membership and group permission changes are seen by the next request."""
+        self.user.groups.add(self.group)
+        self.assertFalse(has_perm(self.make_request(), "store.send_private_email"))
+
+        self.group.permissions.add(self.permission)
+        self.assertTrue(has_perm(self.make_request(), "store.send_private_email"))
+
+        self.user.groups.remove(self.group)
+        self.assertFalse(has_perm(self.make_request(), "store.send_private_email"))
+
+        self.user.groups.add(self.group)
+        self.group.delete()
+        self.assertFalse(has_perm(self.make_request(), "store.send_private_email"))
+
+
+    def test_superusers_and_inactive_users(self):
+        """Test that superusers have every permission and inactive users none."""
+        superuser = User.objects.create_superuser(username="root", email="root@example.com", password="pass")
+        request = self.factory.get('/fake-url/')
+        request.user = superuser
+        self.assertTrue(has_perm(request, "store.send_private_email"))
+
+        self.user.user_permissions.add(self.permission)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(has_perm(self.make_request(), "store.send_private_email"))
+
+
+    def test_private_email_action_uses_cached_permissions(self):
+        """Test that the send_private_email action is allowed through a group permission."""
+        self.group.permissions.add(self.permission)
+        self.user.groups.add(self.group)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post(
+            reverse("customer-send-private-email", args=[self.customer.pk]),
+            {"subject": "Hello", "body": "Your account manager"},
+        )
+
+        self.assertEqual(response.status_code, 202)
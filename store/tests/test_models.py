@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.db import transaction
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils.timezone import now
 from django.contrib.auth import get_user_model
@@ -157,6 +158,26 @@ class ProductModelTest(TestCase):
         """Test created_at is set on creation."""
         self.assertIsNotNone(self.product.created_at)
 
+    def test_save_bumps_version(self):
+        """Test that every save increments the version."""
+        self.assertEqual(self.product.version, 1)
+        self.product.price = 10
+        self.product.save()
+        self.assertEqual(self.product.version, 2)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).version, 2)
+
+    def test_stale_save_raises_version_conflict(self):
+        """Test that saving a copy loaded before another save is rejected."""
+        first = Product.objects.get(pk=self.product.pk)
+        second = Product.objects.get(pk=self.product.pk)
+        first.price = 10
+        first.save()
+
+        second.price = 20
+        with self.assertRaises(VersionConflict), transaction.atomic():
+            second.save()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).price, 10)
+
 
 
 class CustomerModelTest(TestCase):
@@ -253,6 +274,19 @@ class OrderModelTest(TestCase):
         new_order = Order.objects.create(customer=self.customer)
         self.assertEqual(new_order.status, Order.ORDER_STATUS_UNPAID)
 
+    def test_update_totals(self):
+        """Test that update_totals stores the sum and count of the order items."""
+        category = Category.objects.create(name="Office")
+        pen = Product.objects.create(name="Pen", description="Blue pen", price=2, category=category)
+        paper = Product.objects.create(name="Paper", description="A4 paper", price=5, category=category)
+        OrderItem.objects.create(order=self.order, product=pen, quantity=3, price=Decimal("2.00"))
+        OrderItem.objects.create(order=self.order, product=paper, quantity=1, price=Decimal("5.00"))
+
+        self.order.update_totals()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal("11.00"))
+        self.assertEqual(self.order.item_count, 2)
+
 
 
 class OrderItemModelTest(TestCase):
@@ -452,6 +486,26 @@ class CommentModelTest(TestCase):
         actual_str = f"Comment by {comment.name} on {comment.product.name}"
         self.assertEqual(actual_str, expected_str)
 
+    def test_approved_comments_count(self):
+        """Test that the product keeps count of its approved comments."""
+        comment = Comment.objects.create(product=self.product, name="Sam", body="Nice")
+        approved = Comment.objects.create(
+            product=self.product, name="Kim", body="Great", status=Comment.COMMENT_STATUS_APPROVED
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.approved_comments_count, 1)
+
+        comment.status = Comment.COMMENT_STATUS_APPROVED
+        comment.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.approved_comments_count, 2)
+
+        comment.status = Comment.COMMENT_STATUS_NOT_APPROVED
+        comment.save()
+        Comment.objects.get(pk=approved.pk).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.approved_comments_count, 0)
+
 
 
 class CartModelTest(TestCase):
@@ -0,0 +1,119 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.models import *
+from store.moderation import moderate_comments, SKIPPED_ALREADY_MODERATED, SKIPPED_NOT_FOUND
+
+
+
+
+User = get_user_model()
+
+
+
+class CommentModerationTest(APITestCase):
+
+    def setUp(self):
+        """Create waiting comments on two products and one approved comment."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass"
+        )
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="readerpass"
+        )
+        category = Category.objects.create(name="Paper")
+        self.notebook = Product.objects.create(name="Notebook", description="A5", price=4, category=category)
+        self.folder = Product.objects.create(name="Folder", description="Blue", price=2, category=category)
+
+        self.waiting = [
+            Comment.objects.create(product=product, name="reader", body=f"Comment {number}")
+            for number, product in enumerate([self.notebook, self.notebook, self.folder, self.folder])
+        ]
+        self.approved = Comment.objects.create(
+            product=self.notebook, name="reader", body="Approved", status=Comment.COMMENT_STATUS_APPROVED
+        )
+
+        self.queue_url = reverse("comment-moderation-list")
+        self.decide_url = reverse("comment-moderation-decide")
+
+
+    def test_moderate_comments_updates_statuses_and_counts(self):
+        """Test that decisions are applied with one UPDATE per decision and counts follow."""
+        with CaptureQueriesContext(connection) as queries:
+            result = moderate_comments(
+                approve=[self.waiting[0].id, self.waiting[1].id, self.waiting[2].id],
+                reject=[self.waiting[3].id],
+            )
+
+        comment_updates = [query for query in queries if query['sql'].startswith('UPDATE "store_comment"')]
+        product_updates = [query for query in queries if query['sql'].startswith('UPDATE "store_product"')]
+        self.assertEqual(len(comment_updates), 2)
+        self.assertEqual(len(product_updates), 1)
+        self.assertEqual(result['skipped'], [])
+
+        self.notebook.refresh_from_db()
+        self.folder.refresh_from_db()
+        self.assertEqual(self.notebook.approved_comments_count, 3)
+        self.assertEqual(self.folder.approved_comments_count, 1)
+        self.assertEqual(Comment.objects.get(pk=self.waiting[3].pk).status, Comment.COMMENT_STATUS_NOT_APPROVED)
+
+
+    def test_moderated_and_missing_comments_are_skipped(self):
+        """Test that only waiting comments are moderated."""
+        result = moderate_comments(approve=[self.approved.id, 999999])
+
+        self.assertEqual(result['approved'], [])
+        self.assertEqual(result['skipped'], [
+            {'id': self.approved.id, 'reason': SKIPPED_ALREADY_MODERATED},
+            {'id': 999999, 'reason': SKIPPED_NOT_FOUND},
+        ])
+        self.notebook.refresh_from_db()
+        self.assertEqual(self.notebook.approved_comments_count, 1)
+
+
+    def test_queue_lists_waiting_comments_oldest_first(self):
+        """Test that the moderation queue only lists waiting comments."""
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(self.queue_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([comment["id"] for comment in response.data["results"]], [comment.id for comment in self.waiting])
+
+
+    def test_decide_endpoint(self):
+        """Test that staff can approve and reject comments in one request."""
+        self.client.force_authenticate(user=self.admin_user)
+        payload = {"approve": [self.waiting[0].id], "reject": [self.waiting[1].id]}
+
+        response = self.client.post(self.decide_url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["approved"], [self.waiting[0].id])
+        self.assertEqual(response.data["rejected"], [self.waiting[1].id])
+        self.assertEqual(len(self.client.get(self.queue_url).data["results"]), 2)
+
+
+    def test_decide_endpoint_rejects_conflicting_decisions(self):
+        """Test that a comment cannot be approved and rejected at once."""
+        self.client.force_authenticate(user=self.admin_user)
+        payload = {"approve": [self.waiting[0].id], "reject": [self.waiting[0].id]}
+
+        response = self.client.post(self.decide_url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_moderation_is_staff_only(self):
+        """Test that regular users cannot see or moderate the queue."""
+        self.client.force_authenticate(user=self.user)
+
+        self.assertEqual(self.client.get(self.queue_url).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(self.decide_url, {"approve": [self.waiting[0].id]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
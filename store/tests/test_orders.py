@@ -0,0 +1,156 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.models import *
+from store.orders import change_orders_status, SKIPPED_INVALID_TRANSITION, SKIPPED_NOT_FOUND
+from store.signals import orders_status_changed
+
+
+
+
+User = get_user_model()
+
+
+
+class BulkOrderStatusTest(APITestCase):
+
+    def setUp(self):
+        """Create unpaid, paid and canceled orders."""
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass"
+        )
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="buyerpass"
+        )
+        customer = Customer.objects.get(user=self.user)
+
+        self.unpaid_orders = [Order.objects.create(customer=customer) for _ in range(3)]
+        self.paid_order = Order.objects.create(customer=customer, status=Order.ORDER_STATUS_PAID)
+        self.canceled_order = Order.objects.create(customer=customer, status=Order.ORDER_STATUS_CANCELED)
+
+        self.bulk_status_url = reverse("order-bulk-status")
+
+
+    def test_unpaid_orders_are_updated_with_one_statement(self):
+        """Test that all allowed transitions are applied by a single UPDATE."""
+        order_ids = [order.id for order in self.unpaid_orders]
+
+        with CaptureQueriesContext(connection) as queries:
+            result = change_orders_status(order_ids, Order.ORDER_STATUS_PAID)
+
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "store_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(result, {'updated': sorted(order_ids), 'skipped': []})
+        self.assertEqual(Order.objects.filter(status=Order.ORDER_STATUS_PAID).count(), 4)
+
+
+    def test_disallowed_and_missing_orders_are_skipped(self):
+        """Test that paid, canceled and unknown orders are reported as skipped."""
+        result = change_orders_status(
+            [self.unpaid_orders[0].id, self.paid_order.id, self.canceled_order.id, 999999],
+            Order.ORDER_STATUS_CANCELED,
+        )
+
+        self.assertEqual(result['updated'], [self.unpaid_orders[0].id])
+        self.assertEqual(result['skipped'], [
+            {'id': self.paid_order.id, 'reason': SKIPPED_INVALID_TRANSITION},
+            {'id': self.canceled_order.id, 'reason': SKIPPED_INVALID_TRANSITION},
+            {'id': 999999, 'reason': SKIPPED_NOT_FOUND},
+        ])
+        self.paid_order.refresh_from_db()
+        self.assertEqual(self.paid_order.status, Order.ORDER_STATUS_PAID)
+
+
+    def test_one_event_is_sent_per_batch(self):
+        """Test that orders_status_changed is sent once with all moved orders."""
+        events = []
+
+        def receiver(sender, orders, old_status, new_status, **kwargs):
+            events.append(([order.id for order in orders], old_status, new_status))
+
+        orders_status_changed.connect(receiver)
+        self.addCleanup(orders_status_changed.disconnect, receiver)
+
+        change_orders_status([order.id for order in self.unpaid_orders], Order.ORDER_STATUS_PAID)
+
+        self.assertEqual(events, [
+            (sorted(order.id for order in self.unpaid_orders), Order.ORDER_STATUS_UNPAID, Order.ORDER_STATUS_PAID),
+        ])
+
+
+    def test_bulk_status_endpoint(self):
+        """Test that an admin can change the status of many orders at once."""
+        self.client.force_authenticate(user=self.admin_user)
+        payload = {"order_ids": [self.unpaid_orders[0].id, self.paid_order.id], "status": "p"}
+
+        response = self.client.post(self.bulk_status_url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], [self.unpaid_orders[0].id])
+        self.assertEqual(response.data["skipped"], [{"id": self.paid_order.id, "reason": SKIPPED_INVALID_TRANSITION}])
+
+
+    def test_bulk_status_endpoint_rejects_unpaid_target(self):
+        """Test that orders cannot be moved back to unpaid."""
+        self.client.force_authenticate(user=self.admin_user)
+        payload = {"order_ids": [self.paid_order.id], "status": "u"}
+
+        response = self.client.post(self.bulk_status_url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_single_order_updates_follow_the_allowed_transitions(self):
+        """Test that a PATCH cannot move an order back from canceled or paid, but can pay an unpaid one."""
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.patch(
+            reverse("order-detail", args=[self.canceled_order.id]), {"status": "p"}, format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("status", response.data)
+        self.canceled_order.refresh_from_db()
+        self.assertEqual(self.canceled_order.status, Order.ORDER_STATUS_CANCELED)
+
+        response = self.client.patch(reverse("order-detail", args=[self.paid_order.id]), {"status": "u"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(
+            reverse("order-detail", args=[self.unpaid_orders[0].id]), {"status": "p"}, format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+    def test_admin_changelist_follows_the_allowed_transitions(self):
+        """Test that the editable status column of the order changelist rejects disallowed transitions."""
+        self.client.force_login(self.admin_user)
+
+        response = self.client.post(reverse("admin:store_order_changelist"), {
+            "form-TOTAL_FORMS": "1",
+            "form-INITIAL_FORMS": "1",
+            "form-0-id": str(self.canceled_order.id),
+            "form-0-status": Order.ORDER_STATUS_PAID,
+            "form-0-version": str(self.canceled_order.version),
+            "_save": "Save",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "An order cannot go from Canceled to Paid.")
+        self.canceled_order.refresh_from_db()
+        self.assertEqual(self.canceled_order.status, Order.ORDER_STATUS_CANCELED)
+
+
+    def test_bulk_status_endpoint_is_admin_only(self):
+        """Test that regular users cannot change order statuses in bulk."""
+        self.client.force_authenticate(user=self.user)
+        payload = {"order_ids": [self.unpaid_orders[0].id], "status": "p"}
+
+        response = self.client.post(self.bulk_status_url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
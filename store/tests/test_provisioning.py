@@ -0,0 +1,201 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from io import StringIO
+from unittest import mock
+import os
+import tempfile
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from store.models import *
+from store.provisioning import (
+    CLAIM_TIMEOUT, SKIPPED_DUPLICATE_EMAIL, SKIPPED_DUPLICATE_USERNAME, hash_passwords, provision_customers,
+    queue_provisioning, run_queued_provisioning_jobs,
+)
+
+
+
+
+User = get_user_model()
+
+
+
+class ProvisionCustomersTest(TestCase):
+
+    def rows(self, count, prefix="employee"):
+        return [
+            {
+                "username": f"{prefix}{number}",
+                "email": f"{prefix}{number}@corp.example.com",
+                "password": f"secret-{number}",
+                "phone_number": f"555-{number:04}",
+            }
+            for number in range(count)
+        ]
+
+
+    def test_users_and_customers_are_inserted_in_chunks(self):
+        """Test that users and customers are created with one INSERT each per chunk."""
+        with CaptureQueriesContext(connection) as queries:
+            result = provision_customers(self.rows(25), chunk_size=10, workers=1)
+
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len([sql for sql in inserts if 'core_customuser' in sql]), 3)
+        self.assertEqual(len([sql for sql in inserts if 'store_customer' in sql]), 3)
+        self.assertEqual(len(result['created']), 25)
+        self.assertEqual(Customer.objects.filter(user__username__startswith="employee").count(), 25)
+
+        customer = Customer.objects.select_related('user').get(user__username="employee7")
+        self.assertEqual(customer.phone_number, "555-0007")
+        self.assertTrue(customer.user.check_password("secret-7"))
+
+
+    def test_duplicates_are_skipped(self):
+        """Test that taken and repeated usernames and emails are reported as skipped."""
+        User.objects.create_user(username="employee0", email="taken@example.com", password="pass")
+        rows = self.rows(3)
+        rows.append({"username": "employee1", "email": "other@example.com"})
+        rows.append({"username": "newcomer", "email": "employee2@corp.example.com"})
+
+        result = provision_customers(rows, workers=1)
+
+        self.assertEqual(result['created'], ["employee1", "employee2"])
+        self.assertEqual(result['skipped'], [
+            {'username': "employee0", 'reason': SKIPPED_DUPLICATE_USERNAME},
+            {'username': "employee1", 'reason': SKIPPED_DUPLICATE_USERNAME},
+            {'username': "newcomer", 'reason': SKIPPED_DUPLICATE_EMAIL},
+        ])
+
+
+    def test_users_created_concurrently_are_skipped(self):
+        """Test that a user created after the duplicate check is reported as skipped instead of failing the chunk."""
+        rows = self.rows(3)
+        User.objects.create_user(username="other", email="employee1@corp.example.com", password="pass")
+
+        with mock.patch('store.provisioning._skip_duplicates', side_effect=lambda rows: (rows, [])):
+            result = provision_customers(rows, workers=1)
+
+        self.assertEqual(result['created'], ["employee0", "employee2"])
+        self.assertEqual(result['skipped'], [{'username': "employee1", 'reason': SKIPPED_DUPLICATE_EMAIL}])
+        self.assertEqual(Customer.objects.filter(user__username__startswith="employee").count(), 2)
+
+
+    def test_rows_without_password_get_unusable_passwords(self):
+        """Test that users provisioned without a password cannot log in until they set one."""
+        provision_customers([{"username": "nopass", "email": "nopass@example.com"}], workers=1)
+
+        self.assertFalse(User.objects.get(username="nopass").has_usable_password())
+
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        """Test that hashing in a process pool gives valid hashes in input order."""
+        passwords = [f"secret-{number}" for number in range(8)]
+
+        hashes = hash_passwords(passwords, workers=2)
+
+        user = User(username="checker")
+        for password, password_hash in zip(passwords, hashes):
+            user.password = password_hash
+            self.assertTrue(user.check_password(password))
+
+
+    def test_command_reads_csv(self):
+        """Test that the provision_customers command creates customers from a CSV file."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write("username,email,password,birth_date\n")
+            csv_file.write("alice,alice@corp.example.com,secret-a,1990-01-02\n")
+            csv_file.write("bob,bob@corp.example.com,,\n")
+        self.addCleanup(os.remove, csv_file.name)
+
+        out = StringIO()
+        call_command('provision_customers', csv_file.name, '--workers', '1', stdout=out)
+
+        self.assertIn('2 customers created', out.getvalue())
+        self.assertEqual(str(Customer.objects.get(user__username="alice").birth_date), "1990-01-02")
+
+
+    def test_provision_endpoint(self):
+        """Test that admins can queue customers through the API and read the result once a worker ran the job."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser("admin", "admin@example.com", "adminpass"))
+        rows = self.rows(3)
+        rows[0]["birth_date"] = "1990-01-02"
+
+        response = client.post(reverse("customer-provision"), {"customers": rows}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data["status"], response.data["row_count"]), (ProvisioningJob.STATUS_QUEUED, 3))
+        self.assertFalse(User.objects.filter(username="employee0").exists())
+        stored = ProvisioningJob.objects.get(pk=response.data["id"]).rows
+        self.assertNotIn("secret-1", str(stored))
+        self.assertTrue(all("password" not in row and row["password_hash"] for row in stored))
+
+        out = StringIO()
+        call_command('run_provisioning_jobs', '--workers', '1', stdout=out)
+        self.assertIn('3 of 3 created', out.getvalue())
+        self.assertEqual(run_queued_provisioning_jobs(workers=1), [])
+
+        url = reverse("customer-provision-job", kwargs={"job_id": response.data["id"]})
+        job = client.get(url).data
+        self.assertEqual(job["status"], ProvisioningJob.STATUS_DONE)
+        self.assertEqual(job["created"], ["employee0", "employee1", "employee2"])
+        self.assertEqual(ProvisioningJob.objects.get(pk=job["id"]).rows, [])
+        self.assertEqual(str(Customer.objects.get(user__username="employee0").birth_date), "1990-01-02")
+        self.assertTrue(User.objects.get(username="employee1").check_password("secret-1"))
+
+
+    def test_jobs_of_dead_workers_are_claimed_again(self):
+        """Test that a running job is left to its worker until its claim expires, and then run again."""
+        job = queue_provisioning(self.rows(2), workers=1)
+        ProvisioningJob.objects.filter(pk=job.pk).update(
+            status=ProvisioningJob.STATUS_RUNNING, datetime_claimed=timezone.now(),
+        )
+        self.assertEqual(run_queued_provisioning_jobs(workers=1), [])
+
+        ProvisioningJob.objects.filter(pk=job.pk).update(datetime_claimed=timezone.now() - CLAIM_TIMEOUT * 2)
+        [job] = run_queued_provisioning_jobs(workers=1)
+
+        self.assertEqual((job.status, job.created, job.rows), (ProvisioningJob.STATUS_DONE, ["employee0", "employee1"], []))
+        self.assertTrue(User.objects.get(username="employee0").check_password("secret-0"))
+
+
+    def test_failed_jobs_drop_their_rows(self):
+        """Test that a job that fails is marked failed and no longer holds its rows."""
+        job = queue_provisioning(self.rows(2), workers=1)
+
+        with mock.patch('store.provisioning.provision_customers', side_effect=RuntimeError("database went away")), \
+                self.assertLogs('store.provisioning', 'ERROR'):
+            [job] = run_queued_provisioning_jobs(workers=1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows), (ProvisioningJob.STATUS_FAILED, []))
+        self.assertIsNotNone(job.datetime_finished)
+
+
+    def test_provision_endpoint_validates_rows(self):
+        """Test that rows with invalid emails or weak passwords are rejected."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser("admin", "admin@example.com", "adminpass"))
+        payload = {"customers": [{"username": "weak", "email": "not-an-email", "password": "123"}]}
+
+        response = client.post(reverse("customer-provision"), payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(User.objects.filter(username="weak").count(), 0)
+
+
+    def test_provision_endpoint_is_admin_only(self):
+        """Test that regular users cannot provision customers."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("regular", "regular@example.com", "pass"))
+
+        response = client.post(reverse("customer-provision"), {"customers": self.rows(1)}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
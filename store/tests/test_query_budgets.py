@@ -0,0 +1,232 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, reverse
+
+from rest_framework.test import APIClient
+
+from core.db.instrumentation import (
+    QueryBudgetExceeded, QueryBudgetTestMixin, QueryStats, budget_problems, fingerprint, record_queries,
+)
+from store import urls as store_urls
+from store.models import *
+
+
+
+
+User = get_user_model()
+
+ROWS = 5
+
+
+
+def named_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern) and pattern.name and 'format' not in pattern.pattern.regex.groupindex:
+            yield pattern
+
+
+
+class StoreQueryBudgetTest(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        """Create ROWS rows behind every store list, so per-row queries show up as repeats."""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="pass", is_staff=True, is_superuser=True,
+        )
+        customer = Customer.objects.get(user=self.admin)
+        category = Category.objects.create(name="Paper")
+        products = [
+            Product.objects.create(name=f"Notebook {number}", description="A5", price=2, stock=10, category=category)
+            for number in range(ROWS)
+        ]
+        for number in range(ROWS):
+            Category.objects.create(name=f"Category {number}")
+            User.objects.create_user(username=f"reader{number}", email=f"reader{number}@example.com")
+            PageContent.objects.create(page_name=f"page{number}", content="Text")
+            TeamMember.objects.create(name=f"Member {number}", role="Buyer", bio="Buys")
+            Campaign.objects.create(name=f"Campaign {number}", subject_template="Hi", body_template="Hello")
+            Comment.objects.create(product=products[0], name=f"reader{number}", body="Nice", rating=4)
+        cart = Cart.objects.create()
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        for _ in range(ROWS):
+            order = Order.objects.create(customer=customer)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+        self.ids = {
+            'product': products[0].pk,
+            'category': category.pk,
+            'customer': customer.pk,
+            'pagecontent': PageContent.objects.first().pk,
+            'teammember': TeamMember.objects.first().pk,
+            'cart': cart.pk,
+            'cart-items': cart.items.first().pk,
+            'order': order.pk,
+            'campaign': Campaign.objects.first().pk,
+            'product-comments': Comment.objects.first().pk,
+            'category-products': products[0].pk,
+        }
+        self.parents = {
+            'product_pk': products[0].pk,
+            'cart_pk': cart.pk,
+            'category_pk': category.pk,
+            'job_id': ProvisioningJob.objects.create().pk,
+        }
+
+
+    def url_for(self, pattern):
+        kwargs = {}
+        for name in pattern.pattern.regex.groupindex:
+            if name == 'pk':
+                basename = max((key for key in self.ids if pattern.name.startswith(key + '-')), key=len)
+                kwargs[name] = self.ids[basename]
+            else:
+                kwargs[name] = self.parents[name]
+        return reverse(pattern.name, kwargs=kwargs)
+
+
+    def test_every_store_route_is_within_its_budget(self):
+        """Test that a GET of each store route stays within its query budget and repeats no query per row."""
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        urls = {}
+        for pattern in named_patterns(store_urls.urlpatterns):
+            urls.setdefault(self.url_for(pattern), pattern.name)
+        self.assertGreater(len(urls), 30)
+
+        for url, name in urls.items():
+            with self.subTest(route=name):
+                cache.clear()
+                response = client.get(url, HTTP_ACCEPT='application/json')
+
+                self.assertLess(response.status_code, 500)
+                self.assertWithinQueryBudget(response)
+
+
+    def test_cart_and_checkout_writes_are_within_their_budgets(self):
+        """Test that filling a cart, changing it, checking out and updating the order stay within budget."""
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        products = Product.objects.order_by('id')
+
+        response = client.post(reverse('cart-list'), {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertWithinQueryBudget(response)
+        cart_id = response.data['id']
+
+        for product in products:
+            response = client.post(
+                reverse('cart-items-list', kwargs={'cart_pk': cart_id}), {'product': product.pk, 'quantity': 1}, format='json',
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertWithinQueryBudget(response)
+
+        item = CartItem.objects.filter(cart_id=cart_id).first()
+        response = client.patch(
+            reverse('cart-items-detail', kwargs={'cart_pk': cart_id, 'pk': item.pk}), {'quantity': 3}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+        response = client.post(reverse('order-list'), {'cart_id': cart_id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), ROWS)
+        self.assertWithinQueryBudget(response)
+
+        order = Order.objects.get(pk=response.data['id'])
+        response = client.patch(
+            reverse('order-detail', kwargs={'pk': order.pk}), {'status': Order.ORDER_STATUS_PAID}, format='json',
+            HTTP_IF_MATCH=f'"{order.version}"',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+
+    @override_settings(QUERY_BUDGETS={'ACTION': 'raise', 'BUDGETS': {'POST cart-list': 0}})
+    def test_writes_over_budget_are_logged_instead_of_raised(self):
+        """Test that an unsafe request over its budget is answered and logged, since its writes are committed."""
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        with self.assertLogs('core.db.instrumentation', 'WARNING') as logs:
+            response = client.post(reverse('cart-list'), {}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Cart.objects.filter(pk=response.data['id']).exists())
+        self.assertIn('(cart-list) is over its query budget', logs.output[0])
+
+
+    async def test_async_views_are_counted(self):
+        """Test that queries the async catalog views run in the ORM's threads are counted under ASGI."""
+        response = await self.async_client.get(reverse('product-list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.query_stats.count, 0)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d;desc="[1-9]\d* queries"$')
+        self.assertWithinQueryBudget(response)
+
+
+    def test_responses_carry_server_timing(self):
+        """Test that responses report the number and duration of their queries."""
+        response = APIClient().get(reverse('product-list'))
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d;desc="\d+ queries"$')
+
+
+    @override_settings(QUERY_BUDGETS={'ACTION': 'raise', 'BUDGETS': {'GET category-list': 0}})
+    def test_requests_over_budget_can_fail(self):
+        """Test that a request over its budget raises when ACTION is 'raise'."""
+        with self.assertRaises(QueryBudgetExceeded):
+            APIClient().get(reverse('category-list'))
+
+
+    @override_settings(QUERY_BUDGETS={'BUDGETS': {'category-list': 0}})
+    def test_requests_over_budget_are_logged(self):
+        """Test that a request over its budget is logged by default and still answered."""
+        with self.assertLogs('core.db.instrumentation', 'WARNING') as logs:
+            response = APIClient().get(reverse('category-list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(category-list) is over its query budget: 1 queries, budget is 0', logs.output[0])
+
+
+
+class QueryStatsTest(TestCase):
+
+    def test_fingerprints_ignore_literals_and_in_lists(self):
+        """Test that queries differing only in their values share a fingerprint."""
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a''b' AND x IN (1, 2, 3)"),
+            fingerprint("SELECT *  FROM t WHERE id = 22 AND name = 'c' AND x IN (%s)"),
+        )
+
+
+    def test_repeated_queries_are_reported(self):
+        """Test that a query run once per row is reported as repeated."""
+        category = Category.objects.create(name="Paper")
+        for number in range(3):
+            Product.objects.create(name=f"Notebook {number}", description="A5", price=2, category=category)
+
+        with record_queries() as stats:
+            for product in Product.objects.all():
+                product.category.name
+
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(list(stats.repeated(2).values()), [3])
+        problems = budget_problems('GET', 'product-list', stats, {'MAX_QUERIES': 10, 'MAX_REPEATS': 2, 'BUDGETS': {}})
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith('ran 3 times: SELECT'))
+
+
+    def test_transaction_statements_are_not_counted(self):
+        """Test that savepoints do not count as queries."""
+        stats = QueryStats()
+        stats(lambda *args: None, 'SAVEPOINT "s1"', None, False, {})
+        stats(lambda *args: None, 'SELECT 1', None, False, {})
+
+        self.assertEqual(stats.count, 1)
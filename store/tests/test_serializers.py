@@ -97,6 +97,9 @@ class ProductSerializerTest(TestCase):
             "stock": 10,
             "image": None,  # Assuming the image is not set
             "created_at": serializer.data["created_at"],  # Auto-generated field
+            "num_of_comments": 0,
+            "rating": None,
+            "rating_histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0},
         }
 
         self.assertEqual(serializer.data, expected_data)
@@ -189,7 +192,8 @@ class CommentSerializerTest(TestCase):
         expected_data = {
             "id": self.comment.id,
             "name": "John Doe",
-            "body": "Great product!"
+            "body": "Great product!",
+            "rating": None,
         }
 
         self.assertEqual(serializer.data, expected_data)
@@ -670,6 +674,7 @@ class OrderSerializerTest(TestCase):
 
         self.order_item1 = OrderItem.objects.create(order=self.order, product=self.product1, quantity=1, price=Decimal("1500.00"))
         self.order_item2 = OrderItem.objects.create(order=self.order, product=self.product2, quantity=2, price=Decimal("800.00"))
+        self.order.update_totals()
 
 
     def test_valid_order_serialization(self):
@@ -680,6 +685,8 @@ class OrderSerializerTest(TestCase):
             "id": self.order.id,
             "status": "p",  # Paid status
             "datetime_created": self.order.datetime_created.astimezone(timezone.utc).isoformat().replace("+00:00", "Z"),  # ✅ Ensures correct datetime format
+            "total_amount": Decimal("3100.00"),
+            "item_count": 2,
             "items": OrderItemSerializer(instance=self.order.items.all(), many=True).data  # ✅ Nested items
         }
 
@@ -700,6 +707,13 @@ class OrderSerializerTest(TestCase):
         self.assertEqual(serializer.data["status"], "p")  # ✅ Ensures correct status representation
 
 
+    def test_order_totals_serialization(self):
+        """Test that the denormalized totals are serialized from the order row."""
+        serializer = OrderSerializer(instance=self.order)
+        self.assertEqual(serializer.data["total_amount"], Decimal("3100.00"))  # 1 x 1500 + 2 x 800
+        self.assertEqual(serializer.data["item_count"], 2)
+
+
     def test_order_datetime_serialization(self):
         """Test that the datetime_created field is serialized correctly."""
         serializer = OrderSerializer(instance=self.order)
@@ -765,6 +779,17 @@ class OrderCreateSerializerTest(TestCase):
         self.assertEqual(str(serializer.errors["cart_id"][0]), "Your cart is empty. Please add some products to it first!")
 
 
+    def test_order_creation_stores_totals(self):
+        """Test that checkout stores the order total and item count on the order."""
+        serializer = OrderCreateSerializer(data={"cart_id": self.cart.id}, context={"user_id": self.user.id})
+        self.assertTrue(serializer.is_valid())
+
+        order = serializer.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("3000.00"))  # ✅ 2 * 1500
+        self.assertEqual(order.item_count, 1)
+
+
     def test_order_creation_removes_cart(self):
         """Test that after an order is created, the cart is deleted."""
         serializer = OrderCreateSerializer(data={"cart_id": self.cart.id}, context={"user_id": self.user.id})
@@ -0,0 +1,151 @@
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.utils.timezone import now
+
+from datetime import timedelta
+from io import StringIO
+import json
+
+from store.models import *
+from store.spam import *
+
+
+
+
+class SpamScorersTest(TestCase):
+
+    def setUp(self):
+        """Create a product to comment on."""
+        category = Category.objects.create(name="Paper")
+        self.product = Product.objects.create(name="Notebook", description="A5", price=4, category=category)
+
+
+    def comment(self, body="Nice notebook", name="reader", ip_address="10.0.0.1"):
+        return Comment.objects.create(product=self.product, name=name, body=body, ip_address=ip_address)
+
+
+    def test_body_hash_is_normalized(self):
+        """Test that comments differing only in case and spacing share a body hash."""
+        self.assertEqual(self.comment("Buy  NOW").body_hash, self.comment("buy now").body_hash)
+
+
+    def test_token_blacklist_scorer(self):
+        """Test that blacklisted tokens raise the score."""
+        scores = TokenBlacklistScorer(tokens=["casino"], hits_for_spam=2)([
+            self.comment("Good paper"),
+            self.comment("casino"),
+            self.comment("casino casino"),
+        ])
+        self.assertEqual(scores, [0.0, 0.5, 1.0])
+
+
+    def test_duplicate_body_scorer(self):
+        """Test that repeated bodies are flagged, but not their first occurrence."""
+        first = self.comment("Visit my shop")
+        second = self.comment("visit my  shop")
+        unique = self.comment("Sturdy and cheap")
+        self.assertEqual(DuplicateBodyScorer()([first, second, unique]), [0.0, 1.0, 0.0])
+        self.assertEqual(DuplicateBodyScorer()([second]), [1.0])
+
+
+    def test_repeats_on_other_products_are_left_for_moderation(self):
+        """Test that a body first posted on another product is scored between the thresholds, not rejected."""
+        pen = Product.objects.create(name="Pen", description="Blue", price=1, category=self.product.category)
+        first = self.comment("Great product")
+        elsewhere = Comment.objects.create(product=pen, name="buyer", body="great  product", ip_address="10.0.0.2")
+
+        config = get_config()
+        [score] = DuplicateBodyScorer()([elsewhere])
+
+        self.assertEqual(DuplicateBodyScorer()([first, elsewhere]), [0.0, 0.5])
+        self.assertTrue(config['APPROVE_BELOW'] <= score <= config['REJECT_ABOVE'])
+        score_pending_comments()
+        self.assertEqual(Comment.objects.get(pk=elsewhere.pk).status, Comment.COMMENT_STATUS_WAITING)
+
+
+    def test_duplicate_body_scorer_skips_unhashed_comments(self):
+        """Test that comments saved before bodies were hashed are not duplicates of each other."""
+        legacy = [self.comment(f"Old comment {number}") for number in range(2)]
+        Comment.objects.filter(pk__in=[comment.pk for comment in legacy]).update(body_hash="")
+        for comment in legacy:
+            comment.refresh_from_db()
+
+        self.assertEqual(DuplicateBodyScorer()(legacy), [0.0, 0.0])
+
+
+    def test_link_count_scorer(self):
+        """Test that the score grows with the number of links."""
+        scores = LinkCountScorer(max_links=2)([
+            self.comment("no links"),
+            self.comment("see https://a.example"),
+            self.comment("http://a.example www.b.example"),
+        ])
+        self.assertEqual(scores, [0.0, 0.5, 1.0])
+
+
+    def test_rate_scorer(self):
+        """Test that IP addresses posting too often are flagged."""
+        flood = [self.comment(f"Comment {number}", name=f"name{number}", ip_address="10.0.0.9") for number in range(4)]
+        calm = self.comment("Only one", name="calm", ip_address="10.0.0.2")
+        scores = RateScorer(limit=2)(flood + [calm])
+        self.assertEqual(scores, [0.0, 0.0, 0.5, 1.0, 0.0])
+
+
+    def test_rate_scorer_counts_the_window_of_each_comment(self):
+        """Test that comments are only counted against the ones posted in the window before them."""
+        comments = [self.comment(f"Comment {number}", ip_address="10.0.0.9") for number in range(6)]
+        start = now() - timedelta(hours=1)
+        for number, comment in enumerate(comments):
+            comment.datetime_created = start + timedelta(minutes=number * 4)
+        Comment.objects.bulk_update(comments, ["datetime_created"])
+
+        # Each comment sees itself and the ones up to 10 minutes before it, never the later ones.
+        scores = RateScorer(limit=2, window=timedelta(minutes=10))(comments)
+        self.assertEqual(scores, [0.0, 0.0, 0.5, 0.5, 0.5, 0.5])
+        self.assertEqual(RateScorer(limit=2, window=timedelta(minutes=10))(comments[:1]), [0.0])
+
+
+
+@override_settings(COMMENT_SPAM={
+    'SCORERS': [('store.spam.TokenBlacklistScorer', {'tokens': ['casino'], 'hits_for_spam': 1})],
+    'APPROVE_BELOW': 0.2,
+    'REJECT_ABOVE': 0.8,
+    'BATCH_SIZE': 2,
+})
+class ScorePendingCommentsTest(TestCase):
+
+    def setUp(self):
+        """Create clean, spammy and already moderated comments."""
+        category = Category.objects.create(name="Paper")
+        self.product = Product.objects.create(name="Notebook", description="A5", price=4, category=category)
+        self.clean = Comment.objects.create(product=self.product, name="reader", body="Nice paper")
+        self.spam = Comment.objects.create(product=self.product, name="bot", body="Best casino")
+        self.other_clean = Comment.objects.create(product=self.product, name="writer", body="Good ink")
+
+
+    def test_pending_comments_are_scored_and_moderated_in_batches(self):
+        """Test that clean comments are approved and spam is rejected."""
+        totals = score_pending_comments()
+
+        self.assertEqual(totals, {'scored': 3, 'approved': 2, 'rejected': 1})
+        self.assertEqual(Comment.objects.get(pk=self.clean.pk).status, Comment.COMMENT_STATUS_APPROVED)
+        self.assertEqual(Comment.objects.get(pk=self.spam.pk).status, Comment.COMMENT_STATUS_NOT_APPROVED)
+        self.assertEqual(Comment.objects.get(pk=self.spam.pk).spam_score, 1.0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.approved_comments_count, 2)
+
+
+    def test_scored_comments_are_not_rescored(self):
+        """Test that a second run finds nothing to score."""
+        score_pending_comments()
+        self.assertEqual(score_pending_comments(), {})
+
+
+    def test_benchmark_command(self):
+        """Test that the benchmark reports throughput and leaves no data behind."""
+        out = StringIO()
+        call_command('benchmark_spam_scoring', '--comments', '50', '--batch-size', '20', stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['scored'], 53)  # Includes the three comments from setUp
+        self.assertEqual(Comment.objects.count(), 3)
@@ -9,13 +9,13 @@ class URLPatternsTest(SimpleTestCase):
     def test_category_list_url(self):
         """Test that the category list URL is correctly mapped."""
         url = reverse('category-list')
-        self.assertEqual(resolve(url).func.cls, CategoryViewSet)
+        self.assertEqual(resolve(url).func.view_class.viewset, CategoryViewSet)
 
 
     def test_product_list_url(self):
         """Test that the product list URL is correctly mapped."""
         url = reverse('product-list')
-        self.assertEqual(resolve(url).func.cls, ProductViewSet)
+        self.assertEqual(resolve(url).func.view_class.viewset, ProductViewSet)
 
 
     def test_customer_list_url(self):
@@ -52,3 +52,9 @@ class URLPatternsTest(SimpleTestCase):
         """Test that the nested product comments URL is correctly mapped."""
         url = reverse('product-comments-list', kwargs={'product_pk': 1})
         self.assertEqual(resolve(url).func.cls, CommentViewSet)
+
+
+    def test_analytics_list_url(self):
+        """Test that the sales analytics URL is correctly mapped."""
+        url = reverse('analytics-list')
+        self.assertEqual(resolve(url).func.cls, SalesAnalyticsViewSet)
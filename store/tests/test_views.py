@@ -53,7 +53,7 @@ class ProductViewSetTest(APITestCase):
     def test_list_products(self):
         response = self.client.get(self.product_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['count'], 1)  # Pagination response
+        self.assertEqual(response.json()['count'], 1)  # Pagination response
     
     
     def test_retrieve_product(self):
@@ -157,6 +157,26 @@ class ProductViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+    def test_retrieve_product_sets_etag(self):
+        """Test that the product version is exposed as the ETag."""
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response["ETag"], '"1"')
+
+
+    def test_update_product_with_stale_if_match(self):
+        """Test that an update based on an old version is rejected with 409."""
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.patch(self.product_detail_url, {"price": 10}, format="json", HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["ETag"], '"2"')
+
+        response = self.client.patch(self.product_detail_url, {"price": 20}, format="json", HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 10)
+
+
     def test_search_products_by_name(self):
         """✅ Search products by name."""
         response = self.client.get(f"{self.product_list_url}?search=Test")
@@ -188,14 +208,14 @@ class CategoryViewSetTest(APITestCase):
         """✅ Test retrieving the list of categories."""
         response = self.client.get(self.category_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 2)
+        self.assertGreaterEqual(len(response.json()), 2)
 
 
     def test_retrieve_category(self):
         """✅ Test retrieving a single category."""
         response = self.client.get(self.category_detail_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['name'], self.category1.name)
+        self.assertEqual(response.json()['name'], self.category1.name)
 
 
     def test_admin_can_create_category(self):
@@ -282,7 +302,8 @@ class CommentViewSetTest(APITestCase):
 
         # Create comments
         self.comment = Comment.objects.create(
-            product=self.product, name=self.regular_user, body="Great product!"
+            product=self.product, name=self.regular_user, body="Great product!",
+            status=Comment.COMMENT_STATUS_APPROVED
         )
 
         # Set URLs
@@ -297,8 +318,39 @@ class CommentViewSetTest(APITestCase):
         response = self.client.get(self.comment_list_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)  # Only one comment exists
-        self.assertEqual(response.data[0]['body'], "Great product!")  # Check content
+        self.assertEqual(len(response.data['results']), 1)  # Only one comment exists
+        self.assertEqual(response.data['results'][0]['body'], "Great product!")  # Check content
+
+
+    def test_list_comments_hides_unapproved_comments(self):
+        """Test that waiting comments are only listed for staff asking for them"""
+        Comment.objects.create(product=self.product, name="spammer", body="Buy now!")
+
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.get(self.comment_list_url, {'status': Comment.COMMENT_STATUS_WAITING})
+        self.assertEqual([comment['body'] for comment in response.data['results']], ["Great product!"])
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(self.comment_list_url, {'status': Comment.COMMENT_STATUS_WAITING})
+        self.assertEqual([comment['body'] for comment in response.data['results']], ["Buy now!"])
+
+
+    def test_list_comments_is_cursor_paginated(self):
+        """Test that comments are listed newest first in keyset pages"""
+        for number in range(25):
+            Comment.objects.create(
+                product=self.product, name="reader", body=f"Comment {number}",
+                status=Comment.COMMENT_STATUS_APPROVED
+            )
+        self.client.force_authenticate(user=self.regular_user)
+
+        first_page = self.client.get(self.comment_list_url)
+        self.assertEqual(len(first_page.data['results']), 20)
+        self.assertEqual(first_page.data['results'][0]['body'], "Comment 24")
+
+        second_page = self.client.get(first_page.data['next'])
+        self.assertEqual(len(second_page.data['results']), 6)
+        self.assertIsNone(second_page.data['next'])
 
 
     def test_create_comment_authenticated_user(self):
@@ -317,6 +369,18 @@ class CommentViewSetTest(APITestCase):
         self.assertEqual(Comment.objects.count(), 2)  # Should have 2 comments now
 
 
+    def test_created_comment_waits_for_spam_scoring(self):
+        """Test that a new comment is stored unscored with the poster's IP address"""
+        self.client.force_authenticate(user=self.regular_user)
+
+        response = self.client.post(self.comment_list_url, {"name": "Reader", "body": "Nice"}, REMOTE_ADDR="10.1.2.3")
+
+        comment = Comment.objects.get(pk=response.data["id"])
+        self.assertEqual(comment.status, Comment.COMMENT_STATUS_WAITING)
+        self.assertEqual(comment.ip_address, "10.1.2.3")
+        self.assertIsNone(comment.spam_score)
+
+
     def test_create_comment_unauthenticated_user(self):
         """Test that an unauthenticated user cannot create a comment"""
         response = self.client.post(self.comment_list_url, {"body": "Not logged in!"})
@@ -678,6 +742,22 @@ class OrderViewSetTest(APITestCase):
         self.assertGreaterEqual(len(response.data), 1)  # Admin can see all orders
 
 
+    def test_filter_and_order_orders_by_total_amount(self):
+        """Test that orders can be filtered and sorted by the stored total amount."""
+        self.order.update_totals()  # 2 x 50
+        big_order = Order.objects.create(customer=self.customer)
+        OrderItem.objects.create(order=big_order, product=self.product, quantity=5)
+        big_order.update_totals()  # 5 x 50
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.order_list_url, {"total_amount__gte": 200})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order["id"] for order in response.data], [big_order.id])
+
+        response = self.client.get(self.order_list_url, {"ordering": "-total_amount"})
+        self.assertEqual([order["id"] for order in response.data], [big_order.id, self.order.id])
+
+
     def test_update_order_admin_only(self):
         """Test that only an admin can update an order."""
         self.client.force_authenticate(user=self.user)
@@ -694,6 +774,19 @@ class OrderViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+    def test_update_order_with_stale_if_match(self):
+        """Test that a status change based on an old order version is rejected with 409."""
+        self.client.force_authenticate(user=self.admin_user)
+        etag = self.client.get(self.order_detail_url)["ETag"]
+        Order.objects.filter(pk=self.order.pk).update(version=5)  # Changed by someone else
+
+        response = self.client.patch(self.order_detail_url, {"status": "c"}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.ORDER_STATUS_UNPAID)
+
+
     def test_delete_order_admin_only(self):
         """Test that only an admin can delete an order."""
         self.client.force_authenticate(user=self.user)
@@ -1,6 +1,6 @@
 from rest_framework_nested import routers
 
-from django.urls import path
+from django.urls import path, re_path
 
 from . import views
 
@@ -13,6 +13,9 @@ router.register(r'pages', views.PageContentViewSet, basename='pagecontent')
 router.register(r'carts', views.CartViewSet, basename='cart')
 router.register(r'orders', views.OrderViewSet, basename='order')
 router.register(r'team', views.TeamMemberViewSet, basename='teammember')
+router.register(r'analytics', views.SalesAnalyticsViewSet, basename='analytics')
+router.register(r'campaigns', views.CampaignViewSet, basename='campaign')
+router.register(r'moderation/comments', views.CommentModerationViewSet, basename='comment-moderation')
 
 
 product_router = routers.NestedDefaultRouter(router, r'categories', lookup='category')
@@ -25,7 +28,22 @@ products_router = routers.NestedDefaultRouter(router, 'products', lookup='produc
 products_router.register('comments', views.CommentViewSet, basename='product-comments')
 
 
-urlpatterns = router.urls + products_router.urls + cart_items_router.urls + product_router.urls + [
+# GET and HEAD on the catalog are answered by async views, which hand the
+# other methods to the viewsets registered above; see store/catalog.py.
+catalog_urls = []
+for prefix, list_view, detail_view in [
+    ('products', views.ProductCatalogView, views.ProductDetailCatalogView),
+    ('categories', views.CategoryCatalogView, views.CategoryDetailCatalogView),
+    ('pages', views.PageContentCatalogView, views.PageContentDetailCatalogView),
+    ('team', views.TeamMemberCatalogView, views.TeamMemberDetailCatalogView),
+]:
+    catalog_urls += [
+        re_path(rf'^{prefix}/$', list_view.as_view(), name=f'{list_view.basename}-list'),
+        re_path(rf'^{prefix}/(?P<pk>[^/.]+)/$', detail_view.as_view(), name=f'{detail_view.basename}-detail'),
+    ]
+
+
+urlpatterns = catalog_urls + router.urls + products_router.urls + cart_items_router.urls + product_router.urls + [
     path('about/', views.AboutView.as_view(), name='about'),
     path('terms/', views.TermsView.as_view(), name='terms'),
 ]
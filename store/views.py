@@ -3,29 +3,46 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.viewsets import GenericViewSet
-from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
+from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser, IsAuthenticated
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.exceptions import ValidationError
 
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from django.views.generic import TemplateView
 
-from .models import Category, Product, PageContent, TeamMember, Customer
-from .paginations import DefaultPagination
+from . import analytics
+from .catalog import CatalogView
+from .concurrency import VersionETagMixin, version_etag
+from .emails import queue_email
+from .fast_serializers import (
+    CartItemValuesSerializer, OrderForAdminValuesSerializer, OrderValuesSerializer, ProductValuesSerializer,
+    ValuesListMixin,
+)
+from .identity import get_customer, get_customer_id
+from .models import Category, Product, PageContent, TeamMember, Customer, SalesRollup
+from .moderation import moderate_comments
+from .paginations import (
+    CommentCursorPagination, DefaultPagination, MergedCursorPagination, ModerationQueuePagination,
+)
 from .serializers import *
+from .orders import change_orders_status
+from .provisioning import queue_provisioning
 from .permissions import IsAdminOrReadOnly, SendPrivateEmailToCustomerPermission
 from .signals import order_created
 
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(VersionETagMixin, ValuesListMixin, ModelViewSet):
     serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer
     filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
     permission_classes = [IsAdminOrReadOnly]
-    ordering_fields = ['name', 'price', 'stock']
+    ordering_fields = ['name', 'price', 'stock', 'rating']
     search_fields = ['name']
     pagination_class = DefaultPagination
     queryset = Product.objects.select_related("category")
@@ -47,7 +64,7 @@ class ProductViewSet(ModelViewSet):
 
 class CategoryViewSet(ModelViewSet):
     serializer_class = CategorySerializer
-    queryset = Category.objects.prefetch_related('products').all()
+    queryset = Category.objects.annotate(num_of_products=Count('products'))
     permission_classes = [IsAdminOrReadOnly]
     
 
@@ -80,13 +97,26 @@ class TeamMemberViewSet(ModelViewSet):
 class CommentViewSet(ModelViewSet):
     serializer_class = CommentSerializer    
     permission_classes = [IsAuthenticated]
+    pagination_class = CommentCursorPagination
     
     def get_queryset(self):
         product_pk = self.kwargs['product_pk']
-        return Comment.objects.filter(product_id=product_pk)
+        queryset = Comment.objects.filter(product_id=product_pk)
+
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        # Only staff can look at comments that are waiting or not approved.
+        comment_status = Comment.COMMENT_STATUS_APPROVED
+        if self.request.user.is_staff:
+            comment_status = self.request.query_params.get('status', comment_status)
+        return queryset.filter(status=comment_status)
 
     def get_serializer_context(self):
-        return {'product_pk': self.kwargs['product_pk']}
+        return {
+            'product_pk': self.kwargs['product_pk'],
+            'ip_address': self.request.META.get('REMOTE_ADDR'),
+        }
     
     def destroy(self, request, *args, **kwargs):
         product_pk = kwargs.get('product_pk')  # Get product ID from URL
@@ -106,6 +136,25 @@ class CommentViewSet(ModelViewSet):
 
 
 
+class CommentModerationViewSet(ListModelMixin, GenericViewSet):
+    """Waiting comments of all products, oldest first, for staff to approve or reject in bulk."""
+    serializer_class = ModerationCommentSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = ModerationQueuePagination
+    queryset = Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING)
+
+    @action(detail=False, methods=['POST'])
+    def decide(self, request):
+        serializer = CommentDecisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = moderate_comments(
+            approve=serializer.validated_data['approve'],
+            reject=serializer.validated_data['reject'],
+            )
+        return Response(result)
+
+
+
 class CustomerViewSet(ModelViewSet):
     serializer_class = CustomerSerializer
     queryset = Customer.objects.all()
@@ -114,8 +163,7 @@ class CustomerViewSet(ModelViewSet):
     
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        user_id = request.user.id
-        customer = Customer.objects.get(user_id=user_id)
+        customer = get_customer(request)
         if request.method == 'GET':
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
@@ -125,13 +173,35 @@ class CustomerViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data)
         
-    @action(detail=True, permission_classes=[SendPrivateEmailToCustomerPermission])    
+    @action(detail=False, methods=['POST'])
+    def provision(self, request):
+        # Only the hashing runs here, so that no password is stored; run_provisioning_jobs creates the users.
+        serializer = CustomerProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = queue_provisioning(serializer.validated_data['customers'], created_by=request.user)
+        return Response(ProvisioningJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['GET'], url_path=r'provision/(?P<job_id>\d+)', url_name='provision-job')
+    def provision_job(self, request, job_id):
+        job = get_object_or_404(ProvisioningJob, pk=job_id)
+        return Response(ProvisioningJobSerializer(job).data)
+        
+    @action(detail=True, methods=['POST'], permission_classes=[SendPrivateEmailToCustomerPermission])    
     def send_private_email(self, request, pk):
-        return Response(f'Sending email to customer id={pk=}')
+        customer = get_object_or_404(Customer.objects.select_related('user'), pk=pk)
+        serializer = PrivateEmailSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queued_email = queue_email(
+            subject=serializer.validated_data['subject'],
+            body=serializer.validated_data['body'],
+            to=[customer.user.email],
+            )
+        return Response({'queued_email_id': queued_email.id}, status=status.HTTP_202_ACCEPTED)
     
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(ValuesListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
+    values_serializer_class = CartItemValuesSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -161,12 +231,19 @@ class CartViewSet(CreateModelMixin,
     
 
     
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(VersionETagMixin, ValuesListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'options', 'head']
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'status': ['exact'],
+        'total_amount': ['gte', 'lte'],
+        'item_count': ['gte', 'lte'],
+    }
+    ordering_fields = ['datetime_created', 'total_amount', 'item_count']
     # permission_classes = [IsAuthenticated]
     
     def get_permissions(self):
-        if self.request.method in ['PATCH', 'DELETE']:
+        if self.request.method in ['PATCH', 'DELETE'] or self.action == 'bulk_status':
             return [IsAdminUser()]
         return [IsAuthenticated()]
     def get_queryset(self):
@@ -181,7 +258,27 @@ class OrderViewSet(ModelViewSet):
         if user.is_staff:
              return queryset
         
-        return queryset.filter(customer__user_id=user.id)
+        return self.filter_by_customer(queryset)
+
+    def get_archived_queryset(self):
+        queryset = ArchivedOrder.objects.prefetch_related(
+            Prefetch(
+                'items',
+                queryset=ArchivedOrderItem.objects.select_related('product')
+                )
+            ).select_related('customer__user').all()
+        user = self.request.user
+
+        if user.is_staff:
+            return queryset
+
+        return self.filter_by_customer(queryset)
+
+    def filter_by_customer(self, queryset):
+        return queryset.filter(customer_id=get_customer_id(self.request))
+
+    def include_archived(self):
+        return self.request.query_params.get('include_archived', '').lower() in ['1', 'true', 'yes']
          
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -193,26 +290,218 @@ class OrderViewSet(ModelViewSet):
         if self.request.user.is_staff:
             return OrderForAdminSerializer
         return OrderSerializer     
+
+    def get_values_serializer_class(self):
+        if self.request.user.is_staff:
+            return OrderForAdminValuesSerializer
+        return OrderValuesSerializer
+
+    def get_archived_serializer_class(self):
+        if self.request.user.is_staff:
+            return ArchivedOrderForAdminSerializer
+        return ArchivedOrderSerializer
+
+    def get_merged_ordering(self):
+        # Both tables are read in this order and merged, so only their common columns will do.
+        param = self.request.query_params.get(OrderingFilter.ordering_param)
+        if not param:
+            return ['-datetime_created']
+        ordering = [term.strip() for term in param.split(',') if term.strip()]
+        invalid = [term for term in ordering if term.lstrip('-') not in self.ordering_fields]
+        if invalid:
+            raise ValidationError({
+                'ordering': f"Orders with archived ones can only be sorted on {', '.join(self.ordering_fields)}."
+            })
+        return ordering
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        paginator = MergedCursorPagination()
+        # Archived orders have their own primary keys, so ties are broken on the order ids the API shows.
+        page = paginator.paginate_querysets(
+            [
+                self.filter_queryset(self.get_queryset()).annotate(order_id=F('id')),
+                self.filter_queryset(self.get_archived_queryset()).annotate(order_id=F('original_id')),
+            ],
+            request,
+            self.get_merged_ordering(),
+            tiebreaker='order_id',
+            )
+        context = self.get_serializer_context()
+        serializer_classes = {Order: self.get_serializer_class(), ArchivedOrder: self.get_archived_serializer_class()}
+        data = [serializer_classes[type(order)](order, context=context).data for order in page]
+        return paginator.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.include_archived() and not self.get_queryset().filter(pk=kwargs['pk']).exists():
+            archived_order = get_object_or_404(self.get_archived_queryset(), original_id=kwargs['pk'])
+            serializer = self.get_archived_serializer_class()(archived_order)
+            return Response(serializer.data)
+        return super().retrieve(request, *args, **kwargs)
     
     
     def get_serializer_context(self):
-        return {'user_id': self.request.user.id}
+        return {
+            'user_id': self.request.user.id,
+            'customer_id': get_customer_id(self.request),
+        }
     
     def create(self, request, *args, **kwargs):
         create_order_serializer = OrderCreateSerializer(
             data=request.data,
-            context={'user_id': self.request.user.id}
+            context=self.get_serializer_context()
             )
         create_order_serializer.is_valid(raise_exception=True)
-        created_order = create_order_serializer.save()
-        
-        order_created.send_robust(self.__class__, order=created_order)
-        
+        # One transaction, so the sales rollups never lag behind the order; see store/analytics.py.
+        with transaction.atomic():
+            created_order = create_order_serializer.save()
+            analytics.record_orders_created([created_order])
+            order_created.send_robust(self.__class__, order=created_order)
+
+        prefetch_related_objects([created_order], Prefetch('items', queryset=OrderItem.objects.select_related('product')))
         serializer = OrderSerializer(created_order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            analytics.record_orders_deleted([instance])
+            instance.delete()
+
+    @action(detail=False, methods=['POST'])
+    def bulk_status(self, request):
+        serializer = OrderBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = change_orders_status(
+            serializer.validated_data['order_ids'],
+            serializer.validated_data['status'],
+            )
+        return Response(result)
     
     
 
+class CampaignViewSet(ModelViewSet):
+    """
+    Marketing email campaigns. Campaigns are sent by ``manage.py send_campaigns``
+    after they are started.
+    """
+    http_method_names = ['get', 'post', 'patch', 'delete', 'options', 'head']
+    serializer_class = CampaignSerializer
+    permission_classes = [SendPrivateEmailToCustomerPermission]
+    queryset = Campaign.objects.select_related('category').order_by('-id')
+
+    def perform_create(self, serializer):
+        serializer.save(created_by_id=self.request.user.id)
+
+    def perform_destroy(self, instance):
+        if instance.status != Campaign.STATUS_DRAFT:
+            raise ValidationError('Only draft campaigns can be deleted.')
+        instance.delete()
+
+    @action(detail=True, methods=['POST'])
+    def start(self, request, pk):
+        updated = Campaign.objects.filter(pk=pk, status=Campaign.STATUS_DRAFT).update(status=Campaign.STATUS_QUEUED)
+        campaign = self.get_object()
+        if not updated:
+            return Response({'detail': 'Only draft campaigns can be started.'}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(campaign).data, status=status.HTTP_202_ACCEPTED)
+
+
+
+class SalesAnalyticsViewSet(ListModelMixin, GenericViewSet):
+    """
+    Revenue per day, week or month read from the sales rollups.
+
+    ``?period=d|w|m`` picks the bucket size (day by default) and
+    ``?dimension=all|category|customer`` the breakdown (all sales by default).
+    """
+    serializer_class = SalesRollupSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'dimension_id': ['exact'],
+        'period_start': ['gte', 'lte'],
+    }
+    pagination_class = DefaultPagination
+
+    def get_queryset(self):
+        period = self.request.query_params.get('period', SalesRollup.PERIOD_DAY)
+        dimension = self.request.query_params.get('dimension', SalesRollup.DIMENSION_ALL)
+        return SalesRollup.objects \
+                .filter(period=period, dimension=dimension) \
+                .order_by('dimension_id', 'period_start')
+
+
+
+class ProductCatalogView(CatalogView):
+    viewset = ProductViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    basename = 'product'
+    serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer
+    search_fields = ProductViewSet.search_fields
+    ordering_fields = ProductViewSet.ordering_fields
+    pagination_class = ProductViewSet.pagination_class
+
+    def get_queryset(self):
+        return Product.objects.select_related('category')
+
+
+class ProductDetailCatalogView(ProductCatalogView):
+    actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    detail = True
+
+    def get_headers(self, product):
+        return {'ETag': version_etag(product)}
+
+
+class CategoryCatalogView(CatalogView):
+    viewset = CategoryViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    basename = 'category'
+    serializer_class = CategorySerializer
+
+    def get_queryset(self):
+        return Category.objects.annotate(num_of_products=Count('products'))
+
+
+class CategoryDetailCatalogView(CategoryCatalogView):
+    actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    detail = True
+
+
+class PageContentCatalogView(CatalogView):
+    viewset = PageContentViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    basename = 'pagecontent'
+    serializer_class = PageContentSerializer
+
+    def get_queryset(self):
+        return PageContent.objects.all()
+
+
+class PageContentDetailCatalogView(PageContentCatalogView):
+    actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    detail = True
+
+
+class TeamMemberCatalogView(CatalogView):
+    viewset = TeamMemberViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    basename = 'teammember'
+    serializer_class = TeamMemberSerializer
+
+    def get_queryset(self):
+        return TeamMember.objects.all()
+
+
+class TeamMemberDetailCatalogView(TeamMemberCatalogView):
+    actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    detail = True
+
+
+
 class AboutView(TemplateView):
     template_name = "store/about.html"
 